@@ -13,6 +13,8 @@ if str(PROJECT_ROOT_APP) not in sys.path:
 
 try:
     from src.utils.model_saver import ModelSaver
+    from src.utils.pooling import AlbumPooler
+    from src.index import SimilarityIndex
     from src.embeddings.clap_embed import CLAPEmbedder
 except ImportError as e:
     st.error(f"Import error: {e}")
@@ -25,12 +27,19 @@ class AppConfig:
         self.MODEL_PATH = self.PROJECT_ROOT / "models" / "catboost_model.cbm"
         self.CLAP_CHECKPOINT_PATH_STR = "models/music_speech_epoch_15_esc_89.25.pt"
         self.CLAP_CHECKPOINT_FULL_PATH_CHECK = self.PROJECT_ROOT / self.CLAP_CHECKPOINT_PATH_STR
+        self.INFERENCE_BACKEND = "auto"
+        self.ALBUM_INDEX_PATH = self.PROJECT_ROOT / "models" / "album_index"
 
 
 class AlbumDataProcessor:
     def __init__(self, config: AppConfig):
         self.config = config
-        self.catboost_model = None
+        self.predictor = None
+        self.manifest = None
+        self.projection = None
+        self.pooler = AlbumPooler()
+        self.similarity_pooler = AlbumPooler()
+        self.album_index = None
 
     def _save_uploaded_files(self, uploaded_files, artist_name, album_name, temp_dir):
         if not artist_name or not album_name:
@@ -62,31 +71,40 @@ class AlbumDataProcessor:
         if not song_data:
             raise ValueError("No song data.")
 
-        audio_embeddings = np.array([d["audio_embedding"] for d in song_data])
-        if audio_embeddings.size == 0:
-            raise ValueError("Empty audio embeddings.")
-        mean_audio = np.mean(audio_embeddings, axis=0)
-
-        text_embeddings = [d.get("text_embedding") for d in song_data if d.get("text_embedding") is not None]
-        if not text_embeddings:
-            mean_text = np.zeros_like(mean_audio)
-        else:
-            mean_text = np.mean(text_embeddings, axis=0)
-
-        return np.concatenate([mean_audio, mean_text]).reshape(1, -1)
+        return self.pooler.pool_albums([song_data])
 
     def _load_model(self):
-        if self.catboost_model is None:
+        if self.predictor is None:
             if not self.config.MODEL_PATH.exists():
                 raise FileNotFoundError(f"Model not found: {self.config.MODEL_PATH}")
-            self.catboost_model = ModelSaver.load(self.config.MODEL_PATH)
-        return self.catboost_model
+            manifest = ModelSaver.load_manifest(self.config.MODEL_PATH)
+            if manifest is not None:
+                manifest.validate(clap_checkpoint=self.config.CLAP_CHECKPOINT_FULL_PATH_CHECK)
+                self.pooler = AlbumPooler.from_dict(manifest["pooling"])
+            self.manifest = manifest
+            self.projection = ModelSaver.load_projection(self.config.MODEL_PATH)
+            self.predictor = ModelSaver.load_predictor(self.config.MODEL_PATH, self.config.INFERENCE_BACKEND)
+        return self.predictor
 
     def predict(self, features: np.ndarray):
-        model = self._load_model()
-        return model.predict(features)[0]
+        predictor = self._load_model()
+        if self.manifest is not None:
+            self.manifest.validate(pooled_dim=features.shape[1])
+        if self.projection is not None:
+            features = self.projection.transform(features)
+        mean, spread = predictor.predict_with_spread(features)
+        return mean[0], None if spread is None else spread[0]
+
+    def similar_albums(self, song_data: list, k=5):
+        if self.album_index is None:
+            if not self.config.ALBUM_INDEX_PATH.exists():
+                return []
+            self.album_index = SimilarityIndex.load(self.config.ALBUM_INDEX_PATH)
+        vector = self.similarity_pooler.pool_albums([song_data])[0]
+        return self.album_index.query(vector, k=k)
 
     def process(self, embedder: CLAPEmbedder, uploaded_files, artist, album):
+        self._load_model()
         with tempfile.TemporaryDirectory(prefix="album_eval_") as temp_dir:
             temp_path = Path(temp_dir)
             paths = self._save_uploaded_files(uploaded_files, artist, album, temp_path)
@@ -100,7 +118,7 @@ class AlbumDataProcessor:
             st.success(f"Generated embeddings for {len(song_data)} songs.")
 
             features = self._prepare_features(song_data)
-            score = self.predict(features)
+            score, spread = self.predict(features)
             summary = {
                 "artist": artist,
                 "album": album,
@@ -108,6 +126,11 @@ class AlbumDataProcessor:
                 "sample": song_data[0],
                 "features_shape": features.shape
             }
+            if spread is not None:
+                summary["ensemble_spread"] = float(spread)
+            similar = self.similar_albums(song_data)
+            if similar:
+                summary["similar_albums"] = similar
             return score, summary
 
 
@@ -139,6 +162,8 @@ class AlbumEvaluatorApp:
         st.sidebar.header("Model Info")
         st.sidebar.info(f"CLAP: `{self.config.CLAP_CHECKPOINT_PATH_STR}`")
         st.sidebar.info(f"CatBoost: `{self.config.MODEL_PATH.name}`")
+        if self.processor.predictor is not None:
+            st.sidebar.info(f"Inference backend: `{self.processor.predictor.backend}`")
 
     def _validate(self, artist, album, files):
         if not artist or not album:
@@ -186,7 +211,12 @@ class AlbumEvaluatorApp:
                         score, summary = self.processor.process(self.clap_embedder, files, artist, album)
                         with col2:
                             st.subheader("📈 Score")
-                            st.metric(f"{album} by {artist}", f"{score:.2f}")
+                            spread = summary.get("ensemble_spread")
+                            st.metric(f"{album} by {artist}", f"{score:.2f}",
+                                      help=None if spread is None else f"± {spread:.2f} across ensemble members")
+                            if summary.get("similar_albums"):
+                                st.subheader("Similar reviewed albums")
+                                st.dataframe(pd.DataFrame(summary["similar_albums"]), hide_index=True)
                             with st.expander("Details"):
                                 st.json(summary)
                         st.success("Done!")
@@ -0,0 +1,131 @@
+import argparse
+import re
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DATA_TOOLS = PROJECT_ROOT / "data_tools"
+# Captured pages live here (git-ignored): the benchmark only means something on live markup.
+CAPTURED = Path(__file__).resolve().parent / "pages"
+CAPTURE_EXAMPLES = {
+    "genius": "https://genius.com/albums/Radiohead/Ok-computer",
+    "metacritic": '"https://www.metacritic.com/browse/albums/score/metascore/all/filtered?sort=desc&page=0"',
+}
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0 Safari/537.36"
+if str(DATA_TOOLS) not in sys.path:
+    sys.path.append(str(DATA_TOOLS))
+
+from html_extract import EXTRACTORS, ParserPool, available_backends
+
+
+def synthetic_genius_page(n_songs, filler_rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    filler = "".join(f'<div class="sidebar_item"><a href="/x/{i}">Link {i}</a><p>{"lorem ipsum " * 8}</p></div>'
+                     for i in range(filler_rows))
+    songs = "".join(
+        f'<div class="chart_row chart_row--light_border"><div class="chart_row-content">'
+        f'<a href="/song-{i}"><h3 class="chart_row-content-title">Song {i} {rng.integers(1e6)} '
+        f'<span class="chart_row-content-title-subtitle">Lyrics</span></h3></a></div></div>'
+        for i in range(n_songs))
+    return f"<html><body>{filler}<div id='defer-section-1'>{songs}</div>{filler}</body></html>"
+
+
+def synthetic_metacritic_page(n_rows, filler_rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    filler = "".join(f'<div class="promo"><a href="/p/{i}">Promo {i}</a><p>{"lorem ipsum " * 8}</p></div>'
+                     for i in range(filler_rows))
+    rows = "".join(
+        f'<tr><td class="clamp-image-wrap"><img src="/i/{i}.jpg"></td><td class="clamp-summary-wrap">'
+        f'<a class="title" href="/music/{i}"><h3>Album {i}</h3></a><div class="artist"> by Artist {i % 37}</div>'
+        f'<div class="clamp-score-wrap"><div class="metascore_w large">{rng.integers(40, 100)}</div></div></td></tr>'
+        for i in range(n_rows))
+    pages = "".join(f'<a href="?page={p}">{p + 1}</a>' for p in range(18))
+    return f"<html><body>{filler}<table class='clamp-list'>{rows}</table><div class='pages'>{pages}</div></body></html>"
+
+
+def load_pages(pages_dir, kind, n_pages, synthetic=False):
+    """Saved pages from `pages_dir` (default: the pages captured for `kind`), or generated ones."""
+    if not synthetic:
+        pages_dir = Path(pages_dir) if pages_dir is not None else CAPTURED / kind
+        pages = [path.read_bytes() for path in sorted(pages_dir.glob("*.html"))]
+        if not pages:
+            raise SystemExit(
+                f"No .html files in {pages_dir}. Capture some live pages first, e.g.\n"
+                f"  python benchmarks/bench_html_extract.py {kind} --capture {CAPTURE_EXAMPLES[kind]}\n"
+                f"or pass --pages DIR with saved pages (--synthetic only times generated markup).")
+        return pages
+    make = synthetic_genius_page if kind == "genius" else synthetic_metacritic_page
+    size = 18 if kind == "genius" else 100
+    return [make(size, seed=i).encode("utf-8") for i in range(n_pages)]
+
+
+def capture(urls, directory):
+    """Saves live pages for the benchmark, named after the last URL path segment (plus query)."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for url in urls:
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            body = response.read()
+        name = re.sub(r'[^\w.-]+', '-', url.split("://", 1)[-1].rstrip("/").split("/", 1)[-1]).strip("-")
+        path = directory / f"{name or 'page'}.html"
+        path.write_bytes(body)
+        print(f"Saved {url} -> {path} ({len(body) / 1024:.0f} KiB)")
+
+
+def time_backend(extractor, pages, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = [extractor(page) for page in pages]
+        timings.append(time.perf_counter() - start)
+    return min(timings) / len(pages) * 1000, results
+
+
+def time_pool(backend, kind, pages, workers):
+    with ParserPool(workers, backend) as pool:
+        list(pool.executor.map(len, pages[:workers]))  # warm the workers up
+        start = time.perf_counter()
+        futures = [pool.submit(kind, page) for page in pages]
+        for future in futures:
+            future.result()
+        return len(pages) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-page parse time of the HTML extraction backends.")
+    parser.add_argument("kind", choices=tuple(EXTRACTORS))
+    parser.add_argument("--pages", type=Path, default=None,
+                        help="Directory of saved .html pages (default: benchmarks/pages/<kind>, filled by --capture).")
+    parser.add_argument("--synthetic", action="store_true", help="Benchmark generated pages instead of saved ones.")
+    parser.add_argument("--n-pages", type=int, default=50, help="Number of generated pages with --synthetic.")
+    parser.add_argument("--capture", nargs="+", metavar="URL", default=None,
+                        help="Save these live pages into the --pages directory and exit.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.capture:
+        capture(args.capture, args.pages or CAPTURED / args.kind)
+        return
+
+    pages = load_pages(args.pages, args.kind, args.n_pages, args.synthetic)
+    backends = available_backends()
+    print(f"{len(pages)} {args.kind} pages, {sum(map(len, pages)) / len(pages) / 1024:.0f} KiB average")
+    print(f"{'backend':>11} {'ms/page':>9} {'speedup':>8} {'same_as_ref':>12} {'pool pages/s':>13}")
+
+    baseline, reference = None, None
+    for backend in backends:
+        ms, results = time_backend(EXTRACTORS[args.kind][backend], pages, args.repeats)
+        if backend == "reference":
+            baseline, reference = ms, results
+        same = sum(r == ref for r, ref in zip(results, reference))
+        pool_rate = time_pool(backend, args.kind, pages, args.workers)
+        print(f"{backend:>11} {ms:>9.2f} {baseline / ms:>7.1f}x {f'{same}/{len(pages)}':>12} {pool_rate:>13,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from catboost import CatBoostRegressor, sum_models
+
+from src.utils import ModelSaver, ModelManifest
+from src.utils.inference import load_predictor, onnxruntime
+
+
+def train_synthetic_model(dim, iterations, depth, seed=0):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, dim))
+    y = X[:, :8] @ rng.normal(size=8) + rng.normal(scale=0.5, size=2000)
+    rows = np.random.default_rng(seed).choice(len(X), size=len(X) * 4 // 5, replace=False)
+    model = CatBoostRegressor(iterations=iterations, depth=depth, verbose=0, random_seed=seed)
+    model.fit(X[rows], y[rows])
+    return model
+
+
+def latency_ms(predictor, X, repeats):
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        row = X[i % len(X)].reshape(1, -1)
+        start = time.perf_counter()
+        predictor.predict(row)
+        timings[i] = (time.perf_counter() - start) * 1000
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def throughput(predictor, X, batch_size, min_seconds=1.0):
+    batch = X[:batch_size]
+    rows, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        predictor.predict(batch)
+        rows += len(batch)
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p99 single-row latency and batch throughput per backend.")
+    parser.add_argument("--model", type=Path, default=None,
+                        help="Saved catboost_model.cbm to benchmark; a synthetic model is trained when omitted.")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[64, 1024, 8192])
+    parser.add_argument("--ensemble", type=int, default=0,
+                        help="Benchmark a K-model ensemble (synthetic models only).")
+    args = parser.parse_args()
+
+    backends = ["catboost", "numpy"] + (["onnx"] if onnxruntime is not None else [])
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        members = None
+        if args.model is not None:
+            model = ModelSaver.load(args.model)
+            dim = model.n_features_in_
+        else:
+            dim = args.dim
+            if args.ensemble > 1:
+                members = [train_synthetic_model(dim, args.iterations, args.depth, seed)
+                           for seed in range(args.ensemble)]
+                model = sum_models(members, weights=[1.0 / len(members)] * len(members))
+            else:
+                model = train_synthetic_model(dim, args.iterations, args.depth)
+
+        saver = ModelSaver(model, Path(temp_dir) / "dp.json", members=members)
+        manifest = ModelManifest.build(feature_dim=dim, pooling={})
+        saver.save(manifest=manifest, backends=[b for b in backends if b != "catboost"])
+
+        X = np.random.default_rng(1).normal(size=(max(args.batch_sizes), dim))
+        reference = load_predictor(saver.save_path, manifest.data, "catboost").predict(X[:1000])
+
+        print(f"Model: {model.tree_count_} trees, {dim} features, {len(members or [model])} member(s)")
+        header = f"{'backend':>9} {'p50_ms':>8} {'p99_ms':>8} {'max_err':>9}"
+        header += "".join(f" {f'rows/s@{b}':>14}" for b in args.batch_sizes)
+        print(header)
+        for backend in backends:
+            predictor = load_predictor(saver.save_path, manifest.data, backend)
+            max_err = np.abs(predictor.predict(X[:1000]) - reference).max()
+            p50, p99 = latency_ms(predictor, X, args.repeats)
+            line = f"{backend:>9} {p50:>8.3f} {p99:>8.3f} {max_err:>9.2e}"
+            line += "".join(f" {throughput(predictor, X, b):>14,.0f}" for b in args.batch_sizes)
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
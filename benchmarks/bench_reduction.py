@@ -0,0 +1,82 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from catboost import CatBoostRegressor
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import train_test_split
+
+from src.regression.model_fitting import DataLoader, FeatureExtractor, DimensionReducer
+from src.utils import AlbumPooler
+
+
+def synthetic_features(n_albums=2000, dim=1024, latent_dim=24, seed=0):
+    """Low-rank features plus noise, roughly shaped like pooled CLAP vectors."""
+    rng = np.random.default_rng(seed)
+    latent = rng.normal(size=(n_albums, latent_dim))
+    X = latent @ rng.normal(size=(latent_dim, dim)) / np.sqrt(latent_dim) + 0.3 * rng.normal(size=(n_albums, dim))
+    y = 70 + 8 * np.tanh(latent[:, :4] @ rng.normal(size=4)) + rng.normal(scale=2.0, size=n_albums)
+    return X, y
+
+
+def single_row_latency_ms(model, projection, X, repeats=200):
+    timings = []
+    for i in range(repeats):
+        row = X[i % len(X)].reshape(1, -1)
+        start = time.perf_counter()
+        if projection is not None:
+            row = projection.transform(row)
+        model.predict(row)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def run(X, y, methods, dims, iterations):
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=0)
+    print(f"{'method':>8} {'dim':>6} {'fit_s':>8} {'p50_ms':>8} {'rmse':>8}")
+
+    configs = [(None, X.shape[1])] + [(m, d) for m in methods for d in dims if d < X.shape[1]]
+    for method, dim in configs:
+        start = time.perf_counter()
+        projection = None
+        Xtr, Xte = X_train, X_test
+        if method is not None:
+            projection = DimensionReducer(method, dim).fit(X_train, y_train)
+            Xtr, Xte = projection.transform(X_train), projection.transform(X_test)
+        model = CatBoostRegressor(iterations=iterations, depth=6, verbose=0, random_seed=42)
+        model.fit(Xtr, y_train)
+        fit_s = time.perf_counter() - start
+
+        latency = single_row_latency_ms(model, projection, X_test)
+        rmse = np.sqrt(mean_squared_error(y_test, model.predict(Xte)))
+        print(f"{method or 'raw':>8} {dim:>6} {fit_s:>8.2f} {latency:>8.3f} {rmse:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit time, predict latency and RMSE against reduced dimension.")
+    parser.add_argument("--data", type=Path, default=None,
+                        help="Merged dp.json to benchmark on; synthetic features are used when omitted.")
+    parser.add_argument("--text", action="store_true", help="Include the text embedding block (1024-dim).")
+    parser.add_argument("--methods", nargs="+", default=list(DimensionReducer.METHODS))
+    parser.add_argument("--dims", nargs="+", type=int, default=[16, 32, 64, 128, 256])
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.data is not None:
+        df = DataLoader(args.data).load_data()
+        X, y = FeatureExtractor(AlbumPooler(include_text=args.text)).extract_features(df)
+    else:
+        X, y = synthetic_features(dim=1024 if args.text else 512)
+    print(f"Benchmarking on {X.shape[0]} albums x {X.shape[1]} features")
+    run(X, y, args.methods, args.dims, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
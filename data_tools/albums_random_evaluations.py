@@ -1,52 +1,137 @@
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import asyncio
 import random
-import time
 import csv
+from pathlib import Path
+
+from html_extract import ParserPool, metacritic_last_page
+from http_utils import CachedFetcher
+
+GENRE_URLS = {
+    "rap": "https://www.metacritic.com/browse/albums/genre/date/rap",
+    "pop": "https://www.metacritic.com/browse/albums/genre/date/pop?view=detailed",
+}
+
+
+def page_url(base_url, page):
+    separator = '&' if '?' in base_url else '?'
+    return f"{base_url}{separator}page={page}"
+
+
+# Answers that settle a page: 200 (rows or none) and "no such page". Anything else is retried.
+DEFINITIVE_STATUSES = (200, 404, 410)
+
+
+async def scrape_album_data(fetcher, parser_pool, url):
+    """
+    Scrapes album data from a single page; returns (list of (album, artist, score) tuples,
+    last page index, HTTP status). The status is None for a network error.
+    """
+    status, body = await fetcher.fetch(url)
+    if status != 200:
+        print(f"Error fetching page {url}: HTTP {status}")
+        return [], None, status
+    album_data = await parser_pool.extract("metacritic", body)
+    return album_data, metacritic_last_page(body), status
+
+
+async def scrape_multiple_pages(fetcher, parser_pool, base_url, on_page, max_pages=None, retries=2,
+                                retry_delay=2.0):
+    """
+    Scrapes every page of a genre listing.
+
+    Page 0 is fetched first to read the pagination links; the remaining pages
+    are then requested concurrently. When a page has no pagination, pages are
+    probed in growing batches until one comes back 200 with no rows (or 404).
+    A page that fails (other status or network error) is retried `retries`
+    times with backoff and reported if it still fails, but never taken for the
+    end of the listing. `on_page(url, rows)` is called as each page arrives.
+    """
+    failed = []
+
+    async def scrape(page):
+        url = page_url(base_url, page)
+        for attempt in range(retries + 1):
+            rows, last_page, status = await scrape_album_data(fetcher, parser_pool, url)
+            if status in DEFINITIVE_STATUSES:
+                break
+            if attempt < retries:
+                await asyncio.sleep(retry_delay * 2 ** attempt)
+        else:
+            failed.append(page)
+        on_page(url, rows)
+        return rows, last_page, status
+
+    def report():
+        if failed:
+            print(f"{base_url}: pages {sorted(failed)} still failed after {retries + 1} attempts; "
+                  f"their albums are missing from this run.")
+
+    album_data, last_page, _ = await scrape(0)
+    if not album_data:
+        report()
+        return 1
+
+    if last_page is not None:
+        last_page = last_page if max_pages is None else min(last_page, max_pages - 1)
+        await asyncio.gather(*(scrape(page) for page in range(1, last_page + 1)))
+        report()
+        return last_page + 1
+
+    page, batch = 1, 4
+    while max_pages is None or page < max_pages:
+        pages = range(page, page + batch if max_pages is None else min(page + batch, max_pages))
+        results = await asyncio.gather(*(scrape(p) for p in pages))
+        page += len(pages)
+        if any(status in DEFINITIVE_STATUSES and not rows for rows, _, status in results):
+            break  # past the last page
+        if all(status not in DEFINITIVE_STATUSES for _, _, status in results):
+            print(f"{base_url}: every page from {pages[0]} to {pages[-1]} failed; stopping the probe.")
+            break
+        batch *= 2
+    report()
+    return page
+
+
+async def scrape_genres(genre_urls, output_csv, min_score=0, max_score=100, rate=1.0, max_concurrent=4,
+                        max_pages=None, cache_dir=None):
+    """
+    Scrapes all genres concurrently over one keep-alive session, de-duplicating
+    albums across genres and streaming accepted rows to `output_csv` as pages arrive.
+    """
+    seen = set()
+    total_rows = 0
+    written = 0
+
+    with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Album", "Artist", "Score"])
 
-def scrape_album_data(url):
-    """Scrapes album data from a single page and returns a list of (album, artist, score) tuples."""
-    album_data = []
-    try:
-        time.sleep(random.uniform(1, 3))
-        response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        albums = soup.find_all('tr')  # Find all table rows
-
-        for album_row in albums:
-            if album_row.find('td', class_='clamp-summary-wrap'): # filter needed row
-                try:
-                    album_name_element = album_row.find('a', class_='title')
-                    album_name = album_name_element.text.strip() if album_name_element else "Unknown Album"
-
-                    artist_name_element = album_row.find('div', class_='artist')
-                    artist_name = artist_name_element.text.strip() if artist_name_element else "Unknown Artist"
-
-                    score_element = album_row.find('div', class_='metascore_w')
-                    score = int(score_element.text.strip()) if score_element else None
-
-                    album_data.append((album_name, artist_name, score))
-
-                except AttributeError as e:
-                    print(f"Error parsing album data: {e}")
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching page: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-    return album_data
-
-def scrape_multiple_pages(base_url, num_pages):
-    """Scrapes a specified number of pages from a base URL."""
-    all_album_data = []
-    for page in range(num_pages):
-        page_url = f"{base_url}?page={page}"
-        album_data = scrape_album_data(page_url)
-        all_album_data.extend(album_data)
-        print(f"Scraped {len(album_data)} albums from {page_url}")
-    return all_album_data
+        def on_page(url, album_data):
+            nonlocal total_rows, written
+            total_rows += len(album_data)
+            for album, artist, score in filter_album_data(album_data, min_score, max_score):
+                key = (album.strip().lower(), artist.strip().lower())
+                if key in seen:
+                    continue
+                seen.add(key)
+                writer.writerow([album, artist, score])
+                written += 1
+            csvfile.flush()
+            print(f"Scraped {len(album_data)} albums from {url}")
+
+        async with CachedFetcher(rate=rate, burst=max_concurrent, max_concurrent=max_concurrent,
+                                 cache_dir=cache_dir, headers={'User-Agent': 'Mozilla/5.0'}) as fetcher, \
+                ParserPool() as parser_pool:
+            page_counts = await asyncio.gather(*(
+                scrape_multiple_pages(fetcher, parser_pool, url, on_page, max_pages) for url in genre_urls.values()
+            ))
+            print(f"Fetcher stats: {fetcher.stats}")
+
+    for genre, pages in zip(genre_urls, page_counts):
+        print(f"{genre}: {pages} pages")
+    print(f"Total number of albums scraped: {total_rows}, unique after filtering: {written}")
+    return written
 
 
 def filter_album_data(album_data, min_score=0, max_score=100):
@@ -54,34 +139,44 @@ def filter_album_data(album_data, min_score=0, max_score=100):
     filtered_data = [(album, artist, score) for album, artist, score in album_data if score is not None and min_score <= score <= max_score]
     return filtered_data
 
-def save_to_csv(album_data, filename="combined_albums.csv"):
+def shuffle_csv(filename, seed=None):
+    """Shuffles the data rows of a CSV in place, keeping the header first."""
+    with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        rows = list(reader)
+    random.Random(seed).shuffle(rows)
+    save_to_csv([tuple(row) for row in rows], filename, header)
+
+
+def save_to_csv(album_data, filename="combined_albums.csv", header=("Album", "Artist", "Score")):
     """Saves album data to a CSV file."""
     with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerow(["Album", "Artist", "Score"])
+        writer.writerow(list(header))
         for album, artist, score in album_data:
             writer.writerow([album, artist, score])
     print(f"Data saved to {filename}")
 
+def main():
+    parser = argparse.ArgumentParser(description="Scrape Metacritic album scores into combined_albums.csv.")
+    parser.add_argument("--output", type=Path, default=Path("data/raw/combined_albums.csv"))
+    parser.add_argument("--min-score", type=int, default=0)
+    parser.add_argument("--max-score", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=1.0, help="Requests per second to metacritic.com.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-pages", type=int, default=None, help="Cap on pages per genre.")
+    parser.add_argument("--no-shuffle", action="store_true", help="Keep rows in scrape order.")
+    args = parser.parse_args()
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    asyncio.run(scrape_genres(GENRE_URLS, args.output, args.min_score, args.max_score, rate=args.rate,
+                              max_concurrent=args.concurrency, max_pages=args.max_pages))
+
+    if not args.no_shuffle:
+        shuffle_csv(args.output)
+    print("Scraped and saved combined albums to CSV file.")
+
+
 if __name__ == "__main__":
-    rap_url = "https://www.metacritic.com/browse/albums/genre/date/rap"
-    rap_pages = 18
-    pop_url = "https://www.metacritic.com/browse/albums/genre/date/pop?view=detailed"
-    pop_pages = 11
-
-    rap_data = scrape_multiple_pages(rap_url, rap_pages)
-    print(f"Total number of rap albums scraped: {len(rap_data)}")
-    pop_data = scrape_multiple_pages(pop_url, pop_pages)
-    print(f"Total number of pop albums scraped: {len(pop_data)}")
-
-    combined_data = rap_data + pop_data
-    print(f"Total number of albums scraped (combined): {len(combined_data)}")
-
-    min_acceptable_score = 0
-    max_acceptable_score = 100
-    filtered_albums = filter_album_data(combined_data, min_acceptable_score, max_acceptable_score)
-    print(f"Total number of albums after filtering: {len(filtered_albums)}")
-
-    random.shuffle(filtered_albums)
-    save_to_csv(filtered_albums, "data/raw/combined_albums.csv")
-    print("Scraped and saved combined albums to CSV file.")
\ No newline at end of file
+    main()
@@ -0,0 +1,98 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+DAY = 24 * 3600
+
+
+class ResolutionCache:
+    """
+    Persistent (artist, song) -> track page URL -> download URL cache.
+
+    Backed by SQLite in WAL mode so several threads (each with its own
+    connection) and the event loop (through the `a*` wrappers, which run on a
+    worker thread) can read while one writes. Misses are cached too, with their
+    own shorter TTL, so tracks that are known not to exist are not searched for
+    again on every run. Lookups return (hit, value); value None on a hit is a
+    cached negative result.
+    """
+
+    def __init__(self, path, search_ttl=30 * DAY, link_ttl=7 * DAY, negative_ttl=DAY):
+        self.path = str(path)
+        self.search_ttl = search_ttl
+        self.link_ttl = link_ttl
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS searches "
+                         "(key TEXT PRIMARY KEY, track_url TEXT, fetched_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS links "
+                         "(track_url TEXT PRIMARY KEY, download_url TEXT, fetched_at REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def search_key(artist, song_title):
+        return f"{artist}|||{song_title}".lower()
+
+    def _get(self, sql, key, ttl):
+        row = self._connect().execute(sql, (key,)).fetchone()
+        if row is None:
+            return False, None
+        value, fetched_at = row
+        max_age = ttl if value is not None else self.negative_ttl
+        if time.time() - fetched_at > max_age:
+            return False, None
+        return True, value
+
+    def _put(self, sql, key, value):
+        with self._connect() as conn:
+            conn.execute(sql, (key, value, time.time()))
+
+    def get_search(self, artist, song_title):
+        return self._get("SELECT track_url, fetched_at FROM searches WHERE key = ?",
+                         self.search_key(artist, song_title), self.search_ttl)
+
+    def put_search(self, artist, song_title, track_url):
+        self._put("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)", self.search_key(artist, song_title), track_url)
+
+    def get_link(self, track_url):
+        return self._get("SELECT download_url, fetched_at FROM links WHERE track_url = ?", track_url, self.link_ttl)
+
+    def put_link(self, track_url, download_url):
+        self._put("INSERT OR REPLACE INTO links VALUES (?, ?, ?)", track_url, download_url)
+
+    def invalidate_link(self, track_url):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM links WHERE track_url = ?", (track_url,))
+
+    def purge_expired(self):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM searches WHERE fetched_at < ? OR (track_url IS NULL AND fetched_at < ?)",
+                         (now - self.search_ttl, now - self.negative_ttl))
+            conn.execute("DELETE FROM links WHERE fetched_at < ? OR (download_url IS NULL AND fetched_at < ?)",
+                         (now - self.link_ttl, now - self.negative_ttl))
+
+    async def aget_search(self, artist, song_title):
+        return await asyncio.to_thread(self.get_search, artist, song_title)
+
+    async def aput_search(self, artist, song_title, track_url):
+        await asyncio.to_thread(self.put_search, artist, song_title, track_url)
+
+    async def aget_link(self, track_url):
+        return await asyncio.to_thread(self.get_link, track_url)
+
+    async def aput_link(self, track_url, download_url):
+        await asyncio.to_thread(self.put_link, track_url, download_url)
+
+    async def ainvalidate_link(self, track_url):
+        await asyncio.to_thread(self.invalidate_link, track_url)
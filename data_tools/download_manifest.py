@@ -0,0 +1,187 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MIN_AUDIO_BYTES = 50 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+def part_path(file_path):
+    return file_path + ".part"
+
+
+def sniff_audio(path):
+    """
+    Cheap container check on the first bytes of a file: returns 'mp3', 'flac'
+    or None. An ID3v2 tag is skipped so the MPEG frame sync behind it is
+    checked too, which catches HTML error pages and truncated tag-only files.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(10)
+            if head[:4] == b'fLaC':
+                return 'flac'
+            if head[:3] == b'ID3' and len(head) == 10:
+                tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+                f.seek(10 + tag_size + (10 if head[5] & 0x10 else 0))
+                head = f.read(4)
+                if head[:4] == b'fLaC':
+                    return 'flac'
+            if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+                return 'mp3'
+    except OSError:
+        pass
+    return None
+
+
+def resume_plan(status, headers, offset):
+    """
+    Works out how to continue a download from a response to a (possibly
+    ranged) request for `offset` bytes onwards. Returns (write_offset,
+    expected_total) — write_offset 0 means the .part file is rewritten — or
+    None when the response cannot be used. expected_total is None when the
+    server does not give a usable length (unknown or content-encoded).
+    """
+    encoded = headers.get('Content-Encoding', headers.get('content-encoding', 'identity')) not in ('', 'identity')
+    if status == 206:
+        match = CONTENT_RANGE_PATTERN.match(headers.get('Content-Range', headers.get('content-range', '')))
+        if match is None or int(match.group(1)) != offset:
+            return None
+        total = match.group(3)
+        return offset, int(total) if total != '*' else None
+    if status == 200:
+        length = headers.get('Content-Length', headers.get('content-length'))
+        return 0, int(length) if length is not None and not encoded else None
+    return None
+
+
+class DownloadManifest:
+    """
+    Append-only JSONL log of downloaded files that passed verification, keyed
+    by path relative to the download folder. Later lines win; a torn last line
+    from a crash is ignored. Safe to record into from several threads.
+    """
+
+    def __init__(self, root, filename=".download_manifest.jsonl"):
+        self.root = root
+        self.path = os.path.join(root, filename)
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get("size") is None:
+                        self.entries.pop(entry["path"], None)
+                    else:
+                        self.entries[entry["path"]] = entry
+
+    def key(self, file_path):
+        return os.path.relpath(file_path, self.root).replace(os.sep, '/')
+
+    def get(self, file_path):
+        return self.entries.get(self.key(file_path))
+
+    def _append(self, entry):
+        with self._lock:
+            with open(self.path, 'a+', encoding='utf-8') as f:
+                # Terminate a line torn by a previous crash so the next entry starts clean.
+                if f.tell() > 0:
+                    f.seek(f.tell() - 1)
+                    if f.read(1) != '\n':
+                        f.write('\n')
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            if entry["size"] is None:
+                self.entries.pop(entry["path"], None)
+            else:
+                self.entries[entry["path"]] = entry
+
+    def record(self, file_path, size, audio_format):
+        entry = {"path": self.key(file_path), "size": size, "format": audio_format, "verified_at": time.time()}
+        self._append(entry)
+        return entry
+
+    def forget(self, file_path):
+        if self.get(file_path) is not None:
+            self._append({"path": self.key(file_path), "size": None})
+
+
+def finalize_part(part, file_path, expected_total, manifest):
+    """
+    Verifies a finished .part file and moves it into place. Returns
+    (ok, reason). A part that is merely short is kept so the next attempt can
+    resume it; one that is oversized or not audio is deleted.
+    """
+    size = os.path.getsize(part)
+    if expected_total is not None and size < expected_total:
+        return False, f"incomplete ({size}/{expected_total} bytes)"
+    if expected_total is not None and size > expected_total:
+        os.remove(part)
+        return False, f"oversized ({size}/{expected_total} bytes)"
+    audio_format = sniff_audio(part)
+    if size < MIN_AUDIO_BYTES or audio_format is None:
+        os.remove(part)
+        return False, f"not an audio file ({size} bytes)"
+    os.replace(part, file_path)
+    manifest.record(file_path, size, audio_format)
+    return True, audio_format
+
+
+def _scan_folder(folder):
+    """File name -> size for one folder: one directory read plus at most one stat per file."""
+    try:
+        with os.scandir(folder) as entries:
+            return {entry.name: entry.stat().st_size for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
+
+def _diff_album(album_folder, filenames, manifest):
+    on_disk = _scan_folder(album_folder)
+    missing = []
+    for song, filename in filenames:
+        size = on_disk.get(filename)
+        file_path = os.path.join(album_folder, filename)
+        if size is None:
+            manifest.forget(file_path)
+            missing.append(song)
+            continue
+        entry = manifest.get(file_path)
+        if entry is not None and entry["size"] == size:
+            continue
+        # Not in the manifest yet (downloaded before it existed) or changed since: verify once and adopt it.
+        audio_format = sniff_audio(file_path) if size >= MIN_AUDIO_BYTES else None
+        if audio_format is None:
+            missing.append(song)
+        else:
+            manifest.record(file_path, size, audio_format)
+    return missing
+
+
+def scan_library(albums_data, download_folder, sanitize, manifest, max_workers=16):
+    """
+    Diffs the wanted tracks of `albums_data` ({album: {"artist", "songs"}})
+    against the download folder. Every album folder is listed once with
+    os.scandir, the listings run in parallel threads, and a file counts as
+    present when the manifest vouches for its size. Returns the still-missing
+    tracks in the downloaders' [{album: {"artist", "songs"}}] shape, their
+    count and the total number of wanted tracks.
+    """
+    albums = []
+    for album_name, album_info in albums_data.items():
+        album_folder = os.path.join(download_folder, sanitize(album_info['artist']), sanitize(album_name))
+        filenames = [(song, sanitize(f"{song}.mp3")) for song in album_info['songs']]
+        albums.append((album_name, album_info['artist'], album_folder, filenames))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        missing = executor.map(lambda album: _diff_album(album[2], album[3], manifest), albums)
+        to_download = [{album_name: {"artist": artist, "songs": songs}}
+                       for (album_name, artist, _, _), songs in zip(albums, missing) if songs]
+    pending = sum(len(album[album_name]["songs"]) for album in to_download for album_name in album)
+    return to_download, pending, sum(len(album[3]) for album in albums)
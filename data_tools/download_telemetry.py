@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import time
+
+OVERLOAD_STATUSES = (429, 503)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts AIMD-style, like TCP congestion control:
+    every request that completes cleanly grows the limit by 1/limit (about +1
+    per round of `limit` requests), and an overload signal — a 429/503, a
+    timeout or a connection error — halves it, at most once per `cooldown`
+    seconds so one burst of failures counts as a single congestion event.
+    Use as `async with limiter:` and report each outcome with `feedback`.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, backoff=0.5, cooldown=2.0):
+        self.minimum = minimum
+        self.maximum = maximum or initial * 4
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def feedback(self, ok, overloaded=False):
+        if overloaded:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+                self.decreases += 1
+        elif ok:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class StageStats:
+    """Counters and latency samples for one pipeline stage."""
+
+    def __init__(self, name, limiter=None):
+        self.name = name
+        self.limiter = limiter
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.bytes = 0
+        self.latencies = []
+        self.started = time.monotonic()
+        self._last_bytes, self._last_time = 0, self.started
+
+    def record(self, latency, status=None, error=False):
+        self.requests += 1
+        self.latencies.append(latency)
+        if status in OVERLOAD_STATUSES:
+            self.throttled += 1
+        if error:
+            self.errors += 1
+
+    def add_bytes(self, n):
+        self.bytes += n
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "requests_per_s": self.requests / elapsed,
+            "bytes": self.bytes,
+            "bytes_per_s": self.bytes / elapsed,
+            "latency_p50_s": percentile(latencies, 0.50),
+            "latency_p90_s": percentile(latencies, 0.90),
+            "latency_p99_s": percentile(latencies, 0.99),
+            "error_rate": self.errors / self.requests if self.requests else 0.0,
+            "throttle_rate": self.throttled / self.requests if self.requests else 0.0,
+            "concurrency_limit": round(self.limiter.limit, 2) if self.limiter else None,
+            "limit_decreases": self.limiter.decreases if self.limiter else None,
+        }
+
+    def interval_bytes_per_s(self):
+        now = time.monotonic()
+        rate = (self.bytes - self._last_bytes) / max(now - self._last_time, 1e-9)
+        self._last_bytes, self._last_time = self.bytes, now
+        return rate
+
+
+class Telemetry:
+    """Per-stage StageStats with a periodic console line and a JSON summary report."""
+
+    def __init__(self):
+        self.stages = {}
+        self.started = time.time()
+
+    def restart(self):
+        """Starts the rate clocks now, so setup time before the pipeline does not dilute bytes/s."""
+        self.started = time.time()
+        for stats in self.stages.values():
+            stats.started = stats._last_time = time.monotonic()
+
+    def stage(self, name, limiter=None):
+        if name not in self.stages:
+            self.stages[name] = StageStats(name, limiter)
+        return self.stages[name]
+
+    def format_line(self):
+        parts = []
+        for stats in self.stages.values():
+            snapshot = stats.snapshot()
+            p50 = snapshot["latency_p50_s"]
+            part = (f"{stats.name}: {stats.requests} req, p50 {p50 * 1000 if p50 is not None else 0:.0f} ms, "
+                    f"err {snapshot['error_rate']:.1%}, 429 {snapshot['throttle_rate']:.1%}")
+            if stats.bytes:
+                part += f", {stats.interval_bytes_per_s() / 1e6:.2f} MB/s"
+            if stats.limiter is not None:
+                part += f", limit {stats.limiter.limit:.1f}"
+            parts.append(part)
+        return " | ".join(parts)
+
+    async def report_periodically(self, interval=10.0):
+        while True:
+            await asyncio.sleep(interval)
+            print(f"[telemetry] {self.format_line()}")
+
+    def summary(self, **extra):
+        return dict({
+            "started_at": self.started,
+            "duration_s": time.time() - self.started,
+            "stages": {name: stats.snapshot() for name, stats in self.stages.items()},
+        }, **extra)
+
+    def write_report(self, path, **extra):
+        summary = self.summary(**extra)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        os.replace(tmp_path, path)
+        return summary
@@ -1,10 +1,14 @@
+import argparse
+import asyncio
 import csv
-import requests
-from bs4 import BeautifulSoup
+import os
+from pathlib import Path
 import re
-import time
 import json
 
+from html_extract import ParserPool, extract
+from http_utils import CachedFetcher
+
 
 def slugify(text):
     """Convert a string to a URL-friendly slug."""
@@ -21,138 +25,211 @@ def slugify(text):
     return text
 
 
-def get_songs_for_album(artist_name_from_csv, album_name_from_csv):
-    """Fetches song titles for a given album from Genius.com."""
-    if artist_name_from_csv.lower().startswith("by "):
-        artist_name_for_slug = artist_name_from_csv[3:].strip()
-    else:
-        artist_name_for_slug = artist_name_from_csv.strip()
+GENIUS_BASE_URL = "https://genius.com"
+
 
+def artist_for_slug(artist_name_from_csv):
+    if artist_name_from_csv.lower().startswith("by "):
+        return artist_name_from_csv[3:].strip()
+    return artist_name_from_csv.strip()
+
+
+def album_slug_variants(slug_album):
+    """The album slug itself plus, for EPs and mixtapes, the slug without that suffix."""
+    variants = [slug_album]
+    slug_album_variant = slug_album.replace("-ep", "").strip('-') if "-ep" in slug_album else slug_album
+    if "-mixtape" in slug_album_variant:
+        slug_album_variant = slug_album_variant.replace("-mixtape", "").strip('-')
+    if slug_album_variant and slug_album_variant != slug_album:
+        variants.append(slug_album_variant)
+    return variants
+
+
+async def get_songs_for_album(fetcher, artist_name_from_csv, album_name_from_csv, base_url=GENIUS_BASE_URL,
+                              parser_pool=None):
+    """
+    Fetches song titles for a given album from Genius. Returns (url, songs, status).
+
+    The plain slug and its -ep/-mixtape-less variant are requested concurrently;
+    the first one in that order whose page lists songs wins. `status` is 200 when
+    at least one page was fetched and parsed, otherwise the first failure's HTTP
+    status (None for a network error).
+    """
+    artist_name_for_slug = artist_for_slug(artist_name_from_csv)
     slug_artist = slugify(artist_name_for_slug)
     slug_album = slugify(album_name_from_csv)
 
     if not slug_artist or not slug_album:
         print(f"Skipping due to empty slug for Artist: '{artist_name_from_csv}', Album: '{album_name_from_csv}'")
-        return f"INVALID_SLUG_FOR_{slug_artist}_OR_{slug_album}", []
-
-    genius_url = f"https://genius.com/albums/{slug_artist}/{slug_album}"
-    print(f"Attempting to fetch: {genius_url}")
-
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-
-    songs = []
-    final_url_attempted = genius_url
-
-    try:
-        response = requests.get(genius_url, headers=headers, timeout=15)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching {genius_url}: {e}")
-        slug_album_variant = slug_album
-        modified_variant = False
-        if "-ep" in slug_album_variant:
-            slug_album_variant = slug_album_variant.replace("-ep", "").strip('-')
-            modified_variant = True
-        if "-mixtape" in slug_album_variant:
-            slug_album_variant = slug_album_variant.replace("-mixtape", "").strip('-')
-            modified_variant = True
-
-        if modified_variant and slug_album_variant and slug_album_variant != slug_album:
-            genius_url_variant = f"https://genius.com/albums/{slug_artist}/{slug_album_variant}"
-            print(f"Retrying with variant: {genius_url_variant}")
-            final_url_attempted = genius_url_variant
-            try:
-                response = requests.get(genius_url_variant, headers=headers, timeout=15)
-                response.raise_for_status()
-            except requests.exceptions.RequestException as e_variant:
-                print(f"Error fetching variant {genius_url_variant}: {e_variant}")
-                return final_url_attempted, []
-        else:
-            return final_url_attempted, []
-
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    song_elements = soup.find_all('h3', class_='chart_row-content-title')
-
-    if not song_elements:
-        song_elements = soup.select('div[id^="defer-section-"] h3.chart_row-content-title')
-        if not song_elements:
-            song_elements = soup.select('div.chart_row--light_border h3')
-
-    for song_element in song_elements:
-        title_text = song_element.get_text(strip=True)
-        if title_text.lower().endswith(" lyrics"):
-            title_text = title_text[:-7].strip()
-        title_text = re.sub(r'\s*\([\w\s]+?\)\s*$', '', title_text).strip()
-        if title_text:
-            songs.append(title_text)
-
-    if not songs:
-        print(f"No songs found on page for {album_name_from_csv} by {artist_name_for_slug} at {final_url_attempted}")
-
-    return final_url_attempted, songs
-
-
-csv_file_path = 'data/raw/combined_albums.csv'
-all_albums_data = {}
-
-try:
+        return f"INVALID_SLUG_FOR_{slug_artist}_OR_{slug_album}", [], None
+
+    urls = [f"{base_url}/albums/{slug_artist}/{variant}" for variant in album_slug_variants(slug_album)]
+    responses = await asyncio.gather(*(fetcher.fetch(url) for url in urls))
+
+    final_url_attempted, final_status = urls[-1], None
+    for url, (status, body) in zip(urls, responses):
+        if status != 200:
+            print(f"Error fetching {url}: HTTP {status}")
+            if final_status is None:
+                final_status = status
+            continue
+        songs = await parser_pool.extract("genius", body) if parser_pool else extract("genius", body)
+        if songs:
+            return url, songs, status
+        final_url_attempted, final_status = url, status
+
+    print(f"No songs found on page for {album_name_from_csv} by {artist_name_for_slug} at {final_url_attempted}")
+    return final_url_attempted, [], final_status
+
+
+def read_album_rows(csv_file_path):
+    """Returns (album, artist, score) tuples from the combined albums CSV."""
+    rows = []
     with open(csv_file_path, mode='r', encoding='utf-8') as infile:
         reader = csv.reader(infile)
-        header = next(reader)
-
-        for i, row in enumerate(reader):
+        next(reader, None)
+        for row in reader:
             if len(row) < 3:
                 print(f"Skipping malformed row: {row}")
                 continue
+            rows.append((row[0].strip(), row[1].strip(), row[2].strip()))
+    return rows
 
-            album_name_csv, artist_name_csv, score_csv = row[0].strip(), row[1].strip(), row[2].strip()
-
-            cleaned_artist_for_display = artist_name_csv
-            if artist_name_csv.lower().startswith("by "):
-                cleaned_artist_for_display = artist_name_csv[3:].strip()
 
-            print(f"\nProcessing ({i + 1}): Album='{album_name_csv}', Artist (original CSV)='{artist_name_csv}'")
+def iter_records(records_path):
+    """Yields album records from the JSONL log; a torn last line from a crash is ignored."""
+    records_path = Path(records_path)
+    if not records_path.exists():
+        return
+    with open(records_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
 
-            fetched_url, song_list = get_songs_for_album(artist_name_csv, album_name_csv)
 
-            all_albums_data[album_name_csv] = {
-                "artist": cleaned_artist_for_display,
+def completed_albums(records_path, retry_empty=False):
+    """
+    Albums the log already settles: those with songs, plus — unless
+    `retry_empty` — those whose page was fetched (HTTP 200) but listed none.
+    Network errors and non-200 answers are never settled, so they are retried.
+    """
+    done = set()
+    for record in iter_records(records_path):
+        if record.get("songs") or (record.get("status") == 200 and not retry_empty):
+            done.add(record["album"])
+        else:
+            done.discard(record["album"])
+    return done
+
+
+async def fetch_albums(rows, records_path, base_url=GENIUS_BASE_URL, rate=1.0, burst=2, max_concurrent=8,
+                       cache_dir=None, parse_workers=None):
+    """
+    Fetches every (album, artist, score) row concurrently and appends one JSONL
+    record per album to `records_path` as soon as it completes.
+    """
+    fetched = 0
+    async with CachedFetcher(rate=rate, burst=burst, max_concurrent=max_concurrent,
+                             cache_dir=cache_dir) as fetcher, ParserPool(parse_workers) as parser_pool:
+
+        async def fetch_one(row):
+            album_name_csv, artist_name_csv, score_csv = row
+            fetched_url, song_list, status = await get_songs_for_album(fetcher, artist_name_csv, album_name_csv,
+                                                                       base_url, parser_pool)
+            return {
+                "album": album_name_csv,
+                "artist": artist_for_slug(artist_name_csv),
                 "songs": song_list,
                 "score": score_csv,
-                "genius_url_attempted": fetched_url
+                "genius_url_attempted": fetched_url,
+                "status": status
             }
 
-            time.sleep(1.2)
-
-except FileNotFoundError:
-    print(f"Error: The file '{csv_file_path}' was not found.")
-    print("Please make sure 'combined_albums.csv' is in the same directory as the script.")
-except Exception as e:
-    print(f"An unexpected error occurred during processing: {e}")
-
-print("\n\n--- Collected Album Data ---")
-if all_albums_data:
-    for album_title_key, album_details in all_albums_data.items():
-        print(f"\nAlbum: {album_title_key}")
-        print(f"  Artist: {album_details['artist']}")
-        print(f"  Score: {album_details['score']}")
-        print(f"  Genius URL Attempted: {album_details['genius_url_attempted']}")
-        if album_details['songs']:
-            print("  Songs Found:")
-            for idx, song in enumerate(album_details['songs']):
-                print(f"    {idx + 1}. {song}")
-        else:
-            print("  No songs found for this album on Genius.")
-else:
-    print("No data was processed or collected.")
-
-json_output_file = '../data/raw/genius_albums_structured_data.json'
-try:
-    with open(json_output_file, 'w', encoding='utf-8') as f:
+        with open(records_path, 'a+', encoding='utf-8') as out:
+            # Terminate a line torn by a previous crash so the next record starts clean.
+            if out.tell() > 0:
+                out.seek(out.tell() - 1)
+                if out.read(1) != '\n':
+                    out.write('\n')
+            for task in asyncio.as_completed([fetch_one(row) for row in rows]):
+                record = await task
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+                fetched += 1
+                print(f"[{fetched}/{len(rows)}] {record['album']} by {record['artist']}: {len(record['songs'])} songs"
+                      + (f" (HTTP {record['status']}, will retry)" if record['status'] != 200 else ""))
+        print(f"Fetcher stats: {fetcher.stats}")
+    return fetched
+
+
+def compact(records_path, json_output_file):
+    """
+    Folds the JSONL log into the structured {album: {...}} JSON the merge step reads.
+    The last record per album wins unless it found no songs and an earlier one
+    did; albums keep their first-seen order.
+    """
+    all_albums_data = {}
+    for record in iter_records(records_path):
+        album_name = record.pop("album")
+        record.pop("status", None)
+        if album_name in all_albums_data and not record["songs"] and all_albums_data[album_name]["songs"]:
+            continue
+        all_albums_data[album_name] = record
+
+    json_output_file = Path(json_output_file)
+    json_output_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = json_output_file.with_name(json_output_file.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(all_albums_data, f, ensure_ascii=False, indent=4)
-    print(f"\nAll album data also saved to: {json_output_file}")
-except Exception as e:
-    print(f"\nError saving data to JSON file: {e}")
\ No newline at end of file
+    os.replace(tmp_path, json_output_file)
+
+    with_songs = sum(1 for album in all_albums_data.values() if album["songs"])
+    print(f"Compacted {len(all_albums_data)} albums ({with_songs} with songs) into: {json_output_file}")
+    return all_albums_data
+
+
+def main():
+    project_root = Path(__file__).resolve().parent.parent
+    raw_dir = project_root / "data" / "raw"
+
+    parser = argparse.ArgumentParser(description="Fetch album track lists from Genius.")
+    parser.add_argument("command", nargs="?", choices=("fetch", "compact"), default="fetch",
+                        help="'fetch' appends new albums to the JSONL log (then compacts); "
+                             "'compact' only rewrites the structured JSON.")
+    parser.add_argument("--csv", type=Path, default=raw_dir / "combined_albums.csv")
+    parser.add_argument("--records", type=Path, default=raw_dir / "genius_albums.jsonl",
+                        help="Append-only JSONL log of fetched albums.")
+    parser.add_argument("--output", type=Path, default=raw_dir / "genius_albums_structured_data.json")
+    parser.add_argument("--cache-dir", type=Path, default=raw_dir / "genius_cache")
+    parser.add_argument("--base-url", default=GENIUS_BASE_URL)
+    parser.add_argument("--rate", type=float, default=1.0, help="Requests per second per host.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--retry-empty", action="store_true",
+                        help="Refetch albums whose previous record has no songs.")
+    parser.add_argument("--no-compact", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        try:
+            rows = read_album_rows(args.csv)
+        except FileNotFoundError:
+            print(f"Error: The file '{args.csv}' was not found.")
+            return
+
+        done = completed_albums(args.records, args.retry_empty)
+        todo = [row for row in rows if row[0] not in done]
+        print(f"{len(rows)} albums in CSV, {len(rows) - len(todo)} already fetched, {len(todo)} to fetch.")
+        if todo:
+            args.records.parent.mkdir(parents=True, exist_ok=True)
+            asyncio.run(fetch_albums(todo, args.records, base_url=args.base_url, rate=args.rate,
+                                     max_concurrent=args.concurrency, cache_dir=args.cache_dir))
+        if args.no_compact:
+            return
+
+    compact(args.records, args.output)
+
+
+if __name__ == "__main__":
+    main()
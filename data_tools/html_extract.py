@@ -0,0 +1,221 @@
+import asyncio
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+TRAILING_PARENS_PATTERN = re.compile(r'\s*\([\w\s]+?\)\s*$')
+
+
+def _has_class(class_name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def _clean_song_title(title_text):
+    if title_text.lower().endswith(" lyrics"):
+        title_text = title_text[:-7].strip()
+    return TRAILING_PARENS_PATTERN.sub('', title_text).strip()
+
+
+def _metascore(text):
+    try:
+        return int(text.strip())
+    except ValueError:
+        return None
+
+
+# --- Genius album pages: list of song titles -------------------------------
+
+def genius_titles_reference(html):
+    """Full-tree html.parser path the fetcher originally used; kept as the benchmark baseline."""
+    soup = BeautifulSoup(html, 'html.parser')
+    song_elements = soup.find_all('h3', class_='chart_row-content-title')
+    if not song_elements:
+        song_elements = soup.select('div[id^="defer-section-"] h3.chart_row-content-title')
+        if not song_elements:
+            song_elements = soup.select('div.chart_row--light_border h3')
+    titles = (_clean_song_title(element.get_text(strip=True)) for element in song_elements)
+    return [title for title in titles if title]
+
+
+def genius_titles_bs4(html):
+    features = 'lxml' if lxml is not None else 'html.parser'
+    soup = BeautifulSoup(html, features, parse_only=SoupStrainer('h3', class_='chart_row-content-title'))
+    song_elements = soup.find_all('h3')
+    if not song_elements:
+        soup = BeautifulSoup(html, features, parse_only=SoupStrainer('div', class_='chart_row--light_border'))
+        song_elements = soup.select('div.chart_row--light_border h3')
+    titles = (_clean_song_title(element.get_text(strip=True)) for element in song_elements)
+    return [title for title in titles if title]
+
+
+def genius_titles_lxml(html):
+    tree = lxml.html.fromstring(html)
+    song_elements = tree.xpath(f"//h3[{_has_class('chart_row-content-title')}]")
+    if not song_elements:
+        song_elements = tree.xpath(f"//div[{_has_class('chart_row--light_border')}]//h3")
+    titles = (_clean_song_title(''.join(t.strip() for t in element.itertext())) for element in song_elements)
+    return [title for title in titles if title]
+
+
+def genius_titles_selectolax(html):
+    tree = HTMLParser(html)
+    song_elements = tree.css('h3.chart_row-content-title')
+    if not song_elements:
+        song_elements = tree.css('div.chart_row--light_border h3')
+    titles = (_clean_song_title(element.text(deep=True, separator='', strip=True)) for element in song_elements)
+    return [title for title in titles if title]
+
+
+# --- Metacritic browse pages: (album, artist, score) rows ------------------
+
+def metacritic_rows_reference(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    rows = []
+    for album_row in soup.find_all('tr'):
+        if album_row.find('td', class_='clamp-summary-wrap'):
+            album_name_element = album_row.find('a', class_='title')
+            artist_name_element = album_row.find('div', class_='artist')
+            score_element = album_row.find('div', class_='metascore_w')
+            rows.append((
+                album_name_element.text.strip() if album_name_element else "Unknown Album",
+                artist_name_element.text.strip() if artist_name_element else "Unknown Artist",
+                _metascore(score_element.text) if score_element else None
+            ))
+    return rows
+
+
+def metacritic_rows_bs4(html):
+    features = 'lxml' if lxml is not None else 'html.parser'
+    soup = BeautifulSoup(html, features, parse_only=SoupStrainer('tr'))
+    rows = []
+    for album_row in soup.find_all('tr'):
+        if album_row.find('td', class_='clamp-summary-wrap'):
+            album_name_element = album_row.find('a', class_='title')
+            artist_name_element = album_row.find('div', class_='artist')
+            score_element = album_row.find('div', class_='metascore_w')
+            rows.append((
+                album_name_element.text.strip() if album_name_element else "Unknown Album",
+                artist_name_element.text.strip() if artist_name_element else "Unknown Artist",
+                _metascore(score_element.text) if score_element else None
+            ))
+    return rows
+
+
+def metacritic_rows_lxml(html):
+    tree = lxml.html.fromstring(html)
+    rows = []
+    for album_row in tree.xpath(f"//tr[.//td[{_has_class('clamp-summary-wrap')}]]"):
+        album_name_element = album_row.xpath(f".//a[{_has_class('title')}]")
+        artist_name_element = album_row.xpath(f".//div[{_has_class('artist')}]")
+        score_element = album_row.xpath(f".//div[{_has_class('metascore_w')}]")
+        rows.append((
+            album_name_element[0].text_content().strip() if album_name_element else "Unknown Album",
+            artist_name_element[0].text_content().strip() if artist_name_element else "Unknown Artist",
+            _metascore(score_element[0].text_content()) if score_element else None
+        ))
+    return rows
+
+
+def metacritic_rows_selectolax(html):
+    tree = HTMLParser(html)
+    rows = []
+    for album_row in tree.css('tr'):
+        if album_row.css_first('td.clamp-summary-wrap') is None:
+            continue
+        album_name_element = album_row.css_first('a.title')
+        artist_name_element = album_row.css_first('div.artist')
+        score_element = album_row.css_first('div.metascore_w')
+        rows.append((
+            album_name_element.text().strip() if album_name_element else "Unknown Album",
+            artist_name_element.text().strip() if artist_name_element else "Unknown Artist",
+            _metascore(score_element.text()) if score_element else None
+        ))
+    return rows
+
+
+def metacritic_last_page(html):
+    """Highest page index linked from a browse page's pagination, or None when there is none."""
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', 'ignore')
+    pages = [int(p) for p in re.findall(r'[?&;]page=(\d+)', html)]
+    return max(pages) if pages else None
+
+
+EXTRACTORS = {
+    "genius": {
+        "reference": genius_titles_reference,
+        "bs4": genius_titles_bs4,
+        "lxml": genius_titles_lxml,
+        "selectolax": genius_titles_selectolax,
+    },
+    "metacritic": {
+        "reference": metacritic_rows_reference,
+        "bs4": metacritic_rows_bs4,
+        "lxml": metacritic_rows_lxml,
+        "selectolax": metacritic_rows_selectolax,
+    },
+}
+
+
+def available_backends():
+    backends = ["reference", "bs4"]
+    if lxml is not None:
+        backends.append("lxml")
+    if HTMLParser is not None:
+        backends.append("selectolax")
+    return backends
+
+
+def best_backend():
+    return available_backends()[-1]
+
+
+def extract(kind, html, backend="auto"):
+    """Runs the `kind` extractor ('genius' or 'metacritic') with the given or fastest installed backend."""
+    if backend == "auto":
+        backend = best_backend()
+    if backend not in available_backends():
+        raise ValueError(f"HTML backend '{backend}' is not available; installed: {available_backends()}")
+    return EXTRACTORS[kind][backend](html)
+
+
+class ParserPool:
+    """
+    Process pool for HTML extraction, so page parsing never runs on the event
+    loop that is doing the network I/O. Use as a (sync or async) context manager.
+    """
+
+    def __init__(self, max_workers=None, backend="auto"):
+        self.backend = best_backend() if backend == "auto" else backend
+        self.max_workers = max_workers
+        self.executor = None
+
+    def __enter__(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.__exit__(exc_type, exc, tb)
+
+    def submit(self, kind, html):
+        return self.executor.submit(extract, kind, html, self.backend)
+
+    async def extract(self, kind, html):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, extract, kind, html, self.backend)
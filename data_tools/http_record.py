@@ -0,0 +1,617 @@
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+MODES = ("live", "record", "replay", "cache")
+KEPT_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified",
+                "Location", "Content-Disposition")
+# Textual responses (pages, API answers) are buffered and recorded in one go; audio and other binary payloads
+# are recorded chunk by chunk while the caller streams them.
+BUFFERED_CONTENT_TYPES = ("text/", "application/json", "application/xml", "application/xhtml+xml",
+                          "application/javascript")
+STREAM_COMPRESSLEVEL = 1
+
+
+def canonical_url(url, params=None):
+    """URL with `params` merged into the query string and the query sorted, so equal requests key equally."""
+    parts = urlsplit(str(url))
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += list(params.items()) if isinstance(params, dict) else list(params)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ''))
+
+
+def request_key(method, url, params=None, body=None, byte_range=None):
+    digest = hashlib.sha256(f"{method.upper()} {canonical_url(url, params)}".encode('utf-8'))
+    if byte_range:
+        digest.update(f"\nRange: {byte_range}\n".encode('utf-8'))
+    if body:
+        digest.update(body if isinstance(body, bytes) else str(body).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def range_header(headers):
+    """The Range header of a request's headers (any mapping, any case), or None."""
+    for name, value in (headers or {}).items():
+        if name.lower() == 'range':
+            return value
+    return None
+
+
+def is_buffered(headers):
+    content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+    return content_type.startswith(BUFFERED_CONTENT_TYPES)
+
+
+class RecordedResponse:
+    def __init__(self, store, meta):
+        self._store = store
+        self.url = meta["url"]
+        self.method = meta["method"]
+        self.status = meta["status"]
+        self.headers = meta["headers"]
+        self.body_hash = meta["body"]
+
+    @property
+    def body(self):
+        return self._store.read_body(self.body_hash)
+
+    def open(self):
+        """The body as a readable binary file, decompressed on the fly."""
+        return self._store.open_body(self.body_hash)
+
+
+class BodyWriter:
+    """
+    Gzips a response body into a temporary file under objects/ while hashing
+    it, so a body of any size is stored without being held in memory.
+    `commit` moves the file to its content address; `discard` drops it.
+    """
+
+    def __init__(self, store, compresslevel=6):
+        self.store = store
+        self.digest = hashlib.sha256()
+        self.size = 0
+        fd, self.tmp_path = tempfile.mkstemp(suffix=".tmp", dir=store.directory / "objects")
+        self._file = gzip.GzipFile(fileobj=os.fdopen(fd, 'wb'), mode='wb', compresslevel=compresslevel)
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        self._file.write(chunk)
+
+    def _close(self):
+        fileobj = self._file.fileobj
+        self._file.close()
+        fileobj.close()
+
+    def commit(self):
+        self._close()
+        body_hash = self.digest.hexdigest()
+        object_path = self.store._object_path(body_hash)
+        if object_path.exists():
+            os.remove(self.tmp_path)
+        else:
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.tmp_path, object_path)
+        return body_hash
+
+    def discard(self):
+        self._close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class RecordStore:
+    """
+    Content-addressed store of HTTP responses.
+
+    Bodies are gzip-compressed under objects/<sha256[:2]>/<sha256>.gz, so the
+    same payload served from many URLs is kept once. Bodies are written
+    through a BodyWriter, so streamed downloads are recorded as they pass. Each request key (method,
+    canonical URL, Range header and request body) maps to a small JSON entry
+    under index/ holding status, a few headers and the body hash.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        (self.directory / "objects").mkdir(parents=True, exist_ok=True)
+        (self.directory / "index").mkdir(parents=True, exist_ok=True)
+
+    def _object_path(self, body_hash):
+        return self.directory / "objects" / body_hash[:2] / f"{body_hash}.gz"
+
+    def _index_path(self, key):
+        return self.directory / "index" / f"{key}.json"
+
+    def get(self, key):
+        path = self._index_path(key)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return RecordedResponse(self, json.load(f))
+
+    def read_body(self, body_hash):
+        with self.open_body(body_hash) as f:
+            return f.read()
+
+    def open_body(self, body_hash):
+        return gzip.open(self._object_path(body_hash), 'rb')
+
+    def writer(self, compresslevel=6):
+        return BodyWriter(self, compresslevel)
+
+    def put(self, key, method, url, status, headers, body):
+        writer = self.writer()
+        writer.write(body)
+        return self.record(key, method, url, status, headers, writer)
+
+    def record(self, key, method, url, status, headers, writer):
+        """Commits a finished BodyWriter and indexes it under `key`."""
+        meta = {
+            "method": method.upper(),
+            "url": str(url),
+            "status": status,
+            "headers": {name: headers[name] for name in KEPT_HEADERS if name in headers},
+            "body": writer.commit(),
+            "size": writer.size,
+            "recorded_at": time.time()
+        }
+        # Bodies are stored decoded, so the length is that of the stored bytes, not the wire's.
+        meta["headers"]["Content-Length"] = str(writer.size)
+        index_path = self._index_path(key)
+        tmp_path = index_path.with_name(index_path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, index_path)
+        return RecordedResponse(self, meta)
+
+    def entries(self):
+        for path in (self.directory / "index").glob("*.json"):
+            with open(path, 'r', encoding='utf-8') as f:
+                yield path.stem, json.load(f)
+
+    def stats(self):
+        entries = list(self.entries())
+        objects = list((self.directory / "objects").glob("*/*.gz"))
+        return {
+            "entries": len(entries),
+            "objects": len(objects),
+            "raw_bytes": sum(meta["size"] for _, meta in entries),
+            "stored_bytes": sum(path.stat().st_size for path in objects)
+        }
+
+
+def from_env():
+    """(store, mode) from HTTP_RECORD_DIR / HTTP_RECORD_MODE; (None, 'live') when recording is not configured."""
+    mode = os.environ.get("HTTP_RECORD_MODE", "live")
+    if mode not in MODES:
+        raise ValueError(f"HTTP_RECORD_MODE must be one of {MODES}, got '{mode}'.")
+    directory = os.environ.get("HTTP_RECORD_DIR")
+    if mode == "live" or not directory:
+        return None, "live"
+    return RecordStore(directory), mode
+
+
+# --- requests ---------------------------------------------------------------
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+except ImportError:
+    requests = None
+    HTTPAdapter = object
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """
+    requests transport adapter that records responses to, or replays them from,
+    a RecordStore. 'record' always hits the network, 'replay' never does, and
+    'cache' only goes out on a miss. Non-textual responses stay streamable:
+    their body is recorded as the caller reads it, and replayed from the
+    store without being loaded whole.
+    """
+
+    def __init__(self, store, mode="cache", **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.mode = mode
+
+    def _build_response(self, request, recorded):
+        response = requests.Response()
+        response.status_code = recorded.status
+        response.headers = CaseInsensitiveDict(recorded.headers)
+        response.raw = recorded.open()
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.reason = "Replayed"
+        response.request = request
+        response.connection = self
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.mode == "live":
+            return super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+
+        key = request_key(request.method, request.url, body=request.body,
+                          byte_range=range_header(request.headers))
+        if self.mode in ("replay", "cache"):
+            recorded = self.store.get(key)
+            if recorded is not None:
+                return self._build_response(request, recorded)
+            if self.mode == "replay":
+                raise requests.exceptions.ConnectionError(f"No recorded response for {request.method} {request.url}",
+                                                          request=request)
+
+        # Always streamed, so a binary body is never read here; Session.send still loads it unless stream=True.
+        response = super().send(request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        # A 304 only means something relative to the caller's validators, so it is never stored.
+        if response.status_code == 304:
+            return response
+        if not is_buffered(response.headers):
+            response.raw = _RecordingRaw(response.raw, self.store.writer(STREAM_COMPRESSLEVEL), lambda writer: (
+                self.store.record(key, request.method, request.url, response.status_code, response.headers, writer)))
+            return response
+        recorded = self.store.put(key, request.method, request.url, response.status_code, response.headers,
+                                  response.content)
+        return self._build_response(request, recorded)
+
+
+class _RecordingRaw:
+    """
+    Wraps a urllib3 response so every chunk requests reads from it is also
+    written to a BodyWriter; the body is recorded on a clean EOF and dropped
+    if the response is closed before it.
+    """
+
+    def __init__(self, raw, writer, on_complete):
+        self._raw = raw
+        self._writer = writer
+        self._on_complete = on_complete
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        chunk = self._raw.read(amt, decode_content=decode_content, **kwargs)
+        if self._writer is not None:
+            if chunk:
+                self._writer.write(chunk)
+            if not chunk or amt is None:
+                writer, self._writer = self._writer, None
+                self._on_complete(writer)
+        return chunk
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        while True:
+            chunk = self.read(amt, decode_content=decode_content)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.discard()
+            self._writer = None
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def mount(session, store=None, mode=None, **adapter_kwargs):
+    """Mounts a RecordReplayAdapter on a requests session; store/mode default to from_env()."""
+    if store is None and mode is None:
+        store, mode = from_env()
+    if store is None or mode == "live":
+        return session
+    adapter = RecordReplayAdapter(store, mode, **adapter_kwargs)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# --- aiohttp ----------------------------------------------------------------
+
+class _BodyReader:
+    def __init__(self, stream):
+        self._buffer = stream
+
+    async def read(self, n=-1):
+        return self._buffer.read(n)
+
+    async def iter_chunked(self, n):
+        while True:
+            chunk = self._buffer.read(n)
+            if not chunk:
+                return
+            yield chunk
+
+
+class ReplayResponse:
+    """
+    Minimal stand-in for aiohttp.ClientResponse backed by a recorded body,
+    either in memory or as a stream read straight from the store.
+    """
+
+    def __init__(self, status, headers, url, body=b'', stream=None):
+        self.status = status
+        self.headers = {name.lower(): value for name, value in headers.items()}
+        self.headers.update(headers)
+        self.url = url
+        self._body = body if stream is None else None
+        self._stream = stream if stream is not None else io.BytesIO(body)
+        self.content = _BodyReader(self._stream)
+
+    @classmethod
+    def from_recorded(cls, recorded):
+        return cls(recorded.status, recorded.headers, recorded.url, stream=recorded.open())
+
+    async def read(self):
+        if self._body is None:
+            self._body = self._stream.read()
+        return self._body
+
+    async def text(self, encoding='utf-8', errors='replace'):
+        return (await self.read()).decode(encoding, errors)
+
+    async def json(self):
+        return json.loads(await self.read())
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            import aiohttp
+            raise aiohttp.ClientResponseError(None, (), status=self.status, message=f"Replayed HTTP {self.status}")
+
+    def release(self):
+        self._stream.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class _TeeReader:
+    def __init__(self, response):
+        self._response = response
+
+    async def read(self, n=-1):
+        chunk = await self._response._response.content.read(n)
+        self._response._feed(chunk)
+        return chunk
+
+    async def iter_chunked(self, n):
+        while True:
+            chunk = await self.read(n)
+            if not chunk:
+                return
+            yield chunk
+
+
+class RecordingResponse:
+    """
+    Live aiohttp response whose body is copied into a BodyWriter as the caller
+    reads it. The body is recorded on a clean EOF and dropped if the response
+    is released before it, e.g. after raise_for_status or a broken connection.
+    """
+
+    def __init__(self, response, writer, on_complete):
+        self._response = response
+        self._writer = writer
+        self._on_complete = on_complete
+        self.status = response.status
+        self.headers = response.headers
+        self.url = response.url
+        self.content = _TeeReader(self)
+
+    def _feed(self, chunk):
+        if self._writer is None:
+            return
+        if chunk:
+            self._writer.write(chunk)
+        else:
+            writer, self._writer = self._writer, None
+            self._on_complete(writer)
+
+    async def read(self):
+        return b''.join([chunk async for chunk in self.content.iter_chunked(1 << 16)])
+
+    def raise_for_status(self):
+        self._response.raise_for_status()
+
+    def release(self):
+        if self._writer is not None:
+            self._writer.discard()
+            self._writer = None
+        self._response.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class _RequestContext:
+    def __init__(self, coroutine):
+        self._coroutine = coroutine
+
+    def __await__(self):
+        return self._coroutine.__await__()
+
+    async def __aenter__(self):
+        self._response = await self._coroutine
+        return await self._response.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._response.__aexit__(exc_type, exc, tb)
+
+
+class RecordReplaySession:
+    """
+    Wraps an aiohttp.ClientSession so `get`/`request` go through a RecordStore.
+
+    Textual responses are buffered, recorded and returned as ReplayResponse
+    objects. Non-textual ones (audio downloads) are returned live as a
+    RecordingResponse, which records the body while the caller streams it;
+    replayed bodies are streamed from the store. In 'live' mode every call
+    passes straight through to the wrapped session.
+    """
+
+    def __init__(self, session, store, mode="cache"):
+        self.session = session
+        self.store = store
+        self.mode = mode
+
+    async def _request(self, method, url, params=None, data=None, **kwargs):
+        key = request_key(method, url, params, data, range_header(kwargs.get('headers')))
+        if self.mode in ("replay", "cache"):
+            recorded = self.store.get(key)
+            if recorded is not None:
+                return ReplayResponse.from_recorded(recorded)
+            if self.mode == "replay":
+                import aiohttp
+                raise aiohttp.ClientConnectionError(f"No recorded response for {method} {url}")
+
+        response = await self.session.request(method, url, params=params, data=data, **kwargs)
+        if response.status != 304 and not is_buffered(response.headers):
+            return RecordingResponse(response, self.store.writer(STREAM_COMPRESSLEVEL), lambda writer: (
+                self.store.record(key, method, canonical_url(url, params), response.status, response.headers,
+                                  writer)))
+        try:
+            body = await response.read()
+            status, headers = response.status, response.headers
+        finally:
+            response.release()
+        # A 304 only means something relative to the caller's validators, so it is never stored.
+        if status == 304:
+            return ReplayResponse(status, dict(headers), str(url), body)
+        return ReplayResponse.from_recorded(self.store.put(key, method, canonical_url(url, params), status,
+                                                           headers, body))
+
+    def request(self, method, url, **kwargs):
+        if self.mode == "live":
+            return self.session.request(method, url, **kwargs)
+        return _RequestContext(self._request(method, url, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    @property
+    def closed(self):
+        return self.session.closed
+
+    async def close(self):
+        await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+def wrap_session(session, store=None, mode=None):
+    """Returns `session` wrapped for record/replay, or unchanged when recording is off."""
+    if store is None and mode is None:
+        store, mode = from_env()
+    if store is None or mode == "live":
+        return session
+    return RecordReplaySession(session, store, mode)
+
+
+# --- local replay server ----------------------------------------------------
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Serves recorded GET responses over plain HTTP so any client, including the
+    downloaders pointed at it via their base_url, can run fully offline.
+
+    A request for /path?query is looked up as `origin` + /path?query; without an
+    origin, the first recorded entry with that path and query is served.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, store, origin=None, host="127.0.0.1", port=8765):
+        self.store = store
+        self.origin = origin.rstrip('/') if origin else None
+        self.by_path = {}
+        for key, meta in store.entries():
+            if meta["method"] == "GET":
+                parts = urlsplit(meta["url"])
+                self.by_path.setdefault(urlunsplit(('', '', parts.path, parts.query, '')), key)
+        super().__init__((host, port), _ReplayHandler)
+
+    def lookup(self, path, byte_range=None):
+        recorded = None
+        if self.origin:
+            recorded = self.store.get(request_key("GET", self.origin + path, byte_range=byte_range))
+        if recorded is None:
+            parts = urlsplit(canonical_url(path))
+            key = self.by_path.get(urlunsplit(('', '', parts.path, parts.query, '')))
+            recorded = self.store.get(key) if key else None
+        return recorded
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        recorded = self.server.lookup(self.path, self.headers.get('Range'))
+        if recorded is None:
+            self.send_error(404, "Not recorded")
+            return
+        self.send_response(recorded.status)
+        for name, value in recorded.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        with recorded.open() as body:
+            shutil.copyfileobj(body, self.wfile)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or serve a recorded HTTP response store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Serve recorded responses on a local port.")
+    serve.add_argument("store", type=Path)
+    serve.add_argument("--origin", default=None, help="e.g. https://musify.club")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    stats = sub.add_parser("stats", help="Show entry count and compression ratio.")
+    stats.add_argument("store", type=Path)
+    args = parser.parse_args()
+
+    store = RecordStore(args.store)
+    if args.command == "stats":
+        info = store.stats()
+        ratio = info["raw_bytes"] / max(info["stored_bytes"], 1)
+        print(f"{info['entries']} responses, {info['objects']} unique bodies, "
+              f"{info['raw_bytes'] / 1e6:.1f} MB raw -> {info['stored_bytes'] / 1e6:.1f} MB stored ({ratio:.1f}x)")
+        return
+
+    server = ReplayServer(store, args.origin, args.host, args.port)
+    print(f"Replaying {len(server.by_path)} recorded GETs on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from http_record import wrap_session
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class HostRateLimiter:
+    """One TokenBucket per host, created on first use."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+
+    async def acquire(self, url):
+        host = urlsplit(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache keyed by URL.
+
+    Each entry is a `<sha1>.body` file plus a `<sha1>.json` sidecar with the
+    status code, ETag / Last-Modified validators and the fetch time. Entries
+    younger than `max_age` seconds are served without touching the network;
+    older ones are revalidated with a conditional request.
+    """
+
+    def __init__(self, directory, max_age=24 * 3600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def get(self, url):
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists():
+            return None, None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            body = body_path.read_bytes() if body_path.exists() else b''
+        except (OSError, json.JSONDecodeError):
+            return None, None
+        return meta, body
+
+    def is_fresh(self, meta):
+        return self.max_age is not None and time.time() - meta.get("fetched_at", 0) < self.max_age
+
+    def put(self, url, status, headers, body):
+        meta_path, body_path = self._paths(url)
+        meta = {
+            "url": url,
+            "status": status,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": time.time()
+        }
+        # Body first, sidecar last: a sidecar on disk always points at a complete body.
+        tmp_body = body_path.with_name(body_path.name + ".tmp")
+        tmp_body.write_bytes(body)
+        os.replace(tmp_body, body_path)
+        self.touch(url, meta)
+        return meta
+
+    def touch(self, url, meta):
+        meta_path, _ = self._paths(url)
+        meta = dict(meta, fetched_at=time.time())
+        tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+        return meta
+
+    @staticmethod
+    def conditional_headers(meta):
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+
+class CachedFetcher:
+    """
+    Pooled aiohttp client with a per-host token bucket, a global concurrency
+    cap and an optional ResponseCache. Use as an async context manager.
+
+    `fetch(url)` returns (status, body_bytes); network errors come back as
+    status None so callers can treat them like any other miss. Traffic goes
+    through http_record, so HTTP_RECORD_MODE / HTTP_RECORD_DIR (or an explicit
+    record_store and record_mode) switch it to record or replay.
+    """
+
+    def __init__(self, rate=1.0, burst=2, max_concurrent=8, cache_dir=None, max_age=24 * 3600,
+                 timeout=15, headers=None, record_store=None, record_mode=None):
+        self.limiter = HostRateLimiter(rate, burst)
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.cache = ResponseCache(cache_dir, max_age) if cache_dir else None
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self.max_concurrent = max_concurrent
+        self.record_store = record_store
+        self.record_mode = record_mode
+        self.session = None
+        self.stats = {"network": 0, "cache_fresh": 0, "revalidated": 0, "errors": 0}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent, ttl_dns_cache=300)
+        self.session = wrap_session(
+            aiohttp.ClientSession(connector=connector, headers=self.headers, timeout=self.timeout),
+            self.record_store, self.record_mode
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def fetch(self, url):
+        meta, body = self.cache.get(url) if self.cache else (None, None)
+        if meta is not None and self.cache.is_fresh(meta):
+            self.stats["cache_fresh"] += 1
+            return meta["status"], body
+
+        headers = ResponseCache.conditional_headers(meta) if meta is not None else {}
+        try:
+            async with self.semaphore:
+                await self.limiter.acquire(url)
+                async with self.session.get(url, headers=headers) as response:
+                    self.stats["network"] += 1
+                    if response.status == 304 and meta is not None:
+                        self.stats["revalidated"] += 1
+                        self.cache.touch(url, meta)
+                        return meta["status"], body
+                    content = await response.read()
+                    status, response_headers = response.status, response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.stats["errors"] += 1
+            print(f"Error fetching {url}: {e}")
+            if meta is not None:
+                return meta["status"], body
+            return None, b''
+
+        # Only definitive answers are cached; 429s and 5xx are retried next run.
+        if self.cache and (status < 400 or status in (404, 410)):
+            self.cache.put(url, status, response_headers, content)
+        return status, content
@@ -1,7 +1,15 @@
 import json
 from pathlib import Path
 import argparse
+import hashlib
+import os
 import re  # For string cleaning
+import sys
+import tempfile
+from collections import defaultdict
+import numpy as np
+
+from title_matcher import TitleMatcher
 
 
 def clean_song_title(title: str) -> str:
@@ -24,28 +32,339 @@ def clean_song_title(title: str) -> str:
     return cleaned_title
 
 
-def merge_data(clap_embeddings_path: Path, albums_structured_path: Path, output_path: Path):
+def iter_json_array(path: Path, chunk_size: int = 1 << 20, wrapped: bool = False):
+    """
+    Yields the elements of a top-level JSON array one at a time.
+
+    Only the current element and one read chunk are held in memory, so a
+    multi-GB embeddings dump can be walked without json.load-ing it. With
+    `wrapped=True` the first array in the file is walked instead, which is how
+    a previously written {"Albums": [...]} output is read back.
+    """
+    decoder = json.JSONDecoder()
+    separators = re.compile(r'[\s,]*')
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        start = buffer.find('[') if wrapped else 0
+        if start < 0 or not buffer.startswith('[', start):
+            raise json.JSONDecodeError("Expected a JSON array", buffer, 0)
+        pos, eof = start + 1, False
+
+        while True:
+            pos = separators.match(buffer, pos).end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The element straddles the chunk boundary: drop what was consumed and read on.
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield item
+            pos = end
+
+
+class SongRowIndex:
+    """
+    Compact (artist, cleaned title) -> row index over the embeddings dump.
+
+    Embedding vectors are appended to float32 row files in `work_dir` and read
+    back through np.memmap; only keys and a few short strings stay in memory.
+    """
+
+    def __init__(self, work_dir: Path):
+        self.work_dir = work_dir
+        self.lookup = {}
+        self.meta = []
+        self.dim = None
+        self.artist_digests = defaultdict(list)
+        self._artist_hashes = {}
+        self._audio_file = open(work_dir / "audio.f32", 'wb')
+        self._text_file = open(work_dir / "text.f32", 'wb')
+        self._rows = 0
+        self._audio = None
+        self._text = None
+
+    def add(self, song_detail: dict):
+        artist_name = song_detail.get("artist", "")
+        song_title = song_detail.get("song", "")
+
+        if not artist_name or not song_title:
+            print(
+                f"Warning: Skipping song entry in clap_embeddings due to missing artist/song title: {song_detail.get('file_path', 'N/A')}")
+            return
+
+        audio = song_detail.get("audio_embedding")
+        text = song_detail.get("text_embedding")
+        digest = hashlib.sha1(json.dumps(
+            [song_title, song_detail.get("file_path"), song_detail.get("album", ""),
+             song_detail.get("text_embedding_prompt")]).encode('utf-8'))
+        row = -1
+        if audio is not None:
+            if self.dim is None:
+                self.dim = len(audio)
+            row = self._rows
+            audio_bytes = np.asarray(audio, dtype=np.float32).tobytes()
+            text_bytes = np.asarray(text if text is not None else np.zeros(self.dim), dtype=np.float32).tobytes()
+            self._audio_file.write(audio_bytes)
+            self._text_file.write(text_bytes)
+            digest.update(audio_bytes)
+            digest.update(text_bytes if text is not None else b'')
+            self._rows += 1
+        self.artist_digests[TitleMatcher.artist_key(artist_name)].append(digest.digest()[:8])
+
+        self.meta.append((
+            song_title,
+            song_detail.get("file_path"),
+            song_detail.get("album", ""),
+            song_detail.get("text_embedding_prompt"),
+            row,
+            text is not None
+        ))
+        self.lookup[(artist_name.strip().lower(), clean_song_title(song_title))] = len(self.meta) - 1
+
+    def close(self):
+        self._audio_file.close()
+        self._text_file.close()
+        if self._rows:
+            shape = (self._rows, self.dim)
+            self._audio = np.memmap(self.work_dir / "audio.f32", dtype=np.float32, mode='r', shape=shape)
+            self._text = np.memmap(self.work_dir / "text.f32", dtype=np.float32, mode='r', shape=shape)
+
+    def __len__(self):
+        return len(self.lookup)
+
+    def artist_hash(self, artist: str) -> str:
+        """Order-independent hash of every embedding record an artist's albums can match against."""
+        key = TitleMatcher.artist_key(artist)
+        if key not in self._artist_hashes:
+            self._artist_hashes[key] = hashlib.sha1(b''.join(sorted(self.artist_digests.get(key, ())))).hexdigest()
+        return self._artist_hashes[key]
+
+    def song(self, idx):
+        song, file_path, album, prompt, row, has_text = self.meta[idx]
+        return {
+            "song": song,
+            "audio_embedding": None if row < 0 else self._audio[row].tolist(),
+            "text_embedding_prompt": prompt,
+            "text_embedding": self._text[row].tolist() if row >= 0 and has_text else None,
+            "file_path": file_path,
+            "album": album
+        }
+
+
+class JsonAlbumWriter:
+    """Writes {"Albums": [...]} one album at a time instead of dumping a prebuilt list."""
+
+    def __init__(self, output_path: Path):
+        self._file = open(output_path, 'w', encoding='utf-8')
+        self._file.write('{"Albums": [')
+        self._first = True
+
+    def write(self, album_entry: dict):
+        if not self._first:
+            self._file.write(',')
+        self._file.write('\n' + json.dumps(album_entry))
+        self._first = False
+
+    def close(self):
+        self._file.write('\n]}\n')
+        self._file.close()
+
+
+class JsonlAlbumWriter:
+    def __init__(self, output_path: Path):
+        self._file = open(output_path, 'w', encoding='utf-8')
+
+    def write(self, album_entry: dict):
+        self._file.write(json.dumps(album_entry) + '\n')
+
+    def write_raw(self, line: str):
+        self._file.write(line if line.endswith('\n') else line + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class ShardAlbumWriter:
+    """Writes albums straight into the memory-mapped shard store used for out-of-core training."""
+
+    def __init__(self, output_path: Path, dim: int, include_text: bool = False):
+        project_root = Path(__file__).resolve().parent.parent
+        if str(project_root) not in sys.path:
+            sys.path.append(str(project_root))
+        from src.utils.shards import EmbeddingShardWriter
+        self._writer = EmbeddingShardWriter(output_path, dim, include_text=include_text)
+
+    def write(self, album_entry: dict):
+        meta = {key: value for key, value in album_entry.items() if key != "songs"}
+        self._writer.add_album(meta, album_entry["songs"])
+
+    def close(self):
+        self._writer.close()
+
+
+def infer_output_format(output_path: Path) -> str:
+    return {'.json': 'json', '.jsonl': 'jsonl'}.get(output_path.suffix, 'shards')
+
+
+def open_album_writer(output_path: Path, dim: int, output_format: str = None):
+    output_format = output_format or infer_output_format(output_path)
+    if output_format == 'json':
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        return JsonAlbumWriter(output_path)
+    if output_format == 'jsonl':
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        return JsonlAlbumWriter(output_path)
+    return ShardAlbumWriter(output_path, dim)
+
+
+MERGE_STATE_VERSION = 2
+
+
+def merge_state_path(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.name}.merge_state.json")
+
+
+def load_merge_state(output_path: Path, output_format: str, match_threshold: float):
+    """Returns the previous run's {album_title: content_hash} if the output can be patched, else None."""
+    state_path = merge_state_path(output_path)
+    if not state_path.exists() or not output_path.exists():
+        return None
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if (state.get("version") != MERGE_STATE_VERSION or state.get("format") != output_format
+            or state.get("match_threshold") != match_threshold):
+        return None
+    return state.get("albums", {})
+
+
+def save_merge_state(output_path: Path, output_format: str, match_threshold: float, album_hashes: dict):
+    state_path = merge_state_path(output_path)
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": MERGE_STATE_VERSION,
+            "format": output_format,
+            "match_threshold": match_threshold,
+            "albums": album_hashes
+        }, f)
+    os.replace(tmp_path, state_path)
+
+
+def iter_output_records(output_path: Path, output_format: str):
+    """Yields (album_entry, raw_line) from a previous merge output; raw_line is only set for .jsonl."""
+    if output_format == 'jsonl':
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line), line
+    else:
+        for album_entry in iter_json_array(output_path, wrapped=True):
+            yield album_entry, None
+
+
+def album_content_hash(album_title: str, album_data_entry: dict, artist_hash: str, match_threshold: float) -> str:
+    """
+    Hash of everything an album's merged record depends on: its structured entry,
+    the embedding records of all songs its artist could be matched against, and
+    the matching rules (threshold and matcher version) that pick among them.
+    """
+    payload = [album_title, album_data_entry, match_threshold, TitleMatcher.VERSION]
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8'))
+    digest.update(artist_hash.encode('ascii'))
+    return digest.hexdigest()[:16]
+
+
+def resolve_album(album_title_from_key: str, album_data_entry: dict, matcher: TitleMatcher,
+                  song_lookup: SongRowIndex, counts: dict):
+    """Builds the merged output record for one album, or None when none of its songs matched."""
+    album_artist_original = album_data_entry.get("artist")
+    score_str = album_data_entry.get("score")
+    song_titles_from_album_file = album_data_entry.get("songs", [])
+
+    album_score_numeric = None
+    if score_str is not None:
+        try:
+            album_score_numeric = float(score_str)
+        except ValueError:
+            print(
+                f"Warning: Could not convert score '{score_str}' to number for album '{album_title_from_key}'. Leaving as None.")
+
+    songs_with_embeddings_for_this_album = []
+    valid_titles = []
+    for song_title_original_from_album_file in song_titles_from_album_file:
+        if not isinstance(song_title_original_from_album_file, str):
+            print(
+                f"Warning: Skipping non-string song title '{song_title_original_from_album_file}' in album '{album_title_from_key}' by '{album_artist_original}'")
+            continue
+        valid_titles.append(song_title_original_from_album_file)
+
+    matches = matcher.match_album(album_artist_original, [clean_song_title(t) for t in valid_titles])
+    for song_title_original_from_album_file, (song_idx, match_score, match_method) in zip(valid_titles, matches):
+        if song_idx is None:
+            counts["not_found"] += 1
+            continue
+
+        matched_song_detail_from_clap = song_lookup.song(song_idx)
+        counts["matched"] += 1
+        counts[match_method] += 1
+        songs_with_embeddings_for_this_album.append({
+            "song_title": matched_song_detail_from_clap.get("song") or song_title_original_from_album_file,
+            "audio_embedding": matched_song_detail_from_clap.get("audio_embedding"),
+            "text_embedding_prompt": matched_song_detail_from_clap.get("text_embedding_prompt"),
+            "text_embedding": matched_song_detail_from_clap.get("text_embedding"),
+            "file_path": matched_song_detail_from_clap.get("file_path"),
+            "clap_album_title_info": matched_song_detail_from_clap.get("album", ""),
+            "match_score": round(match_score, 4),
+            "match_method": match_method
+        })
+
+    if not songs_with_embeddings_for_this_album:
+        print(
+            f"Info: No songs with embeddings found for album '{album_title_from_key}' by '{album_artist_original}' (songs listed: {len(song_titles_from_album_file)}). Skipping this album in output.")
+        return None
+
+    return {
+        "album_title": album_title_from_key,
+        "artist": album_artist_original,
+        "score": album_score_numeric,
+        "songs": songs_with_embeddings_for_this_album,
+        "genius_url_attempted": album_data_entry.get("genius_url_attempted")
+    }
+
+
+def merge_data(clap_embeddings_path: Path, albums_structured_path: Path, output_path: Path,
+               output_format: str = None, match_threshold: float = 0.8, incremental: bool = True):
     """
     Merges song embeddings with album structural data.
 
+    The embeddings file is streamed: vectors go to temporary float32 row files
+    and only a (artist, title) -> row index is kept in memory. Albums are written
+    out as soon as they are resolved, so peak memory no longer scales with the
+    size of the embeddings dump.
+
+    Every album gets a content hash over its inputs, kept in a
+    `<output>.merge_state.json` file. When `incremental` is set and a previous
+    .json/.jsonl output exists, only added or changed albums are re-resolved;
+    unchanged records are copied over from the old output and removed albums
+    are dropped, then the patched file replaces the old one.
+
     Args:
         clap_embeddings_path (Path): Path to JSON file with song details and embeddings.
                                      (list of song objects)
         albums_structured_path (Path): Path to JSON file with album structure.
                                        (dictionary with album titles as keys)
-        output_path (Path): Path to save the merged JSON output.
+        output_path (Path): Path to save the merged output.
+        output_format (str): 'json', 'jsonl' or 'shards'; inferred from the output suffix when omitted.
+        match_threshold (float): Minimum similarity for a fuzzy title match; 1.0 disables fuzzy matching, leaving
+            exact and normalized matches (case, accents, punctuation, feat./bracketed/remaster suffixes ignored).
+        incremental (bool): Patch a previous output instead of rebuilding it.
     """
-    print(f"Loading song embeddings from: {clap_embeddings_path}")
-    try:
-        with open(clap_embeddings_path, 'r', encoding='utf-8') as f:
-            song_details_list = json.load(f)  # This is a list of song objects
-    except FileNotFoundError:
-        print(f"Error: Clap embeddings file not found at {clap_embeddings_path}")
-        return
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from {clap_embeddings_path}")
-        return
-
     print(f"Loading album structures from: {albums_structured_path}")
     try:
         with open(albums_structured_path, 'r', encoding='utf-8') as f:
@@ -57,103 +376,109 @@ def merge_data(clap_embeddings_path: Path, albums_structured_path: Path, output_
         print(f"Error: Could not decode JSON from {albums_structured_path}")
         return
 
-    song_lookup = {}
-    print("Building song lookup from clap_music_embeddings.json...")
-    for song_detail in song_details_list:
-        artist_name = song_detail.get("artist", "")
-        song_title = song_detail.get("song", "")
-
-        if not artist_name or not song_title:
-            print(
-                f"Warning: Skipping song entry in clap_embeddings due to missing artist/song title: {song_detail.get('file_path', 'N/A')}")
-            continue
-
-        artist_key = artist_name.strip().lower()
-        song_key = clean_song_title(song_title)
-
-        if (artist_key, song_key) in song_lookup:
-            pass
-        song_lookup[(artist_key, song_key)] = song_detail
-    print(f"Built song lookup with {len(song_lookup)} unique (artist, song_title) entries.")
-
-    output_albums_list = []
-    albums_processed_count = 0
-    songs_matched_count = 0
-    songs_not_found_count = 0
+    if not clap_embeddings_path.exists():
+        print(f"Error: Clap embeddings file not found at {clap_embeddings_path}")
+        return
 
-    print("\nProcessing albums from albums_structured_data.json...")
-    for album_title_from_key, album_data_entry in albums_info_dict.items():
-        album_artist_original = album_data_entry.get("artist")
-        score_str = album_data_entry.get("score")
-        song_titles_from_album_file = album_data_entry.get("songs", [])
+    output_format = output_format or infer_output_format(output_path)
+    previous_hashes = None
+    if incremental and output_format != 'shards':
+        previous_hashes = load_merge_state(output_path, output_format, match_threshold)
 
-        if not album_artist_original:
-            print(f"Warning: Skipping album '{album_title_from_key}' due to missing artist field.")
-            continue
-
-        album_score_numeric = None
-        if score_str is not None:
-            try:
-                album_score_numeric = float(score_str)
-            except ValueError:
-                print(
-                    f"Warning: Could not convert score '{score_str}' to number for album '{album_title_from_key}'. Leaving as None.")
-
-        album_artist_lower = album_artist_original.strip().lower()
-        songs_with_embeddings_for_this_album = []
-
-        for song_title_original_from_album_file in song_titles_from_album_file:
-            if not isinstance(song_title_original_from_album_file, str):
-                print(
-                    f"Warning: Skipping non-string song title '{song_title_original_from_album_file}' in album '{album_title_from_key}' by '{album_artist_original}'")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="merge_rows_", dir=output_path.parent) as work_dir:
+        song_lookup = SongRowIndex(Path(work_dir))
+        print(f"Streaming song embeddings from: {clap_embeddings_path}")
+        try:
+            for song_detail in iter_json_array(clap_embeddings_path):
+                song_lookup.add(song_detail)
+        except json.JSONDecodeError:
+            print(f"Error: Could not decode JSON from {clap_embeddings_path}")
+            return
+        finally:
+            song_lookup.close()
+        print(f"Built song lookup with {len(song_lookup)} unique (artist, song_title) entries.")
+
+        matcher = TitleMatcher(threshold=match_threshold)
+        for (artist_name, cleaned_title), song_idx in song_lookup.lookup.items():
+            matcher.add(artist_name, cleaned_title, song_idx)
+
+        album_hashes = {}
+        for album_title_from_key, album_data_entry in albums_info_dict.items():
+            if not album_data_entry.get("artist"):
+                print(f"Warning: Skipping album '{album_title_from_key}' due to missing artist field.")
                 continue
-
-            cleaned_song_title_for_lookup = clean_song_title(song_title_original_from_album_file)
-            lookup_key = (album_artist_lower, cleaned_song_title_for_lookup)
-            matched_song_detail_from_clap = song_lookup.get(lookup_key)
-
-            if matched_song_detail_from_clap:
-                songs_matched_count += 1
-                album_title_from_clap = matched_song_detail_from_clap.get("album", "")
-
-                song_data_for_output = {
-                    "song_title": matched_song_detail_from_clap.get("song", song_title_original_from_album_file),
-                    "audio_embedding": matched_song_detail_from_clap.get("audio_embedding"),
-                    "text_embedding_prompt": matched_song_detail_from_clap.get("text_embedding_prompt"),
-                    "text_embedding": matched_song_detail_from_clap.get("text_embedding"),
-                    "file_path": matched_song_detail_from_clap.get("file_path"),
-                    "clap_album_title_info": album_title_from_clap
-                }
-                songs_with_embeddings_for_this_album.append(song_data_for_output)
-            else:
-                songs_not_found_count += 1
-
-        if songs_with_embeddings_for_this_album:
-            output_album_entry = {
-                "album_title": album_title_from_key,
-                "artist": album_artist_original,
-                "score": album_score_numeric,
-                "songs": songs_with_embeddings_for_this_album,
-                "genius_url_attempted": album_data_entry.get("genius_url_attempted")
-            }
-            output_albums_list.append(output_album_entry)
-            albums_processed_count += 1
+            album_hashes[album_title_from_key] = album_content_hash(
+                album_title_from_key, album_data_entry, song_lookup.artist_hash(album_data_entry["artist"]),
+                match_threshold)
+
+        counts = {"matched": 0, "not_found": 0, "exact": 0, "normalized": 0, "fuzzy": 0}
+        albums_processed_count = 0
+        albums_copied_count = 0
+
+        def resolve(album_title_from_key):
+            album_entry = resolve_album(album_title_from_key, albums_info_dict[album_title_from_key], matcher,
+                                        song_lookup, counts)
+            if album_entry is not None:
+                album_entry["content_hash"] = album_hashes[album_title_from_key]
+            return album_entry
+
+        target_path = output_path
+        if previous_hashes is not None:
+            target_path = output_path.with_name(output_path.name + ".patch")
+            print(f"\nPatching previous output ({len(previous_hashes)} albums in merge state)...")
         else:
-            print(
-                f"Info: No songs with embeddings found for album '{album_title_from_key}' by '{album_artist_original}' (songs listed: {len(song_titles_from_album_file)}). Skipping this album in output.")
-
-    final_output_data = {"Albums": output_albums_list}
+            print("\nProcessing albums from albums_structured_data.json...")
+
+        writer = open_album_writer(target_path, song_lookup.dim or 0, output_format)
+        try:
+            pending = list(album_hashes)
+            if previous_hashes is not None:
+                written = set()
+                for old_entry, raw_line in iter_output_records(output_path, output_format):
+                    album_title_from_key = old_entry.get("album_title")
+                    if album_title_from_key not in album_hashes or album_title_from_key in written:
+                        continue
+                    written.add(album_title_from_key)
+                    if previous_hashes.get(album_title_from_key) == album_hashes[album_title_from_key]:
+                        if raw_line is not None:
+                            writer.write_raw(raw_line)
+                        else:
+                            writer.write(old_entry)
+                        albums_copied_count += 1
+                        continue
+                    album_entry = resolve(album_title_from_key)
+                    if album_entry is not None:
+                        writer.write(album_entry)
+                        albums_processed_count += 1
+                # New albums, and changed albums that had no output record last time.
+                pending = [t for t, h in album_hashes.items()
+                           if t not in written and previous_hashes.get(t) != h]
+
+            for album_title_from_key in pending:
+                album_entry = resolve(album_title_from_key)
+                if album_entry is not None:
+                    writer.write(album_entry)
+                    albums_processed_count += 1
+        finally:
+            writer.close()
+
+    if target_path != output_path:
+        os.replace(target_path, output_path)
+    if output_format != 'shards':
+        save_merge_state(output_path, output_format, match_threshold, album_hashes)
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
     print(f"\n--- Summary ---")
     print(f"Total album entries in albums_structured_data: {len(albums_info_dict)}")
-    print(f"Albums added to output (with at least one matched song): {albums_processed_count}")
-    print(f"Total songs from album files matched with embeddings: {songs_matched_count}")
-    print(f"Total songs listed in albums but not found in embeddings: {songs_not_found_count}")
-
-    print(f"Saving merged data to: {output_path}")
-    with open(output_path, 'w', encoding='utf-8') as outfile:
-        json.dump(final_output_data, outfile, indent=2)
+    if previous_hashes is not None:
+        removed = sum(1 for t in previous_hashes if t not in album_hashes)
+        print(f"Albums copied unchanged from the previous output: {albums_copied_count}")
+        print(f"Albums removed since the previous merge: {removed}")
+    print(f"Albums (re)computed and added to output (with at least one matched song): {albums_processed_count}")
+    print(f"Total songs from album files matched with embeddings: {counts['matched']}")
+    print(f"  by method: {counts['exact']} exact, {counts['normalized']} normalized, {counts['fuzzy']} fuzzy")
+    print(f"Total songs listed in albums but not found in embeddings: {counts['not_found']}")
+    print(f"Merged data saved to: {output_path}")
     print("Done.")
 
 
@@ -177,11 +502,25 @@ def main():
     )
     parser.add_argument(
         "--output", type=Path, default=default_output_path,
-        help="Path to save the merged JSON output."
+        help="Path to save the merged output (.json, .jsonl, or a directory for embedding shards)."
+    )
+    parser.add_argument(
+        "--format", choices=("json", "jsonl", "shards"), default=None,
+        help="Output format; inferred from the --output suffix when omitted."
+    )
+    parser.add_argument(
+        "--match-threshold", type=float, default=0.8,
+        help="Minimum fuzzy title similarity (0-1); 1.0 disables fuzzy matching but still matches titles "
+             "that are equal after normalization (case, accents, punctuation, feat./remaster suffixes)."
+    )
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Rebuild the output from scratch instead of patching only changed albums."
     )
     args = parser.parse_args()
 
-    merge_data(args.clap_embeddings, args.album_structures, args.output)
+    merge_data(args.clap_embeddings, args.album_structures, args.output, args.format, args.match_threshold,
+               incremental=not args.full)
 
 
 if __name__ == "__main__":
@@ -1,48 +1,106 @@
 import json
 import requests
 import os
+import sys
 import time
 import re
 from urllib.parse import quote_plus
 from bs4 import BeautifulSoup
 import urllib3
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 from threading import Lock
 import asyncio
 import aiohttp
 import aiofiles
 from functools import lru_cache
 
+from download_cache import ResolutionCache
+from download_manifest import DownloadManifest, finalize_part, part_path, resume_plan, scan_library
+from download_telemetry import OVERLOAD_STATUSES, AdaptiveLimiter, Telemetry
+from http_record import mount, wrap_session
+
+# audio_cache is imported by file rather than as src.embeddings.audio_cache so that neither this process nor
+# the normalization workers pull in torch / laion_clap through the src package __init__.
+EMBEDDINGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "embeddings")
+if EMBEDDINGS_DIR not in sys.path:
+    sys.path.append(EMBEDDINGS_DIR)
+from audio_cache import AudioCache, BackgroundNormalizer
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
 class FastMusifyDownloader:
-    def __init__(self, download_folder="data/raw/albums", max_concurrent=8):
-        self.base_url = "https://musify.club"
+    def __init__(self, download_folder="data/raw/albums", max_concurrent=8, base_url="https://musify.club",
+                 cache=None, audio_cache_dir=None, normalize_workers=2, on_download=None):
+        self.base_url = base_url.rstrip('/')
         self.search_url = f"{self.base_url}/search"
         self.download_folder = download_folder
         self.max_concurrent = max_concurrent
-        self.session_lock = Lock()
-
-        self.session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(
-            pool_connections=20,
-            pool_maxsize=20,
-            max_retries=3,
-            pool_block=False
-        )
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter)
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
             'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
-        })
+        }
+        # requests.Session is not thread-safe, so every worker thread gets its own
+        # keep-alive session instead of all of them queueing on one shared session.
+        self._local = threading.local()
+        self._executor = None
         os.makedirs(self.download_folder, exist_ok=True)
+        self.cache = cache or ResolutionCache(os.path.join(self.download_folder, ".resolve_cache.sqlite3"))
+        self.manifest = DownloadManifest(self.download_folder)
+        # Optional post-download stage: decode each new file to the 48 kHz mono CLAP input cache in a process pool.
+        self.normalizer = None
+        if audio_cache_dir is not None:
+            self.normalizer = BackgroundNormalizer(AudioCache(audio_cache_dir, self.download_folder), normalize_workers)
+        # Called with the path of every newly verified file, e.g. to stream it into embedding.
+        self.on_download = on_download
         self.search_cache = {}
+        self.search_cache_lock = Lock()
+        self._search_inflight = {}
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=4,
+                max_retries=3,
+                pool_block=False
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            mount(session, max_retries=3)
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    @property
+    def executor(self):
+        # One long-lived pool for all albums, so worker threads keep their sessions warm between albums.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent)
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self.normalizer is not None:
+            normalized, failed = self.normalizer.close()
+            print(f"Sync: Normalized {normalized} files for the audio cache ({failed} failed).")
+            self.normalizer = None
+
+    def _downloaded(self, file_path):
+        if self.normalizer is not None:
+            self.normalizer.submit(file_path)
+        if self.on_download is not None:
+            self.on_download(file_path)
 
     @lru_cache(maxsize=1000)
     def sanitize_filename(self, filename):
@@ -52,96 +110,127 @@ class FastMusifyDownloader:
 
     def search_track(self, artist, song_title):
         cache_key = f"{artist}|||{song_title}".lower()
-        if cache_key in self.search_cache:
-            return self.search_cache[cache_key]
-        query = f"{artist} {song_title}"
+        with self.search_cache_lock:
+            if cache_key in self.search_cache:
+                return self.search_cache[cache_key]
+            # Concurrent searches for the same track wait for the first one instead of repeating it.
+            event = self._search_inflight.get(cache_key)
+            owner = event is None
+            if owner:
+                event = self._search_inflight[cache_key] = threading.Event()
+        if not owner:
+            event.wait()
+            with self.search_cache_lock:
+                return self.search_cache.get(cache_key)
+
+        track_url = None
         try:
-            search_params = {'searchText': query}
-            with self.session_lock:
-                response = self.session.get(self.search_url, params=search_params, timeout=10)
-                response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            track_links = soup.find_all('a', href=lambda x: x and '/track/' in x)
-            for link in track_links:
-                text_content = link.get_text(separator=" ", strip=True).lower()
-                if artist.lower() in text_content and song_title.lower() in text_content:
-                    href = link.get('href', '')
-                    track_url = self.base_url + href if not href.startswith('http') else href
-                    self.search_cache[cache_key] = track_url
-                    return track_url
-            if track_links:
-                href = track_links[0].get('href', '')
-                track_url = self.base_url + href if not href.startswith('http') else href
-                self.search_cache[cache_key] = track_url
-                return track_url
-            self.search_cache[cache_key] = None
-            return None
+            hit, track_url = self.cache.get_search(artist, song_title)
+            if not hit:
+                track_url = self._search_track_uncached(artist, song_title)
+                self.cache.put_search(artist, song_title, track_url)
         except Exception as e:
-            print(f"Error searching for {query}: {str(e)}")
-            self.search_cache[cache_key] = None
-            return None
+            # Failed lookups are not persisted, so the next run searches again.
+            print(f"Error searching for {artist} {song_title}: {str(e)}")
+        finally:
+            with self.search_cache_lock:
+                self.search_cache[cache_key] = track_url
+                del self._search_inflight[cache_key]
+            event.set()
+        return track_url
+
+    def _search_track_uncached(self, artist, song_title):
+        search_params = {'searchText': f"{artist} {song_title}"}
+        response = self.session.get(self.search_url, params=search_params, timeout=10)
+        response.raise_for_status()
+        soup = BeautifulSoup(response.content, 'html.parser')
+        track_links = soup.find_all('a', href=lambda x: x and '/track/' in x)
+        for link in track_links:
+            text_content = link.get_text(separator=" ", strip=True).lower()
+            if artist.lower() in text_content and song_title.lower() in text_content:
+                href = link.get('href', '')
+                return self.base_url + href if not href.startswith('http') else href
+        if track_links:
+            href = track_links[0].get('href', '')
+            return self.base_url + href if not href.startswith('http') else href
+        return None
 
     def get_download_link(self, track_url):
+        hit, download_url = self.cache.get_link(track_url)
+        if hit:
+            return download_url
         try:
-            with self.session_lock:
-                response = self.session.get(track_url, timeout=10)
-                response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            selectors = [
-                'div.playlist_actions.track_page > a.songplay_btn',
-                'a.songplay_btn[href*="download"]', 'a.btn[href*="download"]',
-                'a[class*="songplay_btn"]', '.playlist_actions a.btn',
-                'a.btn-outline-primary'
-            ]
-            for selector in selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    href = element.get('href')
-                    text = element.get_text().lower()
-                    if href and any(keyword in text for keyword in ['скачать', 'download', 'mp3']):
-                        download_url = self.base_url + href if not href.startswith('http') else href
-                        return download_url
-            return None
+            response = self.session.get(track_url, timeout=10)
+            response.raise_for_status()
         except Exception as e:
             print(f"Error getting download link from {track_url}: {str(e)}")
             return None
+        download_url = self.extract_download_link(response.content)
+        self.cache.put_link(track_url, download_url)
+        return download_url
 
-    def download_file_sync(self, url, file_path):
-        try:
-            if not url.startswith('http'): url = self.base_url + url
-            directory = os.path.dirname(file_path)
-            os.makedirs(directory, exist_ok=True)
+    def extract_download_link(self, html):
+        soup = BeautifulSoup(html, 'html.parser')
+        selectors = [
+            'div.playlist_actions.track_page > a.songplay_btn',
+            'a.songplay_btn[href*="download"]', 'a.btn[href*="download"]',
+            'a[class*="songplay_btn"]', '.playlist_actions a.btn',
+            'a.btn-outline-primary'
+        ]
+        for selector in selectors:
+            elements = soup.select(selector)
+            for element in elements:
+                href = element.get('href')
+                text = element.get_text().lower()
+                if href and any(keyword in text for keyword in ['скачать', 'download', 'mp3']):
+                    return self.base_url + href if not href.startswith('http') else href
+        return None
 
-            response = self.session.get(url, stream=True, timeout=60)
-            response.raise_for_status()
-            content_type = response.headers.get('content-type', '').lower()
-            if 'html' in content_type:
-                print(f"Skipping HTML page mistaken for download: {url}")
-                return False
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192 * 4):
-                    if chunk: f.write(chunk)
-            file_size = os.path.getsize(file_path)
-            if file_size < 50 * 1024:
-                os.remove(file_path)
-                print(f"Removed small/invalid file: {file_path} ({file_size} bytes)")
-                return False
-            return True
-        except Exception as e:
-            print(f"Error downloading file {url}: {str(e)}")
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError:
-                    pass
-            return False
+    def download_file_sync(self, url, file_path, attempts=3):
+        """
+        Streams into `<file>.part`, resuming it with a Range request when a
+        previous attempt (in this run or an earlier one) left one behind, and
+        moves it into place only once its length and audio header check out.
+        """
+        if not url.startswith('http'): url = self.base_url + url
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        part = part_path(file_path)
+        for attempt in range(1, attempts + 1):
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with self.session.get(url, stream=True, timeout=60, headers=headers) as response:
+                    if response.status_code == 416:
+                        # The server rejects our offset; the part is stale, so start over.
+                        os.remove(part)
+                        continue
+                    response.raise_for_status()
+                    if 'html' in response.headers.get('content-type', '').lower():
+                        print(f"Skipping HTML page mistaken for download: {url}")
+                        return False
+                    plan = resume_plan(response.status_code, response.headers, offset)
+                    if plan is None:
+                        os.remove(part)
+                        continue
+                    write_offset, expected_total = plan
+                    with open(part, 'ab' if write_offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=8192 * 4):
+                            if chunk: f.write(chunk)
+                ok, reason = finalize_part(part, file_path, expected_total, self.manifest)
+                if ok:
+                    return True
+                print(f"Attempt {attempt}/{attempts} for {file_path}: {reason}")
+            except Exception as e:
+                # The .part file is kept, so the next attempt only fetches the missing tail.
+                print(f"Attempt {attempt}/{attempts} downloading {url} failed: {str(e)}")
+        return False
 
     def download_single_track(self, args_tuple):
         artist, song, album_folder, track_num, total_tracks = args_tuple
         print(f"[{track_num}/{total_tracks}] Sync: Processing: {artist} - {song}")
         safe_filename = self.sanitize_filename(f"{song}.mp3")
         file_path = os.path.join(album_folder, safe_filename)
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 50 * 1024:
+        if self.manifest.get(file_path) is not None:
             print(f"Sync: File already exists: {safe_filename}")
             return True, song
         track_url = self.search_track(artist, song)
@@ -154,8 +243,11 @@ class FastMusifyDownloader:
             return False, song
         if self.download_file_sync(download_url, file_path):
             print(f"Sync: Downloaded: {artist} - {song}")
+            self._downloaded(file_path)
             return True, song
         else:
+            # The download URL may have expired; resolve it again next time.
+            self.cache.invalidate_link(track_url)
             print(f"Sync: Download failed: {artist} - {song}")
             return False, song
 
@@ -172,63 +264,46 @@ class FastMusifyDownloader:
         download_args = [(artist, song, album_folder, i + 1, len(songs)) for i, song in enumerate(songs)]
         successful_downloads, failed_downloads = 0, 0
 
-        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
-            future_to_song = {executor.submit(self.download_single_track, args): args[1] for args in download_args}
-            for future in as_completed(future_to_song):
-                try:
-                    success, _ = future.result()
-                    if success:
-                        successful_downloads += 1
-                    else:
-                        failed_downloads += 1
-                except Exception as e:
-                    print(f"Sync: Exception for {future_to_song[future]}: {str(e)}")
+        future_to_song = {self.executor.submit(self.download_single_track, args): args[1] for args in download_args}
+        for future in as_completed(future_to_song):
+            try:
+                success, _ = future.result()
+                if success:
+                    successful_downloads += 1
+                else:
                     failed_downloads += 1
+            except Exception as e:
+                print(f"Sync: Exception for {future_to_song[future]}: {str(e)}")
+                failed_downloads += 1
         print(f"\nAlbum '{album_name}' (Sync) completed! Successful: {successful_downloads}, Failed: {failed_downloads}")
         return successful_downloads, failed_downloads
 
     def pre_scan_existing_files(self, albums_data):
         print("Sync: Pre-scanning existing files...")
-        total_tracks_overall = 0
-        existing_files_count = 0
-        tracks_to_download_list = []
-
-        for album_name, album_info in albums_data.items():
-            artist = album_info['artist']
-            songs = album_info['songs']
-            artist_folder = os.path.join(self.download_folder, self.sanitize_filename(artist))
-            album_folder = os.path.join(artist_folder, self.sanitize_filename(album_name))
-
-            current_album_tracks_to_download = []
-            for song in songs:
-                total_tracks_overall += 1
-                safe_filename = self.sanitize_filename(f"{song}.mp3")
-                file_path = os.path.join(album_folder, safe_filename)
-                if os.path.exists(file_path) and os.path.getsize(file_path) > 50 * 1024:
-                    existing_files_count += 1
-                else:
-                    current_album_tracks_to_download.append(song)
-
-            if current_album_tracks_to_download:
-                tracks_to_download_list.append({
-                    album_name: {
-                        "artist": artist,
-                        "songs": current_album_tracks_to_download
-                    }
-                })
-
-        print(f"Sync: Found {existing_files_count}/{total_tracks_overall} files already downloaded.")
-        return tracks_to_download_list, total_tracks_overall - existing_files_count
+        tracks_to_download_list, pending, total_tracks_overall = scan_library(
+            albums_data, self.download_folder, self.sanitize_filename, self.manifest)
+        print(f"Sync: Found {total_tracks_overall - pending}/{total_tracks_overall} files already downloaded.")
+        return tracks_to_download_list, pending
 
 
 class AsyncMusifyDownloader:
-    def __init__(self, download_folder="data/raw/albums", max_concurrent_downloads=10, max_concurrent_requests=10):
-        self.base_url = "https://musify.club"
+    def __init__(self, download_folder="data/raw/albums", max_concurrent_downloads=10, max_concurrent_requests=10,
+                 base_url="https://musify.club", cache=None, max_downloads_limit=None, max_requests_limit=None,
+                 audio_cache_dir=None, normalize_workers=2, on_download=None, manifest=None):
+        self.base_url = base_url.rstrip('/')
         self.search_url = f"{self.base_url}/search"
         self.download_folder = download_folder
 
-        self.request_semaphore = asyncio.Semaphore(max_concurrent_requests)
-        self.download_semaphore = asyncio.Semaphore(max_concurrent_downloads)
+        # The max_concurrent_* values are only starting points: the limiters grow them while the host keeps up
+        # and back off on 429s, timeouts and connection errors, up to max_*_limit (default 4x the start).
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.request_limiter = AdaptiveLimiter(max_concurrent_requests, maximum=max_requests_limit)
+        self.download_limiter = AdaptiveLimiter(max_concurrent_downloads, maximum=max_downloads_limit)
+        self.telemetry = Telemetry()
+        self.telemetry.stage("search", self.request_limiter)
+        self.telemetry.stage("resolve", self.request_limiter)
+        self.telemetry.stage("download", self.download_limiter)
 
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -241,6 +316,21 @@ class AsyncMusifyDownloader:
 
         self.search_cache = {}
         self.search_cache_lock = asyncio.Lock()
+        self.cache = cache or ResolutionCache(os.path.join(self.download_folder, ".resolve_cache.sqlite3"))
+        # May be shared with an on_download consumer that reads the entries of new files.
+        self.manifest = manifest or DownloadManifest(self.download_folder)
+        # Optional post-download stage: decode each new file to the 48 kHz mono CLAP input cache in a process pool.
+        self.normalizer = None
+        if audio_cache_dir is not None:
+            self.normalizer = BackgroundNormalizer(AudioCache(audio_cache_dir, self.download_folder), normalize_workers)
+        # Called with the path of every newly verified file, e.g. to stream it into embedding.
+        self.on_download = on_download
+
+    def _downloaded(self, file_path):
+        if self.normalizer is not None:
+            self.normalizer.submit(file_path)
+        if self.on_download is not None:
+            self.on_download(file_path)
 
     @lru_cache(maxsize=1000)
     def sanitize_filename(self, filename):
@@ -248,17 +338,28 @@ class AsyncMusifyDownloader:
         filename = re.sub(r'\s+', ' ', filename).strip()
         return filename
 
-    async def _fetch_html(self, session, url, params=None, timeout_seconds=10):
+    def _observe(self, stage, limiter, started, status, failed):
+        self.telemetry.stages[stage].record(time.monotonic() - started, status, error=failed)
+        # A missing status on failure means a timeout or connection error, which is treated as congestion too.
+        limiter.feedback(ok=not failed, overloaded=status in OVERLOAD_STATUSES or (failed and status is None))
+
+    async def _fetch_html(self, session, url, params=None, timeout_seconds=10, stage="search"):
+        started, status, failed = time.monotonic(), None, True
         try:
-            async with self.request_semaphore:
+            async with self.request_limiter:
                 async with session.get(url, params=params, headers=self.headers, timeout=timeout_seconds,
                                        ssl=False) as response:
+                    status = response.status
                     response.raise_for_status()
-                    return await response.text()
+                    text = await response.text()
+                    failed = False
+                    return text
         except asyncio.TimeoutError:
             print(f"Timeout error fetching {url}")
         except aiohttp.ClientError as e:
             print(f"Client error fetching {url}: {e}")
+        finally:
+            self._observe(stage, self.request_limiter, started, status, failed)
         return None
 
     async def search_track_async(self, session, artist, song_title):
@@ -268,6 +369,12 @@ class AsyncMusifyDownloader:
             if cache_key in self.search_cache:
                 return self.search_cache[cache_key]
 
+        hit, track_url = await self.cache.aget_search(artist, song_title)
+        if hit:
+            async with self.search_cache_lock:
+                self.search_cache[cache_key] = track_url
+            return track_url
+
         query = f"{artist} {song_title}"
         html_content = await self._fetch_html(session, self.search_url, params={'searchText': query})
 
@@ -293,10 +400,15 @@ class AsyncMusifyDownloader:
 
         async with self.search_cache_lock:
             self.search_cache[cache_key] = found_url
+        await self.cache.aput_search(artist, song_title, found_url)
         return found_url
 
     async def get_download_link_async(self, session, track_url):
-        html_content = await self._fetch_html(session, track_url)
+        hit, download_url = await self.cache.aget_link(track_url)
+        if hit:
+            return download_url
+
+        html_content = await self._fetch_html(session, track_url, stage="resolve")
         if not html_content:
             return None
 
@@ -307,177 +419,196 @@ class AsyncMusifyDownloader:
             'a[class*="songplay_btn"]', '.playlist_actions a.btn',
             'a.btn-outline-primary'
         ]
+        download_url = None
         for selector in selectors:
-            elements = soup.select(selector)
-            for element in elements:
+            for element in soup.select(selector):
                 href = element.get('href')
                 text = element.get_text().lower()
                 if href and any(keyword in text for keyword in ['скачать', 'download', 'mp3']):
                     download_url = self.base_url + href if not href.startswith('http') else href
-                    return download_url
-        return None
-
-    async def download_file_async(self, session, url, file_path):
-        try:
-            if not url.startswith('http'): url = self.base_url + url
-
-            directory = os.path.dirname(file_path)
-            os.makedirs(directory, exist_ok=True)
-
-            async with self.download_semaphore:
-                timeout = aiohttp.ClientTimeout(total=120, connect=20)
-                async with session.get(url, headers=self.headers, timeout=timeout, ssl=False) as response:
-                    response.raise_for_status()
-
-                    content_type = response.headers.get('content-type', '').lower()
-                    if 'html' in content_type:
-                        print(f"Skipping HTML page mistaken for download: {url}")
-                        return False
-
-                    async with aiofiles.open(file_path, 'wb') as f:
-                        while True:
-                            chunk = await response.content.read(8192 * 4)
-                            if not chunk:
-                                break
-                            await f.write(chunk)
-
-            file_size = os.path.getsize(file_path)
-            if file_size < 50 * 1024:
-                await aiofiles.os.remove(file_path)
-                print(f"Removed small/invalid file: {file_path} ({file_size} bytes)")
-                return False
-            return True
-        except asyncio.TimeoutError:
-            print(f"Timeout downloading file: {url}")
-        except aiohttp.ClientError as e:
-            print(f"Client error downloading file {url}: {e}")
-        except Exception as e:
-            print(f"Generic error downloading file {url}: {str(e)}")
-
-        try:
-            if await aiofiles.os.path.exists(file_path):
-                await aiofiles.os.remove(file_path)
-        except Exception:
-            pass
+                    break
+            if download_url:
+                break
+        await self.cache.aput_link(track_url, download_url)
+        return download_url
+
+    async def download_file_async(self, session, url, file_path, attempts=3):
+        """
+        Async counterpart of FastMusifyDownloader.download_file_sync: ranged
+        resume into `<file>.part`, then length and header verification before
+        the atomic rename and the manifest entry.
+        """
+        if not url.startswith('http'): url = self.base_url + url
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        part = part_path(file_path)
+        timeout = aiohttp.ClientTimeout(total=120, connect=20)
+        download_stats = self.telemetry.stages["download"]
+        for attempt in range(1, attempts + 1):
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = dict(self.headers, Range=f'bytes={offset}-') if offset else self.headers
+            started, status, failed = time.monotonic(), None, True
+            try:
+                async with self.download_limiter:
+                    async with session.get(url, headers=headers, timeout=timeout, ssl=False) as response:
+                        status = response.status
+                        if response.status == 416:
+                            # The server rejects our offset; the part is stale, so start over.
+                            await asyncio.to_thread(os.remove, part)
+                            continue
+                        response.raise_for_status()
+                        if 'html' in response.headers.get('content-type', '').lower():
+                            print(f"Skipping HTML page mistaken for download: {url}")
+                            return False
+                        plan = resume_plan(response.status, response.headers, offset)
+                        if plan is None:
+                            await asyncio.to_thread(os.remove, part)
+                            continue
+                        write_offset, expected_total = plan
+                        async with aiofiles.open(part, 'ab' if write_offset else 'wb') as f:
+                            while True:
+                                chunk = await response.content.read(8192 * 4)
+                                if not chunk:
+                                    break
+                                await f.write(chunk)
+                                download_stats.add_bytes(len(chunk))
+                        failed = False
+                ok, reason = await asyncio.to_thread(finalize_part, part, file_path, expected_total, self.manifest)
+                if ok:
+                    return True
+                print(f"Attempt {attempt}/{attempts} for {file_path}: {reason}")
+            except asyncio.TimeoutError:
+                print(f"Attempt {attempt}/{attempts}: timeout downloading file: {url}")
+            except aiohttp.ClientError as e:
+                print(f"Attempt {attempt}/{attempts}: client error downloading file {url}: {e}")
+            except Exception as e:
+                print(f"Attempt {attempt}/{attempts}: generic error downloading file {url}: {str(e)}")
+            finally:
+                self._observe("download", self.download_limiter, started, status, failed)
         return False
 
-    async def download_single_track_async(self, session, artist, song, album_name, track_num, total_tracks):
-        print(f"[{track_num}/{total_tracks}] Async: Processing: {artist} - {song}")
-
-        artist_folder = os.path.join(self.download_folder, self.sanitize_filename(artist))
-        album_folder = os.path.join(artist_folder, self.sanitize_filename(album_name))
-
-        safe_filename = self.sanitize_filename(f"{song}.mp3")
-        file_path = os.path.join(album_folder, safe_filename)
-
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 50 * 1024:
-            print(f"Async: File already exists: {safe_filename}")
-            return True, song
-
-        track_url = await self.search_track_async(session, artist, song)
-        if not track_url:
-            print(f"Async: Could not find: {artist} - {song}")
-            return False, song
-
-        download_url = await self.get_download_link_async(session, track_url)
-        if not download_url:
-            print(f"Async: No download link: {artist} - {song}")
-            return False, song
-
-        if await self.download_file_async(session, download_url, file_path):
-            print(f"Async: Downloaded: {artist} - {song}")
-            return True, song
-        else:
-            print(f"Async: Download failed: {artist} - {song}")
-            return False, song
-
-    async def download_album_tracks_async(self, session, album_data_item):
-        album_name = list(album_data_item.keys())[0]
-        album_info = album_data_item[album_name]
-        artist = album_info['artist']
-        songs = album_info['songs']
-
-        print(f"\nProcessing Album (Async): {album_name} by {artist} ({len(songs)} tracks)")
-
-        artist_folder = os.path.join(self.download_folder, self.sanitize_filename(artist))
-        album_folder = os.path.join(artist_folder, self.sanitize_filename(album_name))
-        os.makedirs(album_folder, exist_ok=True)
-
-        tasks = []
-        for i, song in enumerate(songs):
-            task = self.download_single_track_async(
-                session, artist, song, album_name, i + 1, len(songs)
-            )
-            tasks.append(task)
-
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        successful_downloads = 0
-        failed_downloads = 0
-        for res in results:
-            if isinstance(res, Exception):
-                print(f"Task resulted in exception: {res}")
-                failed_downloads += 1
-            elif isinstance(res, tuple) and len(res) == 2:
-                success, _ = res
-                if success:
-                    successful_downloads += 1
-                else:
-                    failed_downloads += 1
-            else:
-                print(f"Unexpected result from task: {res}")
-                failed_downloads += 1
-
-        print(f"\nAlbum '{album_name}' (Async) completed! Successful: {successful_downloads}, Failed: {failed_downloads}")
-        return successful_downloads, failed_downloads
-
-    async def process_all_albums_async(self, albums_data_list):
+    async def process_all_albums_async(self, albums_data_list, queue_size=256, report_path=None,
+                                       report_interval=10.0):
+        """
+        Runs every pending track of every album through one global pipeline.
+
+        Tracks flow search -> link resolution -> download through bounded queues,
+        each stage served by its own fixed pool of worker tasks, so a small album
+        never leaves the connection budget idle while the next one waits. Albums
+        are still reported individually as their last track finishes.
+
+        Each stage has as many workers as its limiter's ceiling; the adaptive
+        limiters decide how many of them actually hold a connection. A
+        telemetry line is printed every `report_interval` seconds and a JSON
+        summary is written to `report_path` (default: download_report.json in
+        the download folder) at the end.
+        """
         conn = aiohttp.TCPConnector(limit=100, limit_per_host=20, ssl=False)
-        async with aiohttp.ClientSession(connector=conn) as session:
-            total_successful_overall = 0
-            total_failed_overall = 0
-
-            for album_data_item in albums_data_list:
-                successful, failed = await self.download_album_tracks_async(session, album_data_item)
-                total_successful_overall += successful
-                total_failed_overall += failed
-
-            return total_successful_overall, total_failed_overall
+        search_queue = asyncio.Queue(maxsize=queue_size)
+        resolve_queue = asyncio.Queue(maxsize=queue_size)
+        download_queue = asyncio.Queue(maxsize=queue_size)
+        albums = {}
+        totals = {"successful": 0, "failed": 0}
+
+        def finish(job, success, message):
+            print(f"[{job['track_num']}/{job['total_tracks']}] Async: {message}: {job['artist']} - {job['song']}")
+            album = albums[(job['artist'], job['album_name'])]
+            album["successful" if success else "failed"] += 1
+            totals["successful" if success else "failed"] += 1
+            if album["successful"] + album["failed"] == album["total"]:
+                print(f"\nAlbum '{job['album_name']}' (Async) completed! "
+                      f"Successful: {album['successful']}, Failed: {album['failed']}")
+
+        async def stage(queue, handle):
+            while True:
+                job = await queue.get()
+                try:
+                    await handle(job)
+                except Exception as e:
+                    finish(job, False, f"Exception {e!r}")
+                finally:
+                    queue.task_done()
+
+        async with wrap_session(aiohttp.ClientSession(connector=conn)) as session:
+
+            async def search(job):
+                job["track_url"] = await self.search_track_async(session, job['artist'], job['song'])
+                if not job["track_url"]:
+                    finish(job, False, "Could not find")
+                    return
+                await resolve_queue.put(job)
+
+            async def resolve(job):
+                job["download_url"] = await self.get_download_link_async(session, job["track_url"])
+                if not job["download_url"]:
+                    finish(job, False, "No download link")
+                    return
+                await download_queue.put(job)
+
+            async def download(job):
+                if await self.download_file_async(session, job["download_url"], job["file_path"]):
+                    self._downloaded(job["file_path"])
+                    finish(job, True, "Downloaded")
+                else:
+                    await self.cache.ainvalidate_link(job["track_url"])
+                    finish(job, False, "Download failed")
+
+            workers = (
+                [asyncio.create_task(stage(search_queue, search)) for _ in range(self.request_limiter.maximum)] +
+                [asyncio.create_task(stage(resolve_queue, resolve)) for _ in range(self.request_limiter.maximum)] +
+                [asyncio.create_task(stage(download_queue, download)) for _ in range(self.download_limiter.maximum)] +
+                [asyncio.create_task(self.telemetry.report_periodically(report_interval))]
+            )
+            self.telemetry.restart()
+            try:
+                for album_data_item in albums_data_list:
+                    album_name = list(album_data_item.keys())[0]
+                    artist = album_data_item[album_name]['artist']
+                    songs = album_data_item[album_name]['songs']
+                    album_folder = os.path.join(self.download_folder, self.sanitize_filename(artist),
+                                                self.sanitize_filename(album_name))
+                    os.makedirs(album_folder, exist_ok=True)
+                    albums[(artist, album_name)] = {"total": len(songs), "successful": 0, "failed": 0}
+                    print(f"\nQueueing Album (Async): {album_name} by {artist} ({len(songs)} tracks)")
+
+                    for i, song in enumerate(songs):
+                        job = {
+                            "album_name": album_name, "artist": artist, "song": song,
+                            "track_num": i + 1, "total_tracks": len(songs),
+                            "file_path": os.path.join(album_folder, self.sanitize_filename(f"{song}.mp3"))
+                        }
+                        if self.manifest.get(job["file_path"]) is not None:
+                            finish(job, True, "File already exists")
+                            continue
+                        await search_queue.put(job)
+
+                # Each stage hands a job on before marking it done, so joining in order drains the pipeline.
+                await search_queue.join()
+                await resolve_queue.join()
+                await download_queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        if self.normalizer is not None:
+            normalized, failed = await asyncio.to_thread(self.normalizer.close)
+            print(f"Async: Normalized {normalized} files for the audio cache ({failed} failed).")
+            self.normalizer = None
+
+        report_path = report_path or os.path.join(self.download_folder, "download_report.json")
+        await asyncio.to_thread(self.telemetry.write_report, report_path,
+                                          successful=totals["successful"], failed=totals["failed"])
+        print(f"[telemetry] {self.telemetry.format_line()}")
+        print(f"Telemetry report written to {report_path}")
+        return totals["successful"], totals["failed"]
 
     async def pre_scan_existing_files_async(self, albums_data):
         print("Async: Pre-scanning existing files...")
-        total_tracks_overall = 0
-        existing_files_count = 0
-        tracks_to_download_list = []
-
-        for album_name_key, album_info_val in albums_data.items():
-            artist = album_info_val['artist']
-            songs = album_info_val['songs']
-
-            artist_folder = os.path.join(self.download_folder, self.sanitize_filename(artist))
-            album_folder = os.path.join(artist_folder, self.sanitize_filename(album_name_key))
-
-            current_album_tracks_to_download = []
-            for song in songs:
-                total_tracks_overall += 1
-                safe_filename = self.sanitize_filename(f"{song}.mp3")
-                file_path = os.path.join(album_folder, safe_filename)
-
-                if os.path.exists(file_path) and os.path.getsize(file_path) > 50 * 1024:
-                    existing_files_count += 1
-                else:
-                    current_album_tracks_to_download.append(song)
-
-            if current_album_tracks_to_download:
-                tracks_to_download_list.append({
-                    album_name_key: {
-                        "artist": artist,
-                        "songs": current_album_tracks_to_download
-                    }
-                })
-
-        print(f"Async: Found {existing_files_count}/{total_tracks_overall} files already downloaded.")
-        return tracks_to_download_list, total_tracks_overall - existing_files_count
+        # The directory listings are blocking I/O, so the whole scan runs on worker threads.
+        tracks_to_download_list, pending, total_tracks_overall = await asyncio.to_thread(
+            scan_library, albums_data, self.download_folder, self.sanitize_filename, self.manifest)
+        print(f"Async: Found {total_tracks_overall - pending}/{total_tracks_overall} files already downloaded.")
+        return tracks_to_download_list, pending
 
 
 def load_json_data(filename="genius_albums_structured_data.json"):
@@ -510,7 +641,8 @@ async def async_main():
 
     print(f"Successfully loaded {len(albums_data_full)} albums from JSON file")
 
-    downloader = AsyncMusifyDownloader(max_concurrent_downloads=10, max_concurrent_requests=5)
+    downloader = AsyncMusifyDownloader(max_concurrent_downloads=10, max_concurrent_requests=5,
+                                       audio_cache_dir=os.environ.get("MUSIFY_AUDIO_CACHE_DIR"))
 
     albums_to_process_list, num_files_to_download = await downloader.pre_scan_existing_files_async(albums_data_full)
 
@@ -543,7 +675,7 @@ def sync_main():
         return
     print(f"Successfully loaded {len(albums_data)} albums from JSON file")
 
-    downloader = FastMusifyDownloader(max_concurrent=8)
+    downloader = FastMusifyDownloader(max_concurrent=8, audio_cache_dir=os.environ.get("MUSIFY_AUDIO_CACHE_DIR"))
 
     albums_to_process_list, num_files_to_download = downloader.pre_scan_existing_files(albums_data)
 
@@ -557,10 +689,13 @@ def sync_main():
     total_failed = 0
     start_time = time.time()
 
-    for album_dict in albums_to_process_list:
-        successful, failed = downloader.download_album_tracks_concurrent(album_dict)
-        total_successful += successful
-        total_failed += failed
+    try:
+        for album_dict in albums_to_process_list:
+            successful, failed = downloader.download_album_tracks_concurrent(album_dict)
+            total_successful += successful
+            total_failed += failed
+    finally:
+        downloader.close()
 
     end_time = time.time()
     duration = end_time - start_time
@@ -0,0 +1,530 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RAW_DIR = PROJECT_ROOT / "data" / "raw"
+PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+STAGES = ("scrape", "tracks", "download", "embed", "merge", "train")
+
+
+def file_digest(path):
+    """sha256 of a file's content, or None when it does not exist."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def checkpoint_identity(path):
+    # Checkpoints are hundreds of MB; name, size and mtime identify them well enough.
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{Path(path).name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def write_json_atomic(path, data, indent=4):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+class StageTimer:
+    """Wall time and item count of one stage run, reported as items/s."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.started = time.monotonic()
+        self.extra = {}
+
+    def report(self, status="ran"):
+        seconds = time.monotonic() - self.started
+        return dict({
+            "status": status,
+            "items": self.items,
+            "seconds": round(seconds, 3),
+            "items_per_s": self.items / seconds if seconds > 0 else None,
+        }, **self.extra)
+
+
+class EmbeddingLog:
+    """
+    Append-only JSONL of CLAP song records, one per embedded library file,
+    tagged with the file's manifest key, its size, the manifest's `verified_at`
+    for it and the checkpoint used. It is what makes embedding incremental: a
+    file is re-embedded only when it was replaced (even by one of the same
+    size) or the checkpoint changed. `compact` writes the JSON array the merge
+    step reads without holding the vectors in memory.
+    """
+
+    def __init__(self, path, checkpoint):
+        self.path = Path(path)
+        self.checkpoint = checkpoint
+        self.entries = {}
+        self._lock = threading.Lock()
+        for offset, record in self._scan():
+            if record.get("checkpoint") == checkpoint:
+                self.entries[record["source"]] = (record["source_size"], record.get("source_verified_at"), offset)
+
+    def _scan(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    yield offset, json.loads(line)
+                except json.JSONDecodeError:
+                    pass  # torn last line from a crash
+                offset += len(line)
+
+    def is_current(self, source, manifest_entry):
+        entry = self.entries.get(source)
+        return entry is not None and entry[:2] == (manifest_entry["size"], manifest_entry["verified_at"])
+
+    def append(self, records):
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                # Terminate a line torn by a previous crash so the next record starts clean.
+                if f.tell() > 0:
+                    with open(self.path, 'rb') as tail:
+                        tail.seek(-1, os.SEEK_END)
+                        if tail.read(1) != b'\n':
+                            f.write(b'\n')
+                for record in records:
+                    offset = f.tell()
+                    f.write(json.dumps(dict(record, checkpoint=self.checkpoint), ensure_ascii=False).encode('utf-8'))
+                    f.write(b'\n')
+                    self.entries[record["source"]] = (record["source_size"], record["source_verified_at"], offset)
+
+    def compact(self, output_path, live_sources):
+        """Writes the latest record of every live source as a JSON array; returns the record count."""
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_name(output_path.name + ".tmp")
+        with self._lock:
+            offsets = sorted(offset for source, (_, _, offset) in self.entries.items() if source in live_sources)
+            with open(self.path, 'rb') as log, open(tmp_path, 'w', encoding='utf-8') as out:
+                out.write("[\n")
+                for i, offset in enumerate(offsets):
+                    log.seek(offset)
+                    record = json.loads(log.readline())
+                    for key in ("source", "source_size", "source_verified_at", "checkpoint"):
+                        record.pop(key, None)
+                    out.write((",\n" if i else "") + json.dumps(record, ensure_ascii=False))
+                out.write("\n]\n")
+        os.replace(tmp_path, output_path)
+        return len(offsets)
+
+
+class StreamingEmbedder:
+    """
+    Embeds library files on a background thread as they are submitted, so
+    tracks go through CLAP while the rest of the library is still
+    downloading. Items may carry the future of their download-time
+    normalization, which is awaited so the embedder reads the cached 48 kHz
+    array instead of decoding the file again. `manifest` is the
+    DownloadManifest the downloader records into, read for each file's
+    `verified_at`. Every `checkpoint_every` embedded tracks `on_checkpoint`
+    is called from the embedding thread.
+    """
+
+    def __init__(self, embedder, log, library, manifest, batch_size=16, checkpoint_every=0, on_checkpoint=None):
+        self.embedder = embedder
+        self.log = log
+        self.library = Path(library)
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.on_checkpoint = on_checkpoint
+        self.embedded = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="clap-embedder", daemon=True)
+        self._since_checkpoint = 0
+        self._error = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, file_path, normalized=None):
+        self._queue.put((str(file_path), normalized))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.embedded
+
+    def _run(self):
+        batch, done = [], False
+        try:
+            while not done:
+                try:
+                    # Wait briefly for a full batch, but never sit on a partial one while the queue is idle.
+                    item = self._queue.get(timeout=1.0 if batch else None)
+                except queue.Empty:
+                    item = False
+                if item is None:
+                    done = True
+                elif item:
+                    batch.append(item)
+                if batch and (done or item is False or len(batch) >= self.batch_size):
+                    self._embed(batch)
+                    batch = []
+        except Exception as e:
+            self._error = e
+
+    def _embed(self, batch):
+        paths = []
+        for file_path, normalized in batch:
+            if normalized is not None:
+                try:
+                    normalized.result()
+                except Exception:
+                    pass  # the embedder decodes the file itself
+            paths.append(file_path)
+
+        records = self.embedder.process_files(paths)
+        self.embedder.embeddings_data.clear()
+        by_song = {record["file_path"]: record for record in records}
+        logged = []
+        for file_path in paths:
+            record = by_song.get(self._stored_path(file_path))
+            if record is None:
+                self.failed += 1
+                continue
+            source = os.path.relpath(file_path, self.library).replace(os.sep, '/')
+            entry = self.manifest.get(file_path)
+            logged.append(dict(record, source=source, source_size=os.path.getsize(file_path),
+                               source_verified_at=entry["verified_at"] if entry is not None else None))
+        self.log.append(logged)
+        self.embedded += len(logged)
+
+        self._since_checkpoint += len(logged)
+        if self.checkpoint_every and self.on_checkpoint and self._since_checkpoint >= self.checkpoint_every:
+            self._since_checkpoint = 0
+            self.on_checkpoint()
+
+    @staticmethod
+    def _stored_path(file_path):
+        # Mirrors how CLAPEmbedder.process_files records file_path.
+        try:
+            return str(Path(file_path).relative_to(PROJECT_ROOT))
+        except ValueError:
+            return Path(file_path).name
+
+
+class Orchestrator:
+    """
+    Runs scrape -> tracks -> download -> embed -> merge -> train as a DAG
+    (merge also reads the tracks output), in that topological order.
+
+    Each stage's key hashes its parameters and the content of its inputs; a
+    stage whose key and outputs match the last successful run is skipped.
+    Download and embed run as one streaming pair (tracks are embedded while
+    the rest of the library downloads), and merge and training are
+    incremental, so a run after a small change only does the work the change
+    implies. Per-stage throughput goes to pipeline_report.json.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.csv_path = RAW_DIR / "combined_albums.csv"
+        self.records_path = RAW_DIR / "genius_albums.jsonl"
+        self.structured_path = RAW_DIR / "genius_albums_structured_data.json"
+        self.library = RAW_DIR / "albums"
+        self.manifest_path = self.library / ".download_manifest.jsonl"
+        self.embeddings_log_path = PROCESSED_DIR / "clap_embeddings.jsonl"
+        self.embeddings_path = RAW_DIR / "clap_music_embeddings.json"
+        self.dp_path = args.output
+        self.checkpoint = PROJECT_ROOT / "models" / "music_speech_epoch_15_esc_89.25.pt"
+        self.state_path = PROCESSED_DIR / "pipeline_state.json"
+        self.report_path = PROCESSED_DIR / "pipeline_report.json"
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.state = {}
+        self.reports = {}
+        self._merge_lock = threading.Lock()
+
+    # --- cache keys ---------------------------------------------------------
+
+    def stage_inputs(self, name):
+        args = self.args
+        return {
+            "scrape": {"min_score": args.min_score, "max_score": args.max_score, "max_pages": args.max_pages},
+            "tracks": {"csv": file_digest(self.csv_path)},
+            "download": {"albums": file_digest(self.structured_path)},
+            "embed": {"library": file_digest(self.manifest_path), "checkpoint": checkpoint_identity(self.checkpoint)},
+            "merge": {"embeddings": file_digest(self.embeddings_path), "albums": file_digest(self.structured_path),
+                      "match_threshold": args.match_threshold},
+            "train": {"data": file_digest(self.dp_path), "n_trials": args.n_trials},
+        }[name]
+
+    def stage_outputs(self, name):
+        return {
+            "scrape": [self.csv_path],
+            "tracks": [self.structured_path],
+            "download": [self.manifest_path],
+            "embed": [self.embeddings_path],
+            "merge": [self.dp_path],
+            "train": [],
+        }[name]
+
+    def stage_key(self, name):
+        return hashlib.sha256(json.dumps([name, self.stage_inputs(name)], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def is_cached(self, name):
+        previous = self.state.get(name)
+        return (previous is not None and previous.get("complete", True)
+                and previous["key"] == self.stage_key(name)
+                and all(path.exists() for path in self.stage_outputs(name)))
+
+    def finish(self, name, timer, complete=True):
+        self.state[name] = {"key": self.stage_key(name), "finished_at": time.time(), "complete": complete}
+        write_json_atomic(self.state_path, self.state)
+        self.reports[name] = timer.report()
+        print(f"[{name}] {timer.items} items in {self.reports[name]['seconds']:.1f}s "
+              f"({self.reports[name]['items_per_s'] or 0:.2f}/s)")
+
+    # --- stages -------------------------------------------------------------
+
+    def run_scrape(self):
+        from albums_random_evaluations import GENRE_URLS, scrape_genres, shuffle_csv
+
+        timer = StageTimer("scrape")
+        self.csv_path.parent.mkdir(parents=True, exist_ok=True)
+        timer.items = asyncio.run(scrape_genres(GENRE_URLS, self.csv_path, self.args.min_score, self.args.max_score,
+                                                max_pages=self.args.max_pages))
+        shuffle_csv(self.csv_path)
+        self.finish("scrape", timer)
+
+    def run_tracks(self):
+        from fetch_tracks import compact, completed_albums, fetch_albums, read_album_rows
+
+        timer = StageTimer("tracks")
+        rows = read_album_rows(self.csv_path)
+        done = completed_albums(self.records_path)
+        todo = [row for row in rows if row[0] not in done]
+        if todo:
+            self.records_path.parent.mkdir(parents=True, exist_ok=True)
+            asyncio.run(fetch_albums(todo, self.records_path, cache_dir=RAW_DIR / "genius_cache"))
+        compact(self.records_path, self.structured_path)
+        timer.items = len(todo)
+        self.finish("tracks", timer)
+
+    def make_embedder(self, manifest, checkpoints=False):
+        from src.embeddings.clap_embed import CLAPEmbedder
+
+        embedder = CLAPEmbedder(self.library, self.checkpoint, self.embeddings_path,
+                                batch_size=self.args.embed_batch, audio_cache_dir=self.args.audio_cache)
+        embedder.load_model()
+        log = EmbeddingLog(self.embeddings_log_path, checkpoint_identity(self.checkpoint))
+        return StreamingEmbedder(embedder, log, self.library, manifest, self.args.embed_batch,
+                                 self.args.checkpoint_every, self.checkpoint_merge if checkpoints else None)
+
+    def pending_embeddings(self, log, manifest):
+        return [self.library / key for key, entry in list(manifest.entries.items()) if not log.is_current(key, entry)]
+
+    def compact_embeddings(self, log):
+        from download_manifest import DownloadManifest
+
+        return log.compact(self.embeddings_path, set(DownloadManifest(self.library).entries))
+
+    def checkpoint_merge(self):
+        """Mid-stream refresh: the incremental merge (and training, if selected) on what is embedded so far."""
+        with self._merge_lock:
+            print(f"[checkpoint] {self.compact_embeddings(self._streaming.log)} embedded tracks, merging.")
+            self.merge()
+            if "train" in self._selected:
+                self.train()
+
+    def run_download_and_embed(self, run_download, run_embed):
+        from download_manifest import DownloadManifest
+        from musify_downloader import AsyncMusifyDownloader
+
+        checkpoints = "merge" in self._selected and self.args.checkpoint_every > 0
+        # One manifest shared with the downloader, so the embedder sees the verified_at of files as they land.
+        manifest = DownloadManifest(self.library)
+        streaming = self._streaming = self.make_embedder(manifest, checkpoints).start() if run_embed else None
+        normalizer = None
+        if streaming is not None and self.args.audio_cache is not None:
+            from src.embeddings.audio_cache import AudioCache, BackgroundNormalizer
+
+            normalizer = BackgroundNormalizer(AudioCache(self.args.audio_cache, self.library), self.args.normalize_workers)
+
+        def feed(file_path):
+            streaming.submit(file_path, normalizer.submit(file_path) if normalizer is not None else None)
+
+        embed_timer = StageTimer("embed")
+        if streaming is not None:
+            # Library files that are already on disk but not embedded go first.
+            for file_path in self.pending_embeddings(streaming.log, manifest):
+                feed(file_path)
+
+        if run_download:
+            download_timer = StageTimer("download")
+            with open(self.structured_path, 'r', encoding='utf-8') as f:
+                albums = json.load(f)
+
+            async def download():
+                downloader = AsyncMusifyDownloader(str(self.library), max_concurrent_downloads=10,
+                                                   max_concurrent_requests=5, manifest=manifest,
+                                                   on_download=feed if streaming is not None else None)
+                todo, pending = await downloader.pre_scan_existing_files_async(albums)
+                if not pending:
+                    return 0, 0, None
+                successful, failed = await downloader.process_all_albums_async(todo)
+                return successful, failed, downloader.telemetry.summary()
+
+            successful, failed, telemetry = asyncio.run(download())
+            download_timer.items = successful
+            download_timer.extra = {"failed": failed}
+            if telemetry is not None:
+                download_timer.extra["telemetry"] = telemetry["stages"]
+            # Failed tracks are retried next run, so an incomplete download is never treated as cached.
+            self.finish("download", download_timer, complete=failed == 0)
+
+        if streaming is not None:
+            embed_timer.items = streaming.close()
+            if normalizer is not None:
+                normalizer.close()
+            embed_timer.extra = {"failed": streaming.failed}
+            embed_timer.extra["records"] = self.compact_embeddings(streaming.log)
+            self.finish("embed", embed_timer, complete=streaming.failed == 0)
+
+    def merge(self):
+        from merge_album_data import merge_data
+
+        merge_data(self.embeddings_path, self.structured_path, self.dp_path,
+                   match_threshold=self.args.match_threshold, incremental=True)
+
+    def run_merge(self):
+        timer = StageTimer("merge")
+        with self._merge_lock:
+            self.merge()
+        with open(self.structured_path, 'r', encoding='utf-8') as f:
+            timer.items = len(json.load(f))
+        self.finish("merge", timer)
+
+    def train(self):
+        from src.regression.model_fitting import Pipeline
+
+        study_db = PROCESSED_DIR / "models" / "optuna.db"
+        study_db.parent.mkdir(parents=True, exist_ok=True)
+        Pipeline(self.dp_path, n_trials=self.args.n_trials, n_jobs=max(1, (os.cpu_count() or 1) // 4),
+                 storage=f"sqlite:///{study_db}", incremental=True, clap_checkpoint=self.checkpoint).run()
+
+    def run_train(self):
+        timer = StageTimer("train")
+        with self._merge_lock:
+            self.train()
+        timer.items = 1
+        self.finish("train", timer)
+
+    # --- driver -------------------------------------------------------------
+
+    def selected_stages(self):
+        if self.args.stages:
+            return [name for name in STAGES if name in self.args.stages]
+        start = STAGES.index(self.args.start) if self.args.start else 0
+        return list(STAGES[start:])
+
+    def run(self):
+        self._selected = self.selected_stages()
+        self._streaming = None
+        force = set(self.args.force or ())
+        started = time.time()
+        runners = {"scrape": self.run_scrape, "tracks": self.run_tracks, "merge": self.run_merge,
+                   "train": self.run_train}
+
+        for name in self._selected:
+            if name in self.reports:
+                continue
+            if name not in force and self.is_cached(name):
+                self.reports[name] = {"status": "cached"}
+                print(f"[{name}] up to date, skipped")
+                continue
+            print(f"[{name}] running")
+            if name in ("download", "embed"):
+                run_download = name == "download"
+                run_embed = "embed" in self._selected and ("embed" in force or not self.is_cached("embed")
+                                                           or run_download)
+                self.run_download_and_embed(run_download, run_embed)
+                if not run_embed and "embed" in self._selected:
+                    self.reports["embed"] = {"status": "cached"}
+            else:
+                runners[name]()
+
+        summary = {"started_at": started, "duration_s": time.time() - started, "stages": self.reports}
+        write_json_atomic(self.report_path, summary)
+        print(f"Pipeline report written to {self.report_path}")
+        return summary
+
+
+def status(orchestrator):
+    for name in STAGES:
+        previous = orchestrator.state.get(name)
+        if previous is None:
+            state = "never run"
+        elif orchestrator.is_cached(name):
+            state = "up to date"
+        else:
+            state = "stale" if previous.get("complete", True) else "incomplete"
+        print(f"{name:>9}: {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the data pipeline (scrape -> tracks -> download -> embed -> merge -> train) "
+                    "with content-hashed stage caching.")
+    parser.add_argument("command", nargs="?", choices=("run", "status"), default="run")
+    parser.add_argument("--stages", nargs="*", choices=STAGES, default=None,
+                        help="Run only these stages (in pipeline order).")
+    parser.add_argument("--start", choices=STAGES, default=None, help="Run from this stage to the end.")
+    parser.add_argument("--force", nargs="*", choices=STAGES, default=None,
+                        help="Re-run these stages even if their inputs are unchanged.")
+    parser.add_argument("--output", type=Path, default=PROCESSED_DIR / "dp.json", help="Merged dataset path.")
+    parser.add_argument("--min-score", type=int, default=0)
+    parser.add_argument("--max-score", type=int, default=100)
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--match-threshold", type=float, default=0.8)
+    parser.add_argument("--n-trials", type=int, default=30)
+    parser.add_argument("--embed-batch", type=int, default=16)
+    parser.add_argument("--audio-cache", type=Path, default=PROCESSED_DIR / "audio_48k",
+                        help="48 kHz mono input cache shared by download-time normalization and CLAP.")
+    parser.add_argument("--normalize-workers", type=int, default=2)
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="While streaming, re-run the incremental merge (and training) every N embedded tracks.")
+    args = parser.parse_args()
+
+    orchestrator = Orchestrator(args)
+    if args.command == "status":
+        status(orchestrator)
+    else:
+        orchestrator.run()
+
+
+if __name__ == "__main__":
+    main()
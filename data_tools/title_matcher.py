@@ -0,0 +1,156 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+FEATURE_PATTERN = re.compile(r'\s+[\(\[]?(?:feat|ft|featuring)\b\.?.*$')
+BRACKET_PATTERN = re.compile(r'\s*[\(\[][^\)\]]*[\)\]]')
+VERSION_PATTERN = re.compile(r'\s+-\s+.*\b(?:remaster(?:ed)?|version|edit|mix|live|mono|stereo)\b.*$')
+APOSTROPHE_PATTERN = re.compile(r"['\u2019`]")
+NON_WORD_PATTERN = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercases, strips accents, featured-artist tails, bracketed and " - Remastered"
+    style suffixes, and collapses punctuation to single spaces.
+    """
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower().replace('&', ' and ')
+    text = VERSION_PATTERN.sub('', text)
+    text = BRACKET_PATTERN.sub('', text)
+    text = FEATURE_PATTERN.sub('', text)
+    text = APOSTROPHE_PATTERN.sub('', text)
+    return NON_WORD_PATTERN.sub(' ', text).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _ArtistIndex:
+    def __init__(self):
+        self.titles = []
+        self.values = []
+        self.grams = []
+        self.tokens = []
+        self.exact = {}
+        self.normalized = {}
+        self.postings = defaultdict(list)
+
+    def add(self, exact_title, value):
+        normalized = normalize_text(exact_title)
+        candidate = len(self.titles)
+        self.titles.append(normalized)
+        self.values.append(value)
+        self.grams.append(trigrams(normalized))
+        self.tokens.append(set(normalized.split()))
+        self.exact[exact_title] = candidate
+        self.normalized.setdefault(normalized, candidate)
+        for gram in self.grams[-1]:
+            self.postings[gram].append(candidate)
+
+
+class TitleMatcher:
+    """
+    Per-artist fuzzy song title matcher.
+
+    Each artist gets its own inverted index from character trigrams to candidate
+    titles, so a lookup only scores the handful of candidates that share at least
+    one trigram with the query instead of every song in the corpus. Candidates are
+    ranked by trigram Dice similarity blended with token Jaccard similarity.
+
+    `match` returns (value, score, method) where method is "exact" (cleaned title
+    equal), "normalized" (equal after normalize_text) or "fuzzy". A threshold of
+    1.0 turns fuzzy matching off; normalized matches are still made.
+    """
+
+    # Bump whenever normalization or scoring changes, so content hashes built on matches go stale.
+    VERSION = 1
+
+    def __init__(self, threshold: float = 0.8, token_weight: float = 0.3):
+        self.threshold = threshold
+        self.token_weight = token_weight
+        self._artists = {}
+
+    @staticmethod
+    def artist_key(artist: str) -> str:
+        key = normalize_text(artist)
+        return key[4:] if key.startswith('the ') else key
+
+    def add(self, artist: str, exact_title: str, value):
+        key = self.artist_key(artist)
+        index = self._artists.get(key)
+        if index is None:
+            index = self._artists[key] = _ArtistIndex()
+        index.add(exact_title, value)
+
+    def __len__(self):
+        return sum(len(index.titles) for index in self._artists.values())
+
+    def _candidates(self, index, exact_title):
+        if exact_title in index.exact:
+            return [(1.0, index.exact[exact_title], "exact")]
+        normalized = normalize_text(exact_title)
+        if normalized in index.normalized:
+            return [(1.0, index.normalized[normalized], "normalized")]
+        if self.threshold >= 1.0:
+            return []
+
+        grams = trigrams(normalized)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in index.postings.get(gram, ()):
+                shared[candidate] += 1
+
+        tokens = set(normalized.split())
+        scored = []
+        for candidate, overlap in shared.items():
+            score = 2.0 * overlap / (len(grams) + len(index.grams[candidate]))
+            if self.token_weight:
+                union = tokens | index.tokens[candidate]
+                jaccard = len(tokens & index.tokens[candidate]) / len(union) if union else 0.0
+                score = (1.0 - self.token_weight) * score + self.token_weight * jaccard
+            if score >= self.threshold:
+                scored.append((score, candidate, "fuzzy"))
+        scored.sort(key=lambda item: -item[0])
+        return scored
+
+    def match(self, artist: str, exact_title: str):
+        index = self._artists.get(self.artist_key(artist))
+        if index is None:
+            return None, 0.0, None
+        candidates = self._candidates(index, exact_title)
+        if not candidates:
+            return None, 0.0, None
+        score, candidate, method = candidates[0]
+        return index.values[candidate], score, method
+
+    def match_album(self, artist: str, exact_titles: list):
+        """
+        Resolves a whole track list at once.
+
+        Pairs are assigned greedily from the highest score down so that two
+        tracks of one album never claim the same candidate song.
+        Returns one (value, score, method) tuple per title.
+        """
+        results = [(None, 0.0, None)] * len(exact_titles)
+        index = self._artists.get(self.artist_key(artist))
+        if index is None:
+            return results
+
+        pairs = []
+        for position, title in enumerate(exact_titles):
+            for score, candidate, method in self._candidates(index, title):
+                pairs.append((score, method != "fuzzy", position, candidate, method))
+        pairs.sort(key=lambda pair: (-pair[0], not pair[1]))
+
+        taken = set()
+        for score, _, position, candidate, method in pairs:
+            if results[position][0] is not None or candidate in taken:
+                continue
+            results[position] = (index.values[candidate], score, method)
+            taken.add(candidate)
+        return results
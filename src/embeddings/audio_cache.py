@@ -0,0 +1,149 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import librosa
+except ImportError:
+    librosa = None
+
+# Deliberately free of torch / laion_clap imports: the downloader's worker
+# processes import this module (by file, see musify_downloader) just to decode.
+
+SAMPLE_RATE = 48000
+PCM_SCALE = 32767.0
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a")
+
+
+def decode(path, sample_rate=SAMPLE_RATE):
+    if librosa is None:
+        raise ImportError("The 'librosa' library is required to decode audio.")
+    waveform, _ = librosa.load(str(path), sr=sample_rate, mono=True)
+    return waveform
+
+
+def to_pcm16(waveform):
+    """Same clip-and-scale quantization CLAP applies to its input, so caching the result loses nothing."""
+    return (np.clip(waveform, -1.0, 1.0) * PCM_SCALE).astype(np.int16)
+
+
+def normalize_file(source, destination, sample_rate=SAMPLE_RATE):
+    """Decodes `source` to 48 kHz mono int16 and writes it atomically as `.npy`. Returns the sample count."""
+    pcm = to_pcm16(decode(source, sample_rate))
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    # Per-process temp name: the embedder may decode a file inline while a download-time worker does the same.
+    tmp_path = destination.with_name(f"{destination.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, pcm)
+    os.replace(tmp_path, destination)
+    return len(pcm)
+
+
+class AudioCache:
+    """
+    Model-ready copy of a music library: every audio file under `source_root`
+    maps to `<cache_dir>/<relative path>.npy`, a 48 kHz mono int16 array that
+    can be memory-mapped. An entry is fresh while it is newer than its source.
+    """
+
+    def __init__(self, cache_dir, source_root):
+        self.cache_dir = Path(cache_dir)
+        self.source_root = Path(source_root).resolve()
+
+    def path_for(self, audio_path):
+        relative = Path(audio_path).resolve().relative_to(self.source_root)
+        return self.cache_dir / relative.with_name(relative.name + ".npy")
+
+    def is_fresh(self, audio_path):
+        try:
+            return self.path_for(audio_path).stat().st_mtime_ns >= Path(audio_path).stat().st_mtime_ns
+        except (OSError, ValueError):
+            return False
+
+    def pcm(self, audio_path):
+        """int16 samples for `audio_path`, memory-mapped from the cache; decoded and cached first on a miss."""
+        cached = self.path_for(audio_path)
+        if not self.is_fresh(audio_path):
+            normalize_file(audio_path, cached)
+        return np.load(cached, mmap_mode="r")
+
+    def waveform(self, audio_path):
+        return self.pcm(audio_path).astype(np.float32) / PCM_SCALE
+
+    def submit(self, executor, audio_path):
+        """Schedules normalization of one file on a (process pool) executor; fresh entries are skipped."""
+        if self.is_fresh(audio_path):
+            return None
+        return executor.submit(normalize_file, str(audio_path), str(self.path_for(audio_path)))
+
+    def build(self, paths, workers=None):
+        """Normalizes every stale file in `paths` in parallel. Returns (normalized, fresh, failed) counts."""
+        normalized, fresh, failed = 0, 0, 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for path in paths:
+                future = self.submit(executor, path)
+                if future is None:
+                    fresh += 1
+                else:
+                    futures[future] = path
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    normalized += 1
+                except Exception as e:
+                    print(f"Could not normalize {futures[future]}: {e}")
+                    failed += 1
+        return normalized, fresh, failed
+
+
+class BackgroundNormalizer:
+    """
+    Feeds freshly downloaded files to a process pool while the download goes
+    on; `close()` waits for the backlog and returns (normalized, failed).
+    `submit` may be called from any thread.
+    """
+
+    def __init__(self, cache, workers=2):
+        self.cache = cache
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.futures = {}
+
+    def submit(self, audio_path):
+        future = self.cache.submit(self.executor, audio_path)
+        if future is not None:
+            self.futures[future] = audio_path
+        return future
+
+    def close(self):
+        normalized, failed = 0, 0
+        for future in as_completed(list(self.futures)):
+            try:
+                future.result()
+                normalized += 1
+            except Exception as e:
+                print(f"Could not normalize {self.futures[future]}: {e}")
+                failed += 1
+        self.executor.shutdown()
+        return normalized, failed
+
+
+def main():
+    project_root = Path(__file__).resolve().parents[2]
+    parser = argparse.ArgumentParser(description="Pre-decode a music library into the 48 kHz mono CLAP input cache.")
+    parser.add_argument("--music-dir", type=Path, default=project_root / "data" / "raw" / "albums")
+    parser.add_argument("--cache-dir", type=Path, default=project_root / "data" / "processed" / "audio_48k")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    paths = [p for p in args.music_dir.rglob("*") if p.suffix.lower() in AUDIO_EXTENSIONS]
+    normalized, fresh, failed = AudioCache(args.cache_dir, args.music_dir).build(paths, args.workers)
+    print(f"{normalized} files normalized, {fresh} already cached, {failed} failed -> {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
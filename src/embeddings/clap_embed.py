@@ -5,6 +5,8 @@ import json
 import numpy as np
 import laion_clap
 
+from .audio_cache import AudioCache, decode
+
 try:
     import requests
 except ImportError:
@@ -26,7 +28,7 @@ class CLAPEmbedder:
         "music_speech_epoch_15_esc_89.25.pt?download=true"
     )
 
-    def __init__(self, music_dir, checkpoint_path, output_file, batch_size=16):
+    def __init__(self, music_dir, checkpoint_path, output_file, batch_size=16, audio_cache_dir=None):
         self.music_dir = Path(music_dir)
         if not self.music_dir.is_absolute():
             self.music_dir = (PROJECT_ROOT / self.music_dir).resolve()
@@ -40,6 +42,13 @@ class CLAPEmbedder:
             self.output_file = (PROJECT_ROOT / self.output_file).resolve()
 
         self.batch_size = batch_size
+        # With a cache, audio is decoded to 48 kHz mono once and later runs (e.g. a new checkpoint) only mmap it.
+        self.audio_cache = None
+        if audio_cache_dir is not None:
+            audio_cache_dir = Path(audio_cache_dir)
+            if not audio_cache_dir.is_absolute():
+                audio_cache_dir = (PROJECT_ROOT / audio_cache_dir).resolve()
+            self.audio_cache = AudioCache(audio_cache_dir, self.music_dir)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {self.device}")
         self.model = None
@@ -152,6 +161,16 @@ class CLAPEmbedder:
             print(f"Warning: Could not make {file_path} relative to {self.music_dir}.")
             return "Unknown Artist", "Unknown Album", file_path.stem
 
+    def _load_waveforms(self, paths):
+        waveforms = []
+        for path in paths:
+            try:
+                waveforms.append(self.audio_cache.waveform(path))
+            except ValueError:
+                # Not under music_dir (e.g. uploaded files): decode without caching.
+                waveforms.append(decode(path))
+        return waveforms
+
     def process_files(self, file_paths_to_process):
         if not self.model:
             print("Model not loaded.")
@@ -169,7 +188,11 @@ class CLAPEmbedder:
                 print(f"Processing batch {i // self.batch_size + 1}: {batch}")
 
                 try:
-                    embeddings = self.model.get_audio_embedding_from_filelist(x=batch, use_tensor=False)
+                    if self.audio_cache is not None:
+                        embeddings = self.model.get_audio_embedding_from_data(x=self._load_waveforms(batch),
+                                                                              use_tensor=False)
+                    else:
+                        embeddings = self.model.get_audio_embedding_from_filelist(x=batch, use_tensor=False)
                     metadata_batch = []
 
                     for path in batch:
@@ -206,6 +229,9 @@ class CLAPEmbedder:
         if not self.audio_file_paths:
             print("No audio files found.")
             return []
+        if self.audio_cache is not None:
+            normalized, fresh, failed = self.audio_cache.build(self.audio_file_paths)
+            print(f"Audio cache: {normalized} files decoded, {fresh} already cached, {failed} failed.")
         return self.process_files(self.audio_file_paths)
 
     def save_embeddings(self):
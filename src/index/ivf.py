@@ -0,0 +1,319 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+
+def _save_array(path, array):
+    # Write-then-rename: the current file may be memory-mapped by this very index.
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(array))
+    os.replace(tmp_path, path)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LabelStore:
+    """
+    Per-item labels backed by a JSON-lines file and a memory-mapped array of
+    line offsets, so opening an index parses nothing: a label is decoded when
+    it is looked up. Labels added or replaced since loading stay in memory
+    until the next `save`.
+    """
+
+    def __init__(self, path=None, offsets=None):
+        self.path = path
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self._stored = len(self.offsets) - 1
+        self._replaced = {}
+        self._added = []
+        self._file = None
+
+    @classmethod
+    def from_list(cls, labels):
+        store = cls()
+        store._added = list(labels)
+        return store
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        return cls(directory / "labels.jsonl", np.load(directory / "label_offsets.npy", mmap_mode="r" if mmap else None))
+
+    def __len__(self):
+        return self._stored + len(self._added)
+
+    def _line(self, i):
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        self._file.seek(start)
+        return self._file.read(stop - start)
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i in self._replaced:
+            return self._replaced[i]
+        if i >= self._stored:
+            return self._added[i - self._stored]
+        if i < 0:
+            raise IndexError(i)
+        return json.loads(self._line(i))
+
+    def __setitem__(self, i, label):
+        i = int(i)
+        if i >= self._stored:
+            self._added[i - self._stored] = label
+        else:
+            self._replaced[i] = label
+
+    def _lines(self):
+        """Every label as an encoded JSON line; stored ones that were not replaced are copied undecoded."""
+        if self._stored:
+            with open(self.path, "rb") as f:
+                for i in range(self._stored):
+                    line = f.readline()
+                    yield line if i not in self._replaced else self._encode(self._replaced[i])
+        for label in self._added:
+            yield self._encode(label)
+
+    @staticmethod
+    def _encode(label):
+        return json.dumps(label, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    def __iter__(self):
+        for line in self._lines():
+            yield json.loads(line)
+
+    def extend(self, labels):
+        self._added.extend(labels)
+
+    def save(self, directory):
+        directory = Path(directory)
+        path = directory / "labels.jsonl"
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            for i, line in enumerate(self._lines()):
+                f.write(line)
+                offsets[i + 1] = offsets[i] + len(line)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.replace(tmp_path, path)
+        _save_array(directory / "label_offsets.npy", offsets)
+        self.path, self.offsets, self._stored = path, offsets, len(offsets) - 1
+        self._replaced, self._added = {}, []
+
+
+class IVFIndex:
+    """
+    Inverted-file cosine index over unit-normalized vectors.
+
+    Vectors are clustered with spherical k-means and stored sorted by cluster, so
+    each inverted list is one contiguous slice of a memory-mappable array. A
+    query scans only the `nprobe` lists whose centroids are closest to it, plus
+    a small brute-force delta segment holding vectors added since the last
+    `compact()`.
+    """
+
+    FORMAT_VERSION = 3
+
+    def __init__(self, centroids, vectors, list_offsets, ids, labels, delta_vectors=None, delta_ids=None,
+                 deleted=None, sorted_ids=None, sorted_rows=None):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.list_offsets = list_offsets
+        self.ids = ids
+        self.labels = labels if isinstance(labels, LabelStore) else LabelStore.from_list(labels)
+        dim = centroids.shape[1]
+        self.delta_vectors = delta_vectors if delta_vectors is not None else np.empty((0, dim), dtype=np.float32)
+        self.delta_ids = delta_ids if delta_ids is not None else np.empty(0, dtype=np.int64)
+        self.deleted = set() if deleted is None else set(int(i) for i in deleted)
+        # `ids` sorted, plus the row of each in `vectors`: an id is found with a binary search, and a loaded
+        # index memory-maps both instead of building a lookup table over every id.
+        if sorted_ids is None:
+            sorted_rows = np.argsort(self.ids, kind="stable")
+            sorted_ids = np.asarray(self.ids)[sorted_rows]
+        self.sorted_ids = sorted_ids
+        self.sorted_rows = sorted_rows
+        self._delta_rows = None
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return len(self.ids) + len(self.delta_ids) - len(self.deleted)
+
+    @staticmethod
+    def train_centroids(vectors, n_lists, n_iter=20, sample_size=100_000, seed=0):
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        n_lists = min(n_lists, len(vectors))
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+            centroids = normalize(sums)
+        return centroids
+
+    @staticmethod
+    def assign(vectors, centroids, chunk_size=65_536):
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            out[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+        return out
+
+    @classmethod
+    def build(cls, vectors, labels, n_lists=None, dtype=np.float32, seed=0):
+        vectors = normalize(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(len(vectors))))
+        centroids = cls.train_centroids(vectors, n_lists, seed=seed)
+        index = cls(
+            centroids,
+            vectors=np.empty((0, vectors.shape[1]), dtype=dtype),
+            list_offsets=np.zeros(len(centroids) + 1, dtype=np.int64),
+            ids=np.empty(0, dtype=np.int64),
+            labels=list(labels)
+        )
+        index._rebuild(vectors, np.arange(len(vectors), dtype=np.int64), dtype)
+        return index
+
+    def _rebuild(self, vectors, ids, dtype):
+        assign = self.assign(vectors, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        self.vectors = np.ascontiguousarray(vectors[order], dtype=dtype)
+        self.ids = ids[order]
+        self.sorted_rows = np.argsort(self.ids, kind="stable")
+        self.sorted_ids = self.ids[self.sorted_rows]
+        counts = np.bincount(assign, minlength=self.n_lists)
+        self.list_offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.list_offsets[1:])
+
+    def add(self, vectors, labels):
+        vectors = normalize(vectors)
+        start = len(self.labels)
+        new_ids = np.arange(start, start + len(vectors), dtype=np.int64)
+        self.labels.extend(labels)
+        self.delta_vectors = np.vstack([self.delta_vectors, vectors])
+        self.delta_ids = np.concatenate([self.delta_ids, new_ids])
+        self._delta_rows = None
+        return new_ids
+
+    def remove(self, ids):
+        self.deleted.update(int(i) for i in ids)
+
+    def compact(self):
+        """Folds the delta segment into the inverted lists and drops deleted vectors."""
+        vectors = np.vstack([np.asarray(self.vectors, dtype=np.float32), self.delta_vectors])
+        ids = np.concatenate([np.asarray(self.ids), self.delta_ids])
+        if self.deleted:
+            keep = ~np.isin(ids, np.fromiter(self.deleted, dtype=np.int64))
+            vectors, ids = vectors[keep], ids[keep]
+            for item_id in self.deleted:
+                self.labels[item_id] = None
+        self._rebuild(vectors, ids, self.vectors.dtype)
+        self.delta_vectors = np.empty((0, self.dim), dtype=np.float32)
+        self.delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_rows = None
+        self.deleted = set()
+
+    def search(self, query, k=10, nprobe=8):
+        """Returns (ids, cosine similarities) of the k best matches, best first."""
+        query = normalize(query).reshape(-1)
+        nprobe = min(nprobe, self.n_lists)
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        scores, ids = [], []
+        for lst in probes:
+            start, stop = self.list_offsets[lst], self.list_offsets[lst + 1]
+            if start == stop:
+                continue
+            scores.append(self.vectors[start:stop] @ query.astype(self.vectors.dtype))
+            ids.append(self.ids[start:stop])
+        if len(self.delta_ids):
+            scores.append(self.delta_vectors @ query)
+            ids.append(self.delta_ids)
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.concatenate(scores).astype(np.float32)
+        ids = np.concatenate(ids)
+        if self.deleted:
+            scores[np.isin(ids, np.fromiter(self.deleted, dtype=np.int64))] = -np.inf
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        return ids[top], scores[top]
+
+    def vector(self, item_id):
+        item_id = int(item_id)
+        if self._delta_rows is None:
+            # Built on first use; the delta segment stays small between compactions.
+            self._delta_rows = {i: row for row, i in enumerate(self.delta_ids.tolist())}
+        if item_id in self._delta_rows:
+            return self.delta_vectors[self._delta_rows[item_id]]
+        pos = int(np.searchsorted(self.sorted_ids, item_id))
+        if pos == len(self.sorted_ids) or self.sorted_ids[pos] != item_id:
+            raise KeyError(item_id)
+        return np.asarray(self.vectors[self.sorted_rows[pos]], dtype=np.float32)
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        _save_array(directory / "centroids.npy", self.centroids)
+        _save_array(directory / "vectors.npy", self.vectors)
+        _save_array(directory / "list_offsets.npy", self.list_offsets)
+        _save_array(directory / "ids.npy", self.ids)
+        _save_array(directory / "sorted_ids.npy", self.sorted_ids)
+        _save_array(directory / "sorted_rows.npy", self.sorted_rows)
+        _save_array(directory / "delta_vectors.npy", self.delta_vectors)
+        _save_array(directory / "delta_ids.npy", self.delta_ids)
+        _save_array(directory / "deleted.npy", np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)))
+        self.labels.save(directory)
+        with open(directory / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"version": self.FORMAT_VERSION, "labels": len(self.labels)}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        version = None
+        if (directory / "meta.json").exists():
+            with open(directory / "meta.json", "r", encoding="utf-8") as f:
+                version = json.load(f).get("version")
+        if version != cls.FORMAT_VERSION:
+            raise ValueError(f"{directory} has index format {version}, expected {cls.FORMAT_VERSION}; rebuild it.")
+        return cls(
+            np.load(directory / "centroids.npy"),
+            np.load(directory / "vectors.npy", mmap_mode=mode),
+            np.load(directory / "list_offsets.npy"),
+            np.load(directory / "ids.npy", mmap_mode=mode),
+            LabelStore.load(directory, mmap),
+            np.load(directory / "delta_vectors.npy"),
+            np.load(directory / "delta_ids.npy"),
+            np.load(directory / "deleted.npy"),
+            np.load(directory / "sorted_ids.npy", mmap_mode=mode),
+            np.load(directory / "sorted_rows.npy", mmap_mode=mode)
+        )
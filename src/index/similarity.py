@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.index.ivf import IVFIndex
+from src.utils.pooling import AlbumPooler
+
+
+def _vector_hash(vector):
+    return hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()[:16]
+
+
+def album_key(artist, title):
+    return f"{(artist or '').strip().lower()}|||{(title or '').strip().lower()}"
+
+
+def load_albums(dp_path):
+    with open(dp_path, "r", encoding="utf-8") as f:
+        if Path(dp_path).suffix == ".jsonl":
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f).get("Albums", [])
+
+
+def album_vectors(albums):
+    albums = [a for a in albums if a.get("songs")]
+    vectors = AlbumPooler().pool_albums([a["songs"] for a in albums]).astype(np.float32)
+    labels = [{
+        "key": album_key(a.get("artist"), a.get("album_title")),
+        "artist": a.get("artist"),
+        "album_title": a.get("album_title"),
+        "score": a.get("score"),
+        "hash": _vector_hash(v)
+    } for a, v in zip(albums, vectors)]
+    return vectors, labels
+
+
+def track_vectors(embeddings_path):
+    with open(embeddings_path, "r", encoding="utf-8") as f:
+        songs = [s for s in json.load(f) if s.get("audio_embedding") is not None]
+    vectors = np.asarray([s["audio_embedding"] for s in songs], dtype=np.float32)
+    labels = [{
+        "key": album_key(s.get("artist"), s.get("album")) + f"|||{(s.get('song') or '').strip().lower()}",
+        "artist": s.get("artist"),
+        "album": s.get("album"),
+        "song": s.get("song"),
+        "file_path": s.get("file_path"),
+        "hash": _vector_hash(v)
+    } for s, v in zip(songs, vectors)]
+    return vectors, labels
+
+
+class SimilarityIndex:
+    """Keyed wrapper around IVFIndex: label lookup, incremental sync and duplicate search."""
+
+    def __init__(self, index, path=None):
+        self.index = index
+        self.path = path
+        self._key_to_id = None
+
+    @classmethod
+    def build(cls, vectors, labels, path=None, n_lists=None):
+        return cls(IVFIndex.build(vectors, labels, n_lists=n_lists), path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(IVFIndex.load(path), Path(path))
+
+    def save(self, path=None):
+        self.path = Path(path or self.path)
+        self.index.save(self.path)
+
+    @property
+    def key_to_id(self):
+        if self._key_to_id is None:
+            self._key_to_id = {
+                label["key"]: i for i, label in enumerate(self.index.labels)
+                if label is not None and i not in self.index.deleted
+            }
+        return self._key_to_id
+
+    def sync(self, vectors, labels, compact_ratio=0.05):
+        """
+        Brings the index in line with a fresh (vectors, labels) snapshot.
+
+        Entries whose key disappeared or whose vector hash changed are tombstoned,
+        new and changed entries go to the delta segment, and the delta is folded
+        into the inverted lists once it exceeds `compact_ratio` of the index.
+        """
+        current = {label["key"]: i for i, label in enumerate(labels)}
+        stale = {item_id for key, item_id in self.key_to_id.items()
+                 if key not in current or self.index.labels[item_id]["hash"] != labels[current[key]]["hash"]}
+        fresh = [i for key, i in current.items()
+                 if key not in self.key_to_id or self.key_to_id[key] in stale]
+
+        self.index.remove(stale)
+        if fresh:
+            self.index.add(vectors[fresh], [labels[i] for i in fresh])
+        if len(self.index.delta_ids) + len(self.index.deleted) > compact_ratio * max(len(self.index.ids), 1):
+            self.index.compact()
+        self._key_to_id = None
+        return len(fresh), len(stale)
+
+    def query(self, vector, k=5, nprobe=8, exclude_key=None):
+        ids, scores = self.index.search(vector, k=k + 1, nprobe=nprobe)
+        results = []
+        for item_id, score in zip(ids, scores):
+            label = self.index.labels[item_id]
+            if label["key"] == exclude_key:
+                continue
+            result = {name: value for name, value in label.items() if name != "hash"}
+            result["similarity"] = float(score)
+            results.append(result)
+        return results[:k]
+
+    def query_key(self, key, k=5, nprobe=8):
+        if key not in self.key_to_id:
+            raise KeyError(f"'{key}' is not in the index.")
+        return self.query(self.index.vector(self.key_to_id[key]), k=k, nprobe=nprobe, exclude_key=key)
+
+    def find_duplicates(self, threshold=0.98, k=5, nprobe=2):
+        pairs = []
+        for key, item_id in self.key_to_id.items():
+            ids, scores = self.index.search(self.index.vector(item_id), k=k, nprobe=nprobe)
+            for other, score in zip(ids, scores):
+                if other > item_id and score >= threshold:
+                    pairs.append((key, self.index.labels[other]["key"], float(score)))
+        return sorted(pairs, key=lambda p: -p[2])
+
+
+def main():
+    default_dp = PROJECT_ROOT / "data" / "processed" / "dp.json"
+    default_embeddings = PROJECT_ROOT / "data" / "raw" / "clap_music_embeddings.json"
+    default_index_dir = PROJECT_ROOT / "models"
+
+    parser = argparse.ArgumentParser(description="Build and query the album/track similarity index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build or incrementally update an index.")
+    build.add_argument("kind", choices=("albums", "tracks"))
+    build.add_argument("--source", type=Path, default=None,
+                       help="dp.json for albums, clap_music_embeddings.json for tracks.")
+    build.add_argument("--index", type=Path, default=None)
+    build.add_argument("--n-lists", type=int, default=None)
+    build.add_argument("--rebuild", action="store_true", help="Rebuild from scratch instead of syncing.")
+
+    query = sub.add_parser("query", help="Show the nearest neighbours of an indexed album or track.")
+    query.add_argument("kind", choices=("albums", "tracks"))
+    query.add_argument("--artist", required=True)
+    query.add_argument("--album", required=True)
+    query.add_argument("--song", default=None)
+    query.add_argument("--index", type=Path, default=None)
+    query.add_argument("-k", type=int, default=5)
+    query.add_argument("--nprobe", type=int, default=8)
+
+    dupes = sub.add_parser("dupes", help="List near-duplicate pairs in an index.")
+    dupes.add_argument("kind", choices=("albums", "tracks"))
+    dupes.add_argument("--index", type=Path, default=None)
+    dupes.add_argument("--threshold", type=float, default=0.98)
+
+    args = parser.parse_args()
+    index_path = args.index or default_index_dir / f"{args.kind[:-1]}_index"
+
+    if args.command == "build":
+        start = time.perf_counter()
+        if args.kind == "albums":
+            vectors, labels = album_vectors(load_albums(args.source or default_dp))
+        else:
+            vectors, labels = track_vectors(args.source or default_embeddings)
+
+        if index_path.exists() and not args.rebuild:
+            index = SimilarityIndex.load(index_path)
+            added, removed = index.sync(vectors, labels)
+            print(f"Synced {index_path}: {added} added/updated, {removed} removed.")
+        else:
+            index = SimilarityIndex.build(vectors, labels, index_path, n_lists=args.n_lists)
+            print(f"Built {index_path}: {len(labels)} vectors in {index.index.n_lists} lists.")
+        index.save(index_path)
+        print(f"Done in {time.perf_counter() - start:.1f}s.")
+
+    elif args.command == "query":
+        index = SimilarityIndex.load(index_path)
+        key = album_key(args.artist, args.album)
+        if args.kind == "tracks":
+            key += f"|||{(args.song or '').strip().lower()}"
+        start = time.perf_counter()
+        results = index.query_key(key, k=args.k, nprobe=args.nprobe)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False))
+        print(f"Query took {elapsed_ms:.3f} ms.")
+
+    else:
+        index = SimilarityIndex.load(index_path)
+        pairs = index.find_duplicates(threshold=args.threshold)
+        for a, b, score in pairs:
+            print(f"{score:.4f}  {a}  <->  {b}")
+        print(f"{len(pairs)} near-duplicate pairs at cosine >= {args.threshold}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,26 @@
 import pandas as pd
 import json
+import hashlib
+import argparse
 import numpy as np
 import optuna
 import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
+from threading import Lock
+from optuna.study import MaxTrialsCallback
+from optuna.storages import RetryFailedTrialCallback
+from optuna.trial import TrialState
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.metrics import mean_squared_error
-from catboost import CatBoostRegressor
-from src.utils import ModelSaver
+from sklearn.decomposition import PCA
+from sklearn.random_projection import GaussianRandomProjection
+from sklearn.cross_decomposition import PLSRegression
+import tempfile
+from catboost import CatBoostRegressor, Pool, sum_models
+from catboost.utils import quantize
+from src.utils import ModelSaver, AlbumPooler, LinearProjection, ModelManifest, EmbeddingShardStore
 
 
 class DataLoader:
@@ -15,6 +28,10 @@ class DataLoader:
         self.filepath = filepath
 
     def load_data(self):
+        if self.filepath.suffix == ".jsonl":
+            with self.filepath.open("r", encoding="utf-8") as f:
+                return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
         with self.filepath.open("r", encoding="utf-8") as f:
             data = json.load(f)
 
@@ -24,93 +41,676 @@ class DataLoader:
             logging.error("JSON structure invalid. 'Albums' key is missing or not a list.")
             return pd.DataFrame()
 
+    def is_sharded(self):
+        return EmbeddingShardStore.is_store(self.filepath)
+
+    def load_store(self):
+        return EmbeddingShardStore(self.filepath)
+
 
 class FeatureExtractor:
-    @staticmethod
-    def avg_embedding(song_list):
-        embeds = [d['audio_embedding'] for d in song_list]
-        return np.mean(embeds, axis=0)
+    def __init__(self, pooler=None):
+        self.pooler = pooler or AlbumPooler()
 
-    def extract_features(self, df):
-        X = np.vstack(df['songs'].apply(self.avg_embedding).values)
+    def extract_features(self, df, cache=None):
         y = df['score'].values
+        if cache is None or 'content_hash' not in df:
+            return self.pooler.pool_albums(df['songs'].tolist()), y
+
+        hashes = [h if isinstance(h, str) else None for h in df['content_hash']]
+        rows = [cache.get(h) for h in hashes]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            pooled = self.pooler.pool_albums(df['songs'].iloc[missing].tolist())
+            for i, row in zip(missing, pooled):
+                rows[i] = row
+        logging.info(f"Feature cache: {len(rows) - len(missing)} albums reused, {len(missing)} pooled.")
+        X = np.vstack(rows)
+        cache.save(hashes, X)
         return X, y
 
+    def iter_features(self, store, chunk_albums=4096):
+        """Pools a shard store chunk by chunk; yields (albums, X, y) with memory bounded by the chunk size."""
+        for albums, audio, offsets, text, text_mask in store.iter_chunks(chunk_albums):
+            X = self.pooler.pool_matrices(audio, offsets, None, text, text_mask)
+            y = np.array([np.nan if a.get("score") is None else a["score"] for a in albums], dtype=np.float64)
+            yield albums, X, y
+
+    @staticmethod
+    def album_keys(df):
+        return [f"{artist.strip().lower()}|||{title.strip().lower()}"
+                for artist, title in zip(df['artist'], df['album_title'])]
+
+    @staticmethod
+    def album_fingerprints(X, y):
+        return [
+            hashlib.sha1(np.ascontiguousarray(row).tobytes() + repr(float(score)).encode()).hexdigest()[:16]
+            for row, score in zip(X, y)
+        ]
+
+
+class FeatureCache:
+    """
+    Pooled feature rows keyed by the per-album `content_hash` written by the merge.
+
+    Only albums whose hash is not in the cache get pooled again; the whole cache
+    is dropped when the pooling recipe changes.
+    """
+
+    def __init__(self, path, pooler):
+        self.path = Path(path)
+        self.recipe = json.dumps(pooler.to_dict(), sort_keys=True)
+        self.rows = {}
+        if self.path.exists():
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["recipe"]) == self.recipe:
+                    self.rows = dict(zip(data["hashes"].tolist(), data["features"]))
+
+    def get(self, content_hash):
+        return self.rows.get(content_hash) if content_hash else None
+
+    def save(self, hashes, X):
+        keep = [i for i, h in enumerate(hashes) if h]
+        self.rows = {hashes[i]: X[i] for i in keep}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, recipe=np.array(self.recipe), hashes=np.array([hashes[i] for i in keep], dtype=str),
+                     features=X[keep])
+        os.replace(tmp_path, self.path)
+
+
+class DimensionReducer:
+    METHODS = ("pca", "random", "pls")
+
+    def __init__(self, method="pca", n_components=64, random_state=0):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown reduction method '{method}'. Expected one of {self.METHODS}.")
+        self.method = method
+        self.n_components = n_components
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        n_components = min(self.n_components, X.shape[1], X.shape[0] - 1)
+        if self.method == "pca":
+            pca = PCA(n_components=n_components, random_state=self.random_state).fit(X)
+            return LinearProjection(pca.mean_, np.ones(X.shape[1]), pca.components_.T, self.method)
+
+        if self.method == "random":
+            rp = GaussianRandomProjection(n_components=n_components, random_state=self.random_state).fit(X)
+            return LinearProjection(np.zeros(X.shape[1]), np.ones(X.shape[1]), rp.components_.T, self.method)
+
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0, ddof=1)
+        scale[scale == 0.0] = 1.0
+        pls = PLSRegression(n_components=n_components, scale=False).fit((X - mean) / scale, y)
+        return LinearProjection(mean, scale, pls.x_rotations_, self.method)
+
+
+def score_bins(y, n_splits, max_bins=10):
+    n_bins = max(1, min(max_bins, len(y) // n_splits))
+    edges = np.quantile(y, np.linspace(0.0, 1.0, n_bins + 1)[1:-1])
+    return np.digitize(y, edges)
+
+
+class OptunaPruningCallback:
+    def __init__(self, trial, step_offset=0, report_every=25, metric="RMSE", lock=None):
+        self.trial = trial
+        self.step_offset = step_offset
+        self.report_every = report_every
+        self.metric = metric
+        self.lock = lock or Lock()
+        self.pruned = False
+
+    def after_iteration(self, info):
+        if info.iteration % self.report_every:
+            return True
+        value = info.metrics["validation"][self.metric][-1]
+        with self.lock:
+            self.trial.report(value, self.step_offset + info.iteration)
+            self.pruned = self.trial.should_prune()
+        return not self.pruned
+
+
+def _optimize_worker(trainer, study_name, storage, n_trials, thread_count):
+    study = optuna.load_study(study_name=study_name, storage=CatBoostTrainer.make_storage(storage))
+    trainer.thread_count = thread_count
+    study.optimize(
+        trainer.objective,
+        callbacks=[MaxTrialsCallback(n_trials, states=(TrialState.COMPLETE, TrialState.PRUNED))]
+    )
+
 
 class CatBoostTrainer:
-    def __init__(self, X, y):
-        self.X_train, X_temp, self.y_train, y_temp = train_test_split(X, y, test_size=0.3, random_state=0)
-        self.X_val, self.X_test, self.y_val, self.y_test = train_test_split(X_temp, y_temp, test_size=0.5,
-                                                                            random_state=0)
+    BORDER_COUNTS = (32, 64, 128, 254)
+
+    def __init__(self, X, y, n_folds=3, thread_count=-1, reducer=None, recipe=None):
+        self.train_idx, temp_idx = train_test_split(np.arange(len(y)), test_size=0.3, random_state=0)
+        self.val_idx, self.test_idx = train_test_split(temp_idx, test_size=0.5, random_state=0)
+        self.X_train, self.y_train = X[self.train_idx], y[self.train_idx]
+        self.X_val, self.y_val = X[self.val_idx], y[self.val_idx]
+        self.X_test, self.y_test = X[self.test_idx], y[self.test_idx]
+
+        self.projection = None
+        if reducer is not None:
+            self.projection = reducer.fit(self.X_train, self.y_train)
+            self.X_train = self.projection.transform(self.X_train)
+            self.X_val = self.projection.transform(self.X_val)
+            self.X_test = self.projection.transform(self.X_test)
+        self.n_folds = n_folds
+        self.thread_count = thread_count
         self.model = CatBoostRegressor()
+        self.members = None
 
-    def objective(self, trial):
-        params = {
+        cv = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42)
+        self.folds = list(cv.split(self.X_train, score_bins(self.y_train, n_folds)))
+        self._pool_cache = {}
+        self.fingerprint = self.study_fingerprint(recipe, reducer)
+
+    def study_fingerprint(self, recipe=None, reducer=None):
+        """
+        Identifies the tuning problem: the training rows and the feature space
+        they live in (pooling recipe, reduction). A persistent study is only
+        ever resumed or reused under the same fingerprint.
+        """
+        digest = hashlib.sha1(json.dumps({
+            "recipe": recipe,
+            "reducer": None if reducer is None else [reducer.method, reducer.n_components, reducer.random_state],
+            "shape": list(self.X_train.shape),
+            "n_folds": self.n_folds,
+        }, sort_keys=True).encode())
+        digest.update(np.ascontiguousarray(self.X_train).tobytes())
+        digest.update(np.ascontiguousarray(self.y_train, dtype=np.float64).tobytes())
+        return digest.hexdigest()[:16]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool_cache"] = {}
+        return state
+
+    @staticmethod
+    def suggest_params(trial):
+        return {
             "iterations": 500,
             "depth": trial.suggest_int("depth", 4, 10),
             "learning_rate": trial.suggest_float("learning_rate", 1e-3, 0.3, log=True),
             "l2_leaf_reg": trial.suggest_float("l2_leaf_reg", 1.0, 10.0),
             "bagging_temperature": trial.suggest_float("bagging_temperature", 0.0, 1.0),
-            "border_count": trial.suggest_int("border_count", 32, 255),
+            "border_count": trial.suggest_categorical("border_count", CatBoostTrainer.BORDER_COUNTS),
             "verbose": 0,
             "random_seed": 42
         }
 
-        cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
-        scores = cross_val_score(self.model, self.X_test, self.y_test, cv=cv, scoring='neg_root_mean_squared_error')
-        return scores.mean()
+    @staticmethod
+    def make_storage(storage):
+        if storage is None or not isinstance(storage, str):
+            return storage
+        return optuna.storages.RDBStorage(
+            storage,
+            heartbeat_interval=60,
+            grace_period=180,
+            failed_trial_callback=RetryFailedTrialCallback(max_retry=1)
+        )
+
+    def fold_pools(self, border_count):
+        if border_count not in self._pool_cache:
+            pool = Pool(self.X_train, self.y_train)
+            pool.quantize(border_count=border_count)
+            self._pool_cache[border_count] = [
+                (pool.slice(train_idx), pool.slice(valid_idx)) for train_idx, valid_idx in self.folds
+            ]
+        return self._pool_cache[border_count]
+
+    def _fit_fold(self, params, pools, thread_count, pruning):
+        train_pool, valid_pool = pools
+        model = CatBoostRegressor(**params, thread_count=thread_count, use_best_model=False)
+        model.fit(train_pool, eval_set=valid_pool, callbacks=[pruning] if pruning else None)
+        return model.get_evals_result()["validation"]["RMSE"][-1]
+
+    def cross_validate(self, params, trial=None):
+        params = dict(params)
+        fold_pools = self.fold_pools(params.pop("border_count", 254))
+        iterations = params.get("iterations", 1000)
+
+        budget = self.thread_count if self.thread_count > 0 else (os.cpu_count() or 1)
+        fold_threads = max(1, budget // len(fold_pools))
+        lock = Lock()
+        callbacks = [
+            OptunaPruningCallback(trial, step_offset=fold * iterations, lock=lock) if trial is not None else None
+            for fold in range(len(fold_pools))
+        ]
+
+        with ThreadPoolExecutor(max_workers=len(fold_pools)) as executor:
+            fold_scores = list(executor.map(
+                lambda fold: self._fit_fold(params, fold_pools[fold], fold_threads, callbacks[fold]),
+                range(len(fold_pools))
+            ))
+
+        if any(cb is not None and cb.pruned for cb in callbacks):
+            raise optuna.TrialPruned()
+        return float(np.mean(fold_scores))
+
+    def objective(self, trial):
+        return self.cross_validate(self.suggest_params(trial), trial)
+
+    def optimize(self, n_trials=30, n_jobs=1, storage=None, study_name=None):
+        # Keyed by the data fingerprint: a study tuned on other data or another feature space is never picked up.
+        study_name = study_name or f"catboost-{self.fingerprint}"
+        if n_jobs > 1 and storage is None:
+            raise ValueError("Parallel tuning needs a shared storage URL, e.g. 'sqlite:///optuna.db'.")
+
+        study = optuna.create_study(
+            direction="minimize",
+            study_name=study_name,
+            storage=self.make_storage(storage),
+            pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=100),
+            load_if_exists=True
+        )
+        finished = len(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)))
+        if finished >= n_trials:
+            print(f"Study '{study_name}' already tuned on identical data ({finished} trials); reusing its best params.")
+        elif finished:
+            print(f"Resuming study '{study_name}' with {finished}/{n_trials} trials finished.")
+
+        if finished < n_trials:
+            if n_jobs > 1:
+                thread_count = max(1, (os.cpu_count() or 1) // n_jobs)
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    futures = [
+                        executor.submit(_optimize_worker, self, study_name, storage, n_trials, thread_count)
+                        for _ in range(n_jobs)
+                    ]
+                    for future in futures:
+                        future.result()
+            else:
+                study.optimize(self.objective, n_trials=n_trials - finished)
 
-    def optimize(self, n_trials=30):
-        study = optuna.create_study(direction="maximize", study_name="CatBoost Optimization")
-        study.optimize(self.objective, n_trials=n_trials)
+        print(f"Best CV RMSE: {study.best_value:.2f}")
         return study.best_trial.params
 
     def train_final_model(self, best_params):
+        self.best_params = self._final_params(best_params, verbose=100)
+        self.model = CatBoostRegressor(**self.best_params)
+        self.model.fit(self.X_train, self.y_train, eval_set=(self.X_val, self.y_val))
+
+    @staticmethod
+    def _final_params(best_params, verbose=0):
         best_params.update({
             "iterations": 1000,
             "early_stopping_rounds": 50,
             "eval_metric": "RMSE",
-            "verbose": 100,
+            "verbose": verbose,
             "random_seed": 42
         })
-        self.model = CatBoostRegressor(**best_params)
-        self.model.fit(self.X_train, self.y_train, eval_set=(self.X_val, self.y_val))
+        return best_params
+
+    def train_ensemble(self, best_params, n_models=5):
+        """
+        Trains one model per fold of train+val, each early-stopped on its held-out fold.
+
+        The members are averaged into a single CatBoost model with sum_models, so the
+        .cbm and every exported backend score the ensemble mean in one pass.
+        """
+        self.best_params = self._final_params(best_params)
+        X = np.vstack([self.X_train, self.X_val])
+        y = np.concatenate([self.y_train, self.y_val])
+        cv = StratifiedKFold(n_splits=n_models, shuffle=True, random_state=42)
+
+        self.members = []
+        for fold, (train_idx, valid_idx) in enumerate(cv.split(X, score_bins(y, n_models))):
+            model = CatBoostRegressor(**self.best_params)
+            model.fit(X[train_idx], y[train_idx], eval_set=(X[valid_idx], y[valid_idx]))
+            print(f"Ensemble member {fold + 1}/{n_models}: {model.tree_count_} trees, "
+                  f"fold RMSE {model.get_best_score()['validation']['RMSE']:.2f}")
+            self.members.append(model)
+        self.model = sum_models(self.members, weights=[1.0 / n_models] * n_models)
 
     def evaluate(self):
         y_pred = self.model.predict(self.X_test)
         rmse = np.sqrt(mean_squared_error(self.y_test, y_pred))
         print(f"Final RMSE on test set: {rmse:.2f}")
+        return float(rmse)
 
     def get_model(self):
         return self.model
 
 
+class IncrementalUpdater:
+    def __init__(self, model, state, projection=None, iterations=200, learning_rate=None, drift_threshold=0.05,
+                 max_changed_fraction=0.3):
+        self.model = model
+        self.state = state
+        self.projection = projection
+        self.iterations = iterations
+        self.learning_rate = learning_rate
+        self.drift_threshold = drift_threshold
+        self.max_changed_fraction = max_changed_fraction
+
+    def changed_rows(self, keys, fingerprints):
+        known = self.state["albums"]
+        holdout = set(self.state["holdout"])
+        return np.array([
+            i for i, (key, fp) in enumerate(zip(keys, fingerprints))
+            if key not in holdout and known.get(key) != fp
+        ], dtype=np.int64)
+
+    def holdout_rows(self, keys):
+        holdout = set(self.state["holdout"])
+        return np.array([i for i, key in enumerate(keys) if key in holdout], dtype=np.int64)
+
+    def update(self, X, y, keys, fingerprints):
+        """
+        Continues boosting the saved model on new or changed albums only.
+
+        Returns (model, report); model is None when nothing changed or when the
+        update should be discarded in favour of a full retrain (see report["action"]).
+        """
+        report = {"changed": 0, "action": "noop"}
+        if X.shape[1] != self.state.get("feature_dim"):
+            report["action"] = "retrain"
+            report["reason"] = f"feature dim {X.shape[1]} != {self.state.get('feature_dim')}"
+            return None, report
+
+        if self.projection is not None:
+            X = self.projection.transform(X)
+
+        changed = self.changed_rows(keys, fingerprints)
+        report["changed"] = int(changed.size)
+        if changed.size == 0:
+            return None, report
+        if changed.size > self.max_changed_fraction * len(keys):
+            report["action"] = "retrain"
+            report["reason"] = f"{changed.size}/{len(keys)} albums changed"
+            return None, report
+
+        holdout = self.holdout_rows(keys)
+        if holdout.size == 0:
+            report["action"] = "retrain"
+            report["reason"] = "none of the holdout albums are left in the dataset"
+            return None, report
+
+        params = dict(self.state["params"])
+        params.pop("early_stopping_rounds", None)
+        params.update({"iterations": self.iterations, "verbose": 0, "random_seed": 42})
+        if self.learning_rate is not None:
+            params["learning_rate"] = self.learning_rate
+        model = CatBoostRegressor(**params)
+        model.fit(X[changed], y[changed], init_model=self.model)
+
+        baseline = self.state["holdout_rmse"]
+        rmse_before = np.sqrt(mean_squared_error(y[holdout], self.model.predict(X[holdout])))
+        rmse_after = np.sqrt(mean_squared_error(y[holdout], model.predict(X[holdout])))
+        drift = (rmse_after - baseline) / baseline
+        report.update({
+            "holdout_size": int(holdout.size),
+            "holdout_rmse_baseline": baseline,
+            "holdout_rmse_before": float(rmse_before),
+            "holdout_rmse_after": float(rmse_after),
+            "drift": float(drift)
+        })
+        print(f"Incremental update on {changed.size} albums: holdout RMSE {baseline:.2f} (baseline) -> "
+              f"{rmse_before:.2f} (before) -> {rmse_after:.2f} (after), drift {drift:+.1%}")
+
+        if drift > self.drift_threshold:
+            report["action"] = "retrain"
+            report["reason"] = f"holdout drift {drift:+.1%} above {self.drift_threshold:.1%}"
+            return None, report
+
+        report["action"] = "update"
+        return model, report
+
+
+class OutOfCoreTrainer:
+    DEFAULT_PARAMS = {
+        "depth": 6,
+        "learning_rate": 0.05,
+        "l2_leaf_reg": 3.0
+    }
+
+    def __init__(self, store, extractor, work_dir, params=None, border_count=254, chunk_albums=4096,
+                 used_ram_limit=None):
+        self.store = store
+        self.extractor = extractor
+        self.work_dir = Path(work_dir)
+        self.params = CatBoostTrainer._final_params(dict(params or self.DEFAULT_PARAMS), verbose=100)
+        self.params.pop("border_count", None)
+        self.border_count = border_count
+        self.chunk_albums = chunk_albums
+        self.used_ram_limit = used_ram_limit
+        self.model = None
+        self.keys, self.fingerprints, self.holdout = [], [], []
+        self.feature_dim = None
+
+    @staticmethod
+    def split_of(key):
+        bucket = int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % 100
+        return "train" if bucket < 70 else "val" if bucket < 85 else "test"
+
+    def write_splits(self):
+        """Streams pooled features into per-split TSV files that CatBoost can quantize from disk."""
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.work_dir / "pool.cd", "w", encoding="utf-8") as f:
+            f.write("0\tLabel\n")
+
+        files = {split: open(self.work_dir / f"{split}.tsv", "w", encoding="utf-8")
+                 for split in ("train", "val", "test")}
+        try:
+            for albums, X, y in self.extractor.iter_features(self.store, self.chunk_albums):
+                self.feature_dim = X.shape[1]
+                keys = [f"{(a.get('artist') or '').strip().lower()}|||{(a.get('album_title') or '').strip().lower()}"
+                        for a in albums]
+                fingerprints = self.extractor.album_fingerprints(X, y)
+                splits = np.array([self.split_of(key) for key in keys])
+                valid = ~np.isnan(y)
+                for split, f in files.items():
+                    rows = (splits == split) & valid
+                    if rows.any():
+                        np.savetxt(f, np.column_stack([y[rows], X[rows]]), delimiter="\t", fmt="%.9g")
+                for key, fp, split, ok in zip(keys, fingerprints, splits, valid):
+                    if ok:
+                        self.keys.append(key)
+                        self.fingerprints.append(fp)
+                        if split == "test":
+                            self.holdout.append(key)
+        finally:
+            for f in files.values():
+                f.close()
+
+    def has_rows(self, split):
+        path = self.work_dir / f"{split}.tsv"
+        return path.exists() and path.stat().st_size > 0
+
+    def quantize_splits(self):
+        """Quantized train pool plus, when any album hashed into it, the val pool."""
+        if not self.has_rows("train"):
+            raise ValueError("No labelled albums fell into the training split.")
+        cd = str(self.work_dir / "pool.cd")
+        borders = str(self.work_dir / "borders.tsv")
+        pools = {}
+        train = quantize(str(self.work_dir / "train.tsv"), column_description=cd, border_count=self.border_count,
+                         used_ram_limit=self.used_ram_limit)
+        train.save_quantization_borders(borders)
+        pools["train"] = train
+        if self.has_rows("val"):
+            pools["val"] = quantize(str(self.work_dir / "val.tsv"), column_description=cd, input_borders=borders,
+                                    used_ram_limit=self.used_ram_limit)
+        for split, pool in pools.items():
+            pool.save(str(self.work_dir / f"{split}.quantized"))
+        return {split: Pool(f"quantized://{self.work_dir / f'{split}.quantized'}") for split in pools}
+
+    def train(self):
+        self.write_splits()
+        pools = self.quantize_splits()
+        params = dict(self.params)
+        if "val" not in pools:
+            print("No validation albums; training for the full iteration budget without early stopping.")
+            params.pop("early_stopping_rounds", None)
+        self.model = CatBoostRegressor(**params, used_ram_limit=self.used_ram_limit)
+        self.model.fit(pools["train"], eval_set=pools.get("val"))
+        return self.model
+
+    def evaluate(self, chunk_rows=10_000):
+        if not self.has_rows("test"):
+            print("No albums in the test split; skipping evaluation.")
+            return None
+        squared_error, n = 0.0, 0
+        for chunk in pd.read_csv(self.work_dir / "test.tsv", sep="\t", header=None, chunksize=chunk_rows):
+            values = chunk.to_numpy(dtype=np.float64)
+            y_pred = self.model.predict(values[:, 1:])
+            squared_error += float(np.sum((values[:, 0] - y_pred) ** 2))
+            n += len(values)
+        rmse = float(np.sqrt(squared_error / max(n, 1)))
+        print(f"Final RMSE on test set: {rmse:.2f} ({n} albums)")
+        return rmse
+
+
 class Pipeline:
-    def __init__(self, data_path):
+    def __init__(self, data_path, pooler=None, n_trials=30, n_jobs=1, storage=None, incremental=False,
+                 drift_threshold=0.05, reducer=None, clap_checkpoint=None, backends=("numpy",), ensemble=0):
         self.data_path = data_path
+        self.ensemble = ensemble
+        self.pooler = pooler or AlbumPooler()
+        self.reducer = reducer
+        self.clap_checkpoint = clap_checkpoint
+        self.backends = backends
+        self.n_trials = n_trials
+        self.n_jobs = n_jobs
+        self.storage = storage
+        self.incremental = incremental
+        self.drift_threshold = drift_threshold
+
+    def _run_incremental(self, X, y, keys, fingerprints):
+        model_path = ModelSaver(None, self.data_path).save_path
+        state = ModelSaver.load_state(model_path)
+        if state is None or not model_path.exists():
+            print("No saved model state found, running a full retrain.")
+            return False
+
+        projection = ModelSaver.load_projection(model_path)
+        updater = IncrementalUpdater(ModelSaver.load(model_path), state, projection=projection,
+                                     drift_threshold=self.drift_threshold)
+        model, report = updater.update(X, y, keys, fingerprints)
+        if report["action"] == "noop":
+            print("No new or changed albums since the last training run.")
+            return True
+        if report["action"] == "retrain":
+            print(f"Falling back to a full retrain: {report['reason']}")
+            return False
+
+        state["albums"].update(dict(zip(keys, fingerprints)))
+        state["last_update"] = report
+        manifest = ModelSaver.load_manifest(model_path) or self._build_manifest(X, projection, {})
+        manifest.data["metrics"]["holdout_rmse_after_update"] = report["holdout_rmse_after"]
+        manifest.data.pop("ensemble", None)
+        ModelSaver(model, self.data_path).save(state=state, projection=projection, manifest=manifest,
+                                               backends=self.backends)
+        return True
+
+    def _build_manifest(self, X, projection, metrics):
+        return ModelManifest.build(
+            feature_dim=X.shape[1],
+            pooling=self.pooler.to_dict(),
+            clap_checkpoint=self.clap_checkpoint,
+            projection=projection,
+            metrics=metrics
+        )
+
+    def run_out_of_core(self, store):
+        model_path = ModelSaver(None, self.data_path).save_path
+        previous = ModelSaver.load_state(model_path)
+        params = previous["params"] if previous else None
+
+        with tempfile.TemporaryDirectory(prefix="catboost_pools_", dir=Path(self.data_path).parent) as work_dir:
+            trainer = OutOfCoreTrainer(store, FeatureExtractor(self.pooler), work_dir, params=params)
+            model = trainer.train()
+            rmse = trainer.evaluate()
+
+        state = {
+            "params": trainer.params,
+            "feature_dim": trainer.feature_dim,
+            "albums": dict(zip(trainer.keys, trainer.fingerprints)),
+            "holdout": trainer.holdout,
+            "holdout_rmse": rmse
+        }
+        manifest = ModelManifest.build(
+            feature_dim=trainer.feature_dim,
+            pooling=self.pooler.to_dict(),
+            clap_checkpoint=self.clap_checkpoint,
+            metrics={"holdout_rmse": rmse, "n_albums": len(trainer.keys)}
+        )
+        ModelSaver(model, self.data_path).save(state=state, manifest=manifest, backends=self.backends)
 
     def run(self):
         loader = DataLoader(self.data_path)
+        if loader.is_sharded():
+            self.run_out_of_core(loader.load_store())
+            return
+
         df = loader.load_data()
         if df.empty:
             return
 
-        extractor = FeatureExtractor()
-        X, y = extractor.extract_features(df)
+        extractor = FeatureExtractor(self.pooler)
+        model_path = ModelSaver(None, self.data_path).save_path
+        X, y = extractor.extract_features(df, FeatureCache(model_path.with_name("feature_cache.npz"), self.pooler))
+        keys = extractor.album_keys(df)
+        fingerprints = extractor.album_fingerprints(X, y)
+
+        if self.incremental and self._run_incremental(X, y, keys, fingerprints):
+            return
 
-        trainer = CatBoostTrainer(X, y)
-        best_params = trainer.optimize()
-        trainer.train_final_model(best_params)
-        trainer.evaluate()
+        trainer = CatBoostTrainer(X, y, reducer=self.reducer, recipe=self.pooler.to_dict())
+        best_params = trainer.optimize(n_trials=self.n_trials, n_jobs=self.n_jobs, storage=self.storage)
+        if self.ensemble > 1:
+            trainer.train_ensemble(best_params, n_models=self.ensemble)
+        else:
+            trainer.train_final_model(best_params)
+        rmse = trainer.evaluate()
 
         model = trainer.get_model()
-        saver = ModelSaver(model, self.data_path)
-        saver.save()
+        state = {
+            "params": trainer.best_params,
+            "feature_dim": int(X.shape[1]),
+            "albums": dict(zip(keys, fingerprints)),
+            "holdout": [keys[i] for i in trainer.test_idx],
+            "holdout_rmse": rmse
+        }
+        manifest = self._build_manifest(X, trainer.projection, {"holdout_rmse": rmse, "n_albums": len(keys)})
+        if trainer.members:
+            manifest.data["ensemble"] = {
+                "n_models": len(trainer.members),
+                "tree_counts": [m.tree_count_ for m in trainer.members]
+            }
+        saver = ModelSaver(model, self.data_path, members=trainer.members)
+        saver.save(state=state, projection=trainer.projection, manifest=manifest, backends=self.backends)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the CatBoost album scorer.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Continue boosting the saved model on new albums instead of retraining.")
+    parser.add_argument("--drift-threshold", type=float, default=0.05,
+                        help="Relative holdout RMSE increase that triggers a full retrain.")
+    parser.add_argument("--reduce", choices=DimensionReducer.METHODS, default=None,
+                        help="Project pooled features to a lower dimension before CatBoost.")
+    parser.add_argument("--components", type=int, default=64,
+                        help="Target dimension for --reduce.")
+    parser.add_argument("--export", nargs="*", choices=("numpy", "onnx"), default=["numpy"],
+                        help="Fast-inference artifacts to export next to the .cbm.")
+    parser.add_argument("--data", type=Path, default=None,
+                        help="Merged dp.json, or a shard directory for out-of-core training.")
+    parser.add_argument("--ensemble", type=int, default=0,
+                        help="Train a K-fold ensemble of this many models instead of a single model.")
+    args = parser.parse_args()
+
     ROOT = Path(__file__).resolve().parents[2]
-    file_path = ROOT / "data" / "processed" / "dp.json"
+    file_path = args.data or ROOT / "data" / "processed" / "dp.json"
+    study_db = ROOT / "data" / "processed" / "models" / "optuna.db"
+    study_db.parent.mkdir(parents=True, exist_ok=True)
 
-    pipeline = Pipeline(file_path)
+    pipeline = Pipeline(file_path, n_jobs=max(1, (os.cpu_count() or 1) // 4), storage=f"sqlite:///{study_db}",
+                        incremental=args.incremental, drift_threshold=args.drift_threshold,
+                        reducer=DimensionReducer(args.reduce, args.components) if args.reduce else None,
+                        clap_checkpoint=ROOT / "models" / "music_speech_epoch_15_esc_89.25.pt",
+                        backends=tuple(args.export), ensemble=args.ensemble)
     pipeline.run()
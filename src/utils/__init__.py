@@ -1 +1,6 @@
-from .model_saver import ModelSaver
\ No newline at end of file
+from .model_saver import ModelSaver
+from .pooling import AlbumPooler
+from .projection import LinearProjection
+from .manifest import ModelManifest
+from .tree_inference import FlatTreeEnsemble
+from .shards import EmbeddingShardStore, EmbeddingShardWriter
@@ -0,0 +1,83 @@
+from pathlib import Path
+import numpy as np
+from catboost import CatBoostRegressor
+from .tree_inference import FlatTreeEnsemble
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+class CatBoostPredictor:
+    backend = "catboost"
+
+    def __init__(self, path):
+        self.model = CatBoostRegressor()
+        self.model.load_model(str(path))
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+    def predict_with_spread(self, X):
+        return self.predict(X), None
+
+
+class NumpyTreePredictor:
+    backend = "numpy"
+
+    def __init__(self, path):
+        self.model = FlatTreeEnsemble.load(path)
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+    def predict_with_spread(self, X):
+        if self.model.n_models == 1:
+            return self.predict(X), None
+        return self.model.predict_with_spread(X)
+
+
+class OnnxPredictor:
+    backend = "onnx"
+
+    def __init__(self, path):
+        if onnxruntime is None:
+            raise ImportError("The 'onnxruntime' package is required for the ONNX backend.")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return self.session.run([self.output_name], {self.input_name: X})[0].reshape(-1)
+
+    def predict_with_spread(self, X):
+        return self.predict(X), None
+
+
+BACKENDS = {
+    "numpy": NumpyTreePredictor,
+    "onnx": OnnxPredictor,
+    "catboost": CatBoostPredictor
+}
+
+
+def load_predictor(model_path, manifest=None, backend="auto"):
+    model_path = Path(model_path)
+    files = {"catboost": model_path.name}
+    if manifest is not None:
+        files.update(manifest.get("backends", {}))
+
+    order = [backend] if backend != "auto" else ["numpy", "onnx", "catboost"]
+    for name in order:
+        if name not in files:
+            continue
+        if name == "onnx" and onnxruntime is None and backend == "auto":
+            continue
+        return BACKENDS[name](model_path.parent / files[name])
+    raise FileNotFoundError(f"No '{backend}' inference artifact found next to {model_path}.")
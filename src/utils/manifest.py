@@ -0,0 +1,91 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+
+
+MANIFEST_VERSION = 1
+
+
+def file_fingerprint(path, chunk_size=4 * 1024 * 1024):
+    """
+    sha256 over the file size and its first and last chunks.
+
+    Cheap enough to run on every app start against a multi-hundred-MB checkpoint
+    while still telling different checkpoint files apart.
+    """
+    path = Path(path)
+    size = path.stat().st_size
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            digest.update(f.read(chunk_size))
+    return digest.hexdigest()
+
+
+class ModelManifest:
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def build(cls, feature_dim, pooling, clap_checkpoint=None, projection=None, metrics=None):
+        checkpoint = None
+        if clap_checkpoint is not None and Path(clap_checkpoint).exists():
+            checkpoint = {"name": Path(clap_checkpoint).name, "fingerprint": file_fingerprint(clap_checkpoint)}
+        return cls({
+            "version": MANIFEST_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "feature_dim": int(feature_dim),
+            "model_input_dim": int(projection.output_dim if projection is not None else feature_dim),
+            "pooling": pooling,
+            "projection": None if projection is None else {
+                "method": projection.method,
+                "input_dim": projection.input_dim,
+                "output_dim": projection.output_dim
+            },
+            "clap_checkpoint": checkpoint,
+            "metrics": metrics or {},
+            "backends": {}
+        })
+
+    @staticmethod
+    def path_for(model_path):
+        model_path = Path(model_path)
+        return model_path.with_name(f"{model_path.stem}.manifest.json")
+
+    def save(self, model_path):
+        with open(self.path_for(model_path), "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+
+    @classmethod
+    def load(cls, model_path):
+        path = cls.path_for(model_path)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def validate(self, pooled_dim=None, clap_checkpoint=None):
+        if self.data.get("version", 0) > MANIFEST_VERSION:
+            raise ValueError(f"Model manifest version {self.data['version']} is newer than supported "
+                             f"({MANIFEST_VERSION}).")
+        if pooled_dim is not None and pooled_dim != self.data["feature_dim"]:
+            raise ValueError(f"Pooled feature dim {pooled_dim} does not match the model's "
+                             f"{self.data['feature_dim']}.")
+
+        expected = self.data.get("clap_checkpoint")
+        if expected and clap_checkpoint is not None:
+            if not Path(clap_checkpoint).exists():
+                raise FileNotFoundError(f"CLAP checkpoint not found: {clap_checkpoint}")
+            actual = file_fingerprint(clap_checkpoint)
+            if actual != expected["fingerprint"]:
+                raise ValueError(f"CLAP checkpoint {Path(clap_checkpoint).name} differs from the one the model "
+                                 f"was trained with ({expected['name']}).")
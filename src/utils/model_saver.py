@@ -1,19 +1,96 @@
+import json
 from pathlib import Path
 from catboost import CatBoostRegressor
+from .projection import LinearProjection
+from .tree_inference import FlatTreeEnsemble
+from .manifest import ModelManifest
+from .inference import load_predictor
 
 
 class ModelSaver:
-    def __init__(self, model, reference_file, save_dir ="models", filename="catboost_model.cbm"):
+    def __init__(self, model, reference_file, save_dir ="models", filename="catboost_model.cbm", members=None):
         self.model = model
+        self.members = members
         self.save_path = Path(reference_file).parent / save_dir / filename
 
-    def save(self):
+    @staticmethod
+    def state_path(model_path):
+        model_path = Path(model_path)
+        return model_path.with_name(f"{model_path.stem}.state.json")
+
+    @staticmethod
+    def projection_path(model_path):
+        model_path = Path(model_path)
+        return model_path.with_name(f"{model_path.stem}.projection.npz")
+
+    def _export(self, backend):
+        if backend == "numpy":
+            path = self.save_path.with_name(f"{self.save_path.stem}.trees.npz")
+            if self.members:
+                FlatTreeEnsemble.from_catboost_models(self.members).save(path)
+            else:
+                FlatTreeEnsemble.from_catboost(self.model).save(path)
+        elif backend == "onnx":
+            path = self.save_path.with_suffix(".onnx")
+            self.model.save_model(str(path), format="onnx", export_parameters={
+                "onnx_domain": "ai.catboost",
+                "onnx_graph_name": self.save_path.stem
+            })
+        else:
+            raise ValueError(f"Unknown export backend: {backend}")
+        print(f"Exported {backend} inference artifact to {path}")
+        return path.name
+
+    def save(self, state=None, projection=None, manifest=None, backends=("numpy",)):
         self.save_path.parent.mkdir(parents=True, exist_ok=True)
         self.model.save_model(str(self.save_path))
         print(f"Model saved to {self.save_path}")
 
+        if manifest is not None:
+            manifest.data["backends"] = {"catboost": self.save_path.name}
+            for backend in backends:
+                manifest.data["backends"][backend] = self._export(backend)
+            manifest.save(self.save_path)
+        elif ModelManifest.path_for(self.save_path).exists():
+            ModelManifest.path_for(self.save_path).unlink()
+
+        projection_path = self.projection_path(self.save_path)
+        if projection is not None:
+            projection.save(projection_path)
+            print(f"Projection ({projection.method}, {projection.input_dim} -> {projection.output_dim}) "
+                  f"saved to {projection_path}")
+        elif projection_path.exists():
+            projection_path.unlink()
+
+        if state is not None:
+            with open(self.state_path(self.save_path), "w", encoding="utf-8") as f:
+                json.dump(state, f)
+
     @staticmethod
     def load(path):
         model = CatBoostRegressor()
         model.load_model(str(path))
         return model
+
+    @staticmethod
+    def load_state(path):
+        state_path = ModelSaver.state_path(path)
+        if not state_path.exists():
+            return None
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def load_projection(path):
+        projection_path = ModelSaver.projection_path(path)
+        if not projection_path.exists():
+            return None
+        return LinearProjection.load(projection_path)
+
+    @staticmethod
+    def load_manifest(path):
+        return ModelManifest.load(path)
+
+    @staticmethod
+    def load_predictor(path, backend="auto"):
+        return load_predictor(path, ModelSaver.load_manifest(path), backend)
@@ -0,0 +1,133 @@
+import numpy as np
+
+
+class AlbumPooler:
+    STATS = ("mean", "std", "min", "max", "wmean")
+
+    def __init__(self, stats=("mean",), include_text=False, position_decay=1.0):
+        unknown = [s for s in stats if s not in self.STATS]
+        if unknown:
+            raise ValueError(f"Unknown pooling stats: {unknown}. Expected any of {self.STATS}.")
+        if not stats:
+            raise ValueError("At least one pooling stat is required.")
+        self.stats = tuple(stats)
+        self.include_text = include_text
+        self.position_decay = position_decay
+
+    def to_dict(self):
+        return {
+            "stats": list(self.stats),
+            "include_text": self.include_text,
+            "position_decay": self.position_decay
+        }
+
+    @classmethod
+    def from_dict(cls, recipe):
+        return cls(
+            stats=tuple(recipe.get("stats", ("mean",))),
+            include_text=recipe.get("include_text", False),
+            position_decay=recipe.get("position_decay", 1.0)
+        )
+
+    def output_dim(self, embedding_dim):
+        blocks = 2 if self.include_text else 1
+        return embedding_dim * len(self.stats) * blocks
+
+    @staticmethod
+    def flatten(song_lists, key="audio_embedding"):
+        """
+        Stacks the per-song vectors of every album into one (n_songs, dim) matrix.
+
+        Returns the matrix, album offsets of length n_albums + 1 and a boolean mask
+        marking the rows where the song actually had a vector under `key`. An
+        album without songs gets an empty segment.
+        """
+        song_lists = [songs or [] for songs in song_lists]
+        counts = np.fromiter((len(songs) for songs in song_lists), dtype=np.int64)
+        if counts.size == 0:
+            raise ValueError("No albums to pool.")
+        offsets = np.zeros(counts.size + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        vectors = [song.get(key) for songs in song_lists for song in songs]
+        mask = np.fromiter((v is not None for v in vectors), dtype=bool, count=len(vectors))
+        if not mask.any():
+            return None, offsets, mask
+
+        dim = len(vectors[int(np.argmax(mask))])
+        matrix = np.zeros((len(vectors), dim), dtype=np.float64)
+        present = np.flatnonzero(mask)
+        matrix[present] = np.asarray([vectors[i] for i in present], dtype=np.float64)
+        return matrix, offsets, mask
+
+    def _position_weights(self, offsets, n_rows):
+        counts = np.diff(offsets)
+        positions = np.arange(n_rows) - np.repeat(offsets[:-1], counts)
+        return np.power(float(self.position_decay), positions)
+
+    def pool(self, matrix, offsets, mask=None):
+        """
+        Segment-reduces a flat (n_songs, dim) matrix into one row per album.
+
+        All requested stats come out of the same pass over the matrix via
+        `ufunc.reduceat`; rows where `mask` is False are ignored and albums
+        without any valid row pool to zeros. Albums without songs at all pool
+        to NaN, which CatBoost treats as missing values.
+        """
+        sizes = np.diff(offsets)
+        if (sizes == 0).any():
+            # reduceat cannot express an empty segment, so only the non-empty albums are reduced.
+            nonempty = sizes > 0
+            pooled = np.full((sizes.size, matrix.shape[1] * len(self.stats)), np.nan)
+            if nonempty.any():
+                pooled[nonempty] = self.pool(matrix, np.append(offsets[:-1][nonempty], offsets[-1]), mask)
+            return pooled
+
+        starts = offsets[:-1]
+        if mask is None:
+            mask = np.ones(matrix.shape[0], dtype=bool)
+        weights = mask.astype(np.float64)
+
+        counts = np.add.reduceat(weights, starts)
+        safe_counts = np.maximum(counts, 1.0)[:, None]
+        empty = counts == 0
+        masked = matrix * weights[:, None]
+
+        sums = np.add.reduceat(masked, starts, axis=0)
+        mean = sums / safe_counts
+
+        blocks = []
+        for stat in self.stats:
+            if stat == "mean":
+                block = mean
+            elif stat == "std":
+                sq_sums = np.add.reduceat(masked * matrix, starts, axis=0)
+                block = np.sqrt(np.maximum(sq_sums / safe_counts - mean ** 2, 0.0))
+            elif stat == "min":
+                block = np.minimum.reduceat(np.where(mask[:, None], matrix, np.inf), starts, axis=0)
+            elif stat == "max":
+                block = np.maximum.reduceat(np.where(mask[:, None], matrix, -np.inf), starts, axis=0)
+            else:
+                pos_weights = self._position_weights(offsets, matrix.shape[0]) * weights
+                weight_sums = np.maximum(np.add.reduceat(pos_weights, starts), 1e-12)[:, None]
+                block = np.add.reduceat(matrix * pos_weights[:, None], starts, axis=0) / weight_sums
+            block = np.where(empty[:, None], 0.0, block)
+            blocks.append(block)
+        return np.hstack(blocks)
+
+    def pool_matrices(self, audio, offsets, audio_mask=None, text=None, text_mask=None):
+        features = [self.pool(audio, offsets, audio_mask)]
+        if self.include_text:
+            if text is None:
+                text, text_mask = np.zeros_like(audio), np.zeros(audio.shape[0], dtype=bool)
+            features.append(self.pool(text, offsets, text_mask))
+        return np.hstack(features)
+
+    def pool_albums(self, song_lists):
+        audio, offsets, audio_mask = self.flatten(song_lists, "audio_embedding")
+        if audio is None:
+            raise ValueError("Empty audio embeddings.")
+        text, text_mask = None, None
+        if self.include_text:
+            text, _, text_mask = self.flatten(song_lists, "text_embedding")
+        return self.pool_matrices(audio, offsets, audio_mask, text, text_mask)
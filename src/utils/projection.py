@@ -0,0 +1,33 @@
+from pathlib import Path
+import numpy as np
+
+
+class LinearProjection:
+    def __init__(self, mean, scale, components, method):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.components = np.asarray(components, dtype=np.float64)
+        self.method = method
+
+    @property
+    def input_dim(self):
+        return self.components.shape[0]
+
+    @property
+    def output_dim(self):
+        return self.components.shape[1]
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.shape[1] != self.input_dim:
+            raise ValueError(f"Projection expects {self.input_dim} features, got {X.shape[1]}.")
+        return ((X - self.mean) / self.scale) @ self.components
+
+    def save(self, path):
+        np.savez(Path(path), mean=self.mean, scale=self.scale, components=self.components,
+                 method=np.array(self.method))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(Path(path)) as data:
+            return cls(data["mean"], data["scale"], data["components"], str(data["method"]))
@@ -0,0 +1,195 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+import numpy as np
+
+
+class EmbeddingShardWriter:
+    """
+    Appends album song embeddings to fixed-width float32 shard files.
+
+    Each shard is a raw `.f32` file of (rows, dim) float32 values that is later
+    opened with np.memmap. Albums never straddle two shards, so any run of
+    albums inside one shard can be pooled from a single contiguous view.
+    """
+
+    def __init__(self, directory, dim, shard_rows=1_000_000, include_text=False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.shard_rows = shard_rows
+        self.include_text = include_text
+        self.shards = []
+        self._shard_id = -1
+        self._rows = 0
+        self._files = None
+        self._albums = open(self.directory / "albums.jsonl", "w", encoding="utf-8")
+        self._open_shard()
+
+    def _open_shard(self):
+        self._close_shard()
+        self._shard_id += 1
+        self._rows = 0
+        name = f"shard_{self._shard_id:05d}"
+        self._files = {"audio": open(self.directory / f"{name}.audio.f32", "wb")}
+        if self.include_text:
+            self._files["text"] = open(self.directory / f"{name}.text.f32", "wb")
+            self._files["text_mask"] = open(self.directory / f"{name}.text_mask.u8", "wb")
+        self.shards.append({"name": name, "rows": 0})
+
+    def _close_shard(self):
+        if self._files:
+            for f in self._files.values():
+                f.close()
+            self.shards[-1]["rows"] = self._rows
+        self._files = None
+
+    def add_album(self, meta, songs):
+        audio = [song.get("audio_embedding") for song in songs]
+        keep = [i for i, vector in enumerate(audio) if vector is not None]
+        if not keep:
+            return False
+        if self._rows and self._rows + len(keep) > self.shard_rows:
+            self._open_shard()
+
+        self._files["audio"].write(np.asarray([audio[i] for i in keep], dtype=np.float32).tobytes())
+        if self.include_text:
+            text = np.zeros((len(keep), self.dim), dtype=np.float32)
+            mask = np.zeros(len(keep), dtype=np.uint8)
+            for row, i in enumerate(keep):
+                vector = songs[i].get("text_embedding")
+                if vector is not None:
+                    text[row] = vector
+                    mask[row] = 1
+            self._files["text"].write(text.tobytes())
+            self._files["text_mask"].write(mask.tobytes())
+
+        record = dict(meta)
+        record.update({
+            "shard": self._shard_id,
+            "start": self._rows,
+            "stop": self._rows + len(keep),
+            "song_titles": [songs[i].get("song_title") for i in keep]
+        })
+        self._albums.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._rows += len(keep)
+        return True
+
+    def close(self):
+        self._close_shard()
+        self._albums.close()
+        with open(self.directory / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "include_text": self.include_text, "shards": self.shards}, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class EmbeddingShardStore:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / "manifest.json", "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.dim = manifest["dim"]
+        self.include_text = manifest["include_text"]
+        self.shards = manifest["shards"]
+
+    @staticmethod
+    def is_store(path):
+        return Path(path).is_dir() and (Path(path) / "manifest.json").exists()
+
+    def iter_albums(self):
+        with open(self.directory / "albums.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def _open(self, shard, kind, dtype, width):
+        path = self.directory / f"{self.shards[shard]['name']}.{kind}"
+        rows = self.shards[shard]["rows"]
+        shape = (rows, width) if width else (rows,)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def audio(self, shard):
+        return self._open(shard, "audio.f32", np.float32, self.dim)
+
+    def text(self, shard):
+        if not self.include_text:
+            return None, None
+        text = self._open(shard, "text.f32", np.float32, self.dim)
+        return text, self._open(shard, "text_mask.u8", np.uint8, None)
+
+    def iter_chunks(self, max_albums=4096):
+        """
+        Yields (albums, audio, offsets, text, text_mask) for runs of albums that
+        share a shard; the matrices are memmap views covering just those albums.
+        """
+        chunk, shard = [], None
+
+        def flush():
+            start, stop = chunk[0]["start"], chunk[-1]["stop"]
+            offsets = np.array([a["start"] for a in chunk] + [stop], dtype=np.int64) - start
+            audio = self.audio(shard)[start:stop]
+            text, text_mask = self.text(shard)
+            if text is not None:
+                text, text_mask = text[start:stop], text_mask[start:stop].astype(bool)
+            return list(chunk), audio, offsets, text, text_mask
+
+        for album in self.iter_albums():
+            if chunk and (album["shard"] != shard or len(chunk) >= max_albums):
+                yield flush()
+                chunk = []
+            shard = album["shard"]
+            chunk.append(album)
+        if chunk:
+            yield flush()
+
+    @classmethod
+    def from_albums(cls, albums, directory, shard_rows=1_000_000, include_text=False):
+        writer = None
+        for album in albums:
+            songs = album.get("songs") or []
+            first = next((s["audio_embedding"] for s in songs if s.get("audio_embedding") is not None), None)
+            if first is None:
+                continue
+            if writer is None:
+                writer = EmbeddingShardWriter(directory, len(first), shard_rows, include_text)
+            meta = {key: value for key, value in album.items() if key != "songs"}
+            writer.add_album(meta, songs)
+        if writer is None:
+            raise ValueError("No albums with audio embeddings to write.")
+        writer.close()
+        return cls(directory)
+
+
+def main():
+    project_root = Path(__file__).resolve().parents[2]
+    parser = argparse.ArgumentParser(description="Convert a merged dp.json into memory-mapped embedding shards.")
+    parser.add_argument("--source", type=Path, default=project_root / "data" / "processed" / "dp.json")
+    parser.add_argument("--output", type=Path, default=project_root / "data" / "processed" / "dp_shards")
+    parser.add_argument("--shard-rows", type=int, default=1_000_000)
+    parser.add_argument("--text", action="store_true", help="Also store text embeddings.")
+    args = parser.parse_args()
+
+    # Albums are streamed one at a time rather than json.load-ing the whole dump.
+    data_tools = project_root / "data_tools"
+    if str(data_tools) not in sys.path:
+        sys.path.append(str(data_tools))
+    from merge_album_data import iter_json_array
+
+    if args.source.suffix == ".jsonl":
+        with open(args.source, "r", encoding="utf-8") as f:
+            store = EmbeddingShardStore.from_albums((json.loads(line) for line in f if line.strip()), args.output,
+                                                    args.shard_rows, args.text)
+    else:
+        store = EmbeddingShardStore.from_albums(iter_json_array(args.source, wrapped=True), args.output,
+                                                args.shard_rows, args.text)
+    print(f"Wrote {sum(s['rows'] for s in store.shards)} song rows in {len(store.shards)} shards to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
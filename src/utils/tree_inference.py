@@ -0,0 +1,157 @@
+import json
+import tempfile
+from pathlib import Path
+import numpy as np
+
+
+class FlatTreeEnsemble:
+    """
+    Oblivious-tree ensemble flattened into dense numpy arrays.
+
+    Every tree of depth d is stored as d (feature, border) splits plus 2**d leaf
+    values; shallower trees are padded with splits that never fire, so a whole
+    batch is scored with one gather, one comparison and one leaf lookup.
+    Several CatBoost models can share one ensemble: `model_offsets` marks where
+    each model's trees start, and leaf values are pre-multiplied by the model's
+    scale so that a model's prediction is its tree sum plus `model_bias`.
+    """
+
+    def __init__(self, split_features, split_borders, leaf_values, model_offsets, model_bias, nan_fill,
+                 n_features):
+        self.split_features = np.asarray(split_features, dtype=np.int32)
+        # CatBoost compares float32 features against float32 borders; doing the same keeps ties identical.
+        self.split_borders = np.asarray(split_borders, dtype=np.float32)
+        self.leaf_values = np.asarray(leaf_values, dtype=np.float64)
+        self.model_offsets = np.asarray(model_offsets, dtype=np.int64)
+        self.model_bias = np.asarray(model_bias, dtype=np.float64)
+        self.nan_fill = np.asarray(nan_fill, dtype=np.float32)
+        self.n_features = int(n_features)
+        self._powers = (1 << np.arange(self.split_features.shape[1], dtype=np.int64))
+        self._tree_index = np.arange(self.split_features.shape[0])
+
+    @property
+    def n_trees(self):
+        return self.split_features.shape[0]
+
+    @property
+    def n_models(self):
+        return self.model_bias.shape[0]
+
+    @classmethod
+    def from_json(cls, model_json, n_features=None):
+        """
+        `n_features` is the model's input width, which the JSON can understate:
+        it only knows the float features, not trailing columns of other types.
+        """
+        float_features = model_json["features_info"].get("float_features", [])
+        # Splits name a float feature by its index among float features; X is indexed by flat position.
+        flat_index = {f.get("feature_index", i): f.get("flat_feature_index", f.get("feature_index", i))
+                      for i, f in enumerate(float_features)}
+        n_features = max(max(flat_index.values(), default=-1) + 1, n_features or 0)
+
+        nan_fill = np.full(n_features, -np.inf)
+        for i, f in enumerate(float_features):
+            if f.get("nan_value_treatment") == "AsTrue":
+                nan_fill[flat_index[f.get("feature_index", i)]] = np.inf
+
+        trees = model_json["oblivious_trees"]
+        max_depth = max((len(t["splits"]) for t in trees), default=0)
+        split_features = np.zeros((len(trees), max_depth), dtype=np.int32)
+        split_borders = np.full((len(trees), max_depth), np.inf)
+        leaf_values = np.zeros((len(trees), 1 << max_depth))
+
+        for t, tree in enumerate(trees):
+            splits = tree["splits"]
+            for level, split in enumerate(splits):
+                if split.get("split_type", "FloatFeature") != "FloatFeature":
+                    raise ValueError(f"Unsupported split type: {split.get('split_type')}")
+                split_features[t, level] = flat_index[split["float_feature_index"]]
+                split_borders[t, level] = split["border"]
+            values = np.asarray(tree["leaf_values"], dtype=np.float64)
+            if values.size != 1 << len(splits):
+                raise ValueError("Only single-dimension regression trees can be flattened.")
+            leaf_values[t, :values.size] = values
+
+        scale, bias = model_json.get("scale_and_bias", [1.0, 0.0])
+        if isinstance(bias, list):
+            bias = bias[0] if bias else 0.0
+        return cls(split_features, split_borders, leaf_values * scale, [0, len(trees)], [bias], nan_fill,
+                   n_features)
+
+    @classmethod
+    def concatenate(cls, ensembles):
+        depth = max(e.split_features.shape[1] for e in ensembles)
+        n_features = max(e.n_features for e in ensembles)
+        split_features, split_borders, leaf_values = [], [], []
+        for e in ensembles:
+            pad = depth - e.split_features.shape[1]
+            split_features.append(np.pad(e.split_features, ((0, 0), (0, pad))))
+            split_borders.append(np.pad(e.split_borders, ((0, 0), (0, pad)), constant_values=np.inf))
+            leaf_values.append(np.pad(e.leaf_values, ((0, 0), (0, (1 << depth) - e.leaf_values.shape[1]))))
+
+        tree_counts = [0] + [e.n_trees for e in ensembles]
+        nan_fill = np.full(n_features, -np.inf)
+        for e in reversed(ensembles):
+            nan_fill[:e.n_features] = e.nan_fill
+        return cls(
+            np.vstack(split_features), np.vstack(split_borders), np.vstack(leaf_values),
+            np.cumsum(tree_counts), np.concatenate([e.model_bias for e in ensembles]), nan_fill, n_features
+        )
+
+    @classmethod
+    def from_catboost(cls, model):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_path = Path(temp_dir) / "model.json"
+            model.save_model(str(json_path), format="json")
+            with open(json_path, "r", encoding="utf-8") as f:
+                return cls.from_json(json.load(f), n_features=len(model.feature_names_))
+
+    @classmethod
+    def from_catboost_models(cls, models):
+        return cls.concatenate([cls.from_catboost(model) for model in models])
+
+    def save(self, path):
+        np.savez(
+            Path(path),
+            split_features=self.split_features,
+            split_borders=self.split_borders,
+            leaf_values=self.leaf_values,
+            model_offsets=self.model_offsets,
+            model_bias=self.model_bias,
+            nan_fill=self.nan_fill,
+            n_features=np.array(self.n_features)
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(Path(path)) as data:
+            return cls(data["split_features"], data["split_borders"], data["leaf_values"], data["model_offsets"],
+                       data["model_bias"], data["nan_fill"], int(data["n_features"]))
+
+    def _model_sums(self, X):
+        values = X[:, self.split_features]
+        leaf_index = (values > self.split_borders) @ self._powers
+        leaves = self.leaf_values[self._tree_index, leaf_index]
+        return np.add.reduceat(leaves, self.model_offsets[:-1], axis=1) + self.model_bias
+
+    def predict_models(self, X, chunk_size=1024):
+        """Per-model predictions, shape (n_rows, n_models), from a single pass over all trees."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Model expects {self.n_features} features, got {X.shape[1]}.")
+        if np.isnan(X).any():
+            X = np.where(np.isnan(X), self.nan_fill, X)
+
+        out = np.empty((X.shape[0], self.n_models))
+        for start in range(0, X.shape[0], chunk_size):
+            out[start:start + chunk_size] = self._model_sums(X[start:start + chunk_size])
+        return out
+
+    def predict(self, X, chunk_size=1024):
+        return self.predict_models(X, chunk_size).mean(axis=1)
+
+    def predict_with_spread(self, X, chunk_size=1024):
+        per_model = self.predict_models(X, chunk_size)
+        return per_model.mean(axis=1), per_model.std(axis=1)
@@ -0,0 +1,55 @@
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+catboost = pytest.importorskip("catboost")
+
+# Loaded by path: importing the `src` package pulls in torch through the CLAP embedder.
+_spec = importlib.util.spec_from_file_location(
+    "tree_inference", Path(__file__).resolve().parents[1] / "src" / "utils" / "tree_inference.py")
+tree_inference = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(tree_inference)
+FlatTreeEnsemble = tree_inference.FlatTreeEnsemble
+
+
+def _data(n_rows=600, n_features=12, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features))
+    # Only columns 3, 5 and 9 carry signal, so the leading and trailing columns go unused by most splits.
+    y = 2.0 * X[:, 3] - X[:, 5] + np.sin(X[:, 9]) + rng.normal(scale=0.1, size=n_rows)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[:, 0] = 0.0  # constant, so never split on
+    return X, y
+
+
+@pytest.mark.parametrize("nan_mode", ["Min", "Max"])
+def test_flat_ensemble_matches_catboost(nan_mode):
+    X, y = _data()
+    model = catboost.CatBoostRegressor(iterations=60, depth=4, nan_mode=nan_mode, random_seed=0, verbose=0)
+    model.fit(X, y)
+
+    flat = FlatTreeEnsemble.from_catboost(model)
+    assert flat.n_features == X.shape[1]
+    X_test, _ = _data(n_rows=200, seed=1)
+    np.testing.assert_allclose(flat.predict(X_test), model.predict(X_test), rtol=0, atol=1e-9)
+
+
+def test_concatenated_models_match_their_mean():
+    X, y = _data()
+    models = [catboost.CatBoostRegressor(iterations=30, depth=3, random_seed=seed, verbose=0).fit(X, y)
+              for seed in range(3)]
+
+    flat = FlatTreeEnsemble.from_catboost_models(models)
+    expected = np.mean([model.predict(X) for model in models], axis=0)
+    np.testing.assert_allclose(flat.predict(X), expected, rtol=0, atol=1e-9)
+
+
+def test_rejects_wrong_width():
+    X, y = _data(n_rows=100)
+    flat = FlatTreeEnsemble.from_catboost(catboost.CatBoostRegressor(iterations=5, verbose=0).fit(X, y))
+    with pytest.raises(ValueError):
+        flat.predict(X[:, :-1])
+    with pytest.raises(ValueError):
+        flat.predict(np.hstack([X, X[:, :1]]))